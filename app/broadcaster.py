@@ -0,0 +1,146 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+class MJPEGBroadcaster:
+    """Diffuse la dernière image traitée à tous les clients /video_feed.
+
+    Chaque nouvelle image reçoit un numéro de séquence. Elle est encodée en JPEG
+    une seule fois par qualité demandée, au premier client qui la réclame, puis
+    les mêmes octets sont servis à tous les abonnés. Un client lent ne bloque
+    personne : il saute simplement les images qu'il n'a pas eu le temps d'envoyer.
+
+    Côté asyncio, les clients attendent un asyncio.Event réveillé par le thread
+    du pipeline (call_soon_threadsafe) : aucun thread n'est bloqué par viewer.
+
+    Avec un FramePool (`pool`), la publication est en double tampon : le
+    diffuseur retient l'image publiée (front) et celle en cours d'encodage
+    (back), et rend l'ancienne au pool à chaque remplacement, sans copie.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self._cond = threading.Condition()
+        self._encode_lock = threading.Lock()
+        self._latest = (0, None)   # (seq, frame) remplacé d'un bloc
+        self._cache = (0, {})      # (seq, {qualité -> morceau multipart prêt à envoyer})
+        self._closed = False
+        self._loop = None
+        self._frame_event = None
+        self._pending = {}         # (seq, qualité) -> encodage en cours (asyncio)
+        self._encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mjpeg-encode")
+        self.subscribers = 0
+        self.encoded = 0
+
+    def attach_loop(self, loop):
+        """À appeler depuis la boucle asyncio du serveur (startup)."""
+        self._loop = loop
+        self._frame_event = asyncio.Event()
+
+    def publish(self, frame):
+        """Appelé par le pipeline : O(1), aucun encodage ici."""
+        pool = self.pool
+        with self._cond:
+            if pool is not None:
+                pool.retain(frame)
+            previous = self._latest[1]
+            self._latest = (self._latest[0] + 1, frame)
+            self._cond.notify_all()
+        if pool is not None:
+            pool.release(previous)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake_async)
+
+    def _wake_async(self):
+        # Nouvel Event par image : chaque attente ne voit qu'un seul réveil
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._encoder.shutdown(wait=False)
+
+    def wait_for_frame(self, last_seq, timeout=None):
+        """Bloque jusqu'à ce qu'une image plus récente que last_seq existe."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest[0] > last_seq or self._closed, timeout)
+            return self._latest[0] > last_seq
+
+    def _encode_latest(self, quality):
+        with self._encode_lock:
+            # On relit la dernière image : si d'autres sont arrivées entre temps,
+            # on saute directement à la plus récente
+            with self._cond:
+                seq, frame = self._latest
+                if self.pool is not None:
+                    self.pool.retain(frame)  # reste valide même si une image plus récente arrive
+            try:
+                cache_seq, cache = self._cache
+                if seq != cache_seq:
+                    cache = {}
+                    self._cache = (seq, cache)
+                chunk = cache.get(quality)
+                if chunk is None:
+                    flag, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    if not flag:
+                        return seq, None
+                    # join lit le buffer numpy directement (pas de copie tobytes intermédiaire)
+                    chunk = b"".join((b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n', encoded, b'\r\n'))
+                    cache[quality] = chunk
+                    self.encoded += 1
+            finally:
+                if self.pool is not None:
+                    self.pool.release(frame)
+        return seq, chunk
+
+    def next_chunk(self, last_seq, quality, timeout=None):
+        """Version bloquante : (seq, morceau multipart) de la dernière image, ou (last_seq, None)."""
+        if not self.wait_for_frame(last_seq, timeout):
+            return last_seq, None
+        return self._encode_latest(quality)
+
+    async def next_chunk_async(self, last_seq, quality, timeout=1.0):
+        """Version asyncio de next_chunk, l'encodage JPEG part dans un thread dédié."""
+        if self._loop is None:
+            self.attach_loop(asyncio.get_running_loop())
+        if self._latest[0] <= last_seq:
+            try:
+                await asyncio.wait_for(self._frame_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return last_seq, None
+
+        # Chemin rapide : déjà encodée pour cette qualité par un autre client
+        seq = self._latest[0]
+        cache_seq, cache = self._cache
+        if cache_seq == seq and quality in cache:
+            return seq, cache[quality]
+
+        key = (seq, quality)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self._encoder, self._encode_latest, quality)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        # shield : un client qui se déconnecte n'annule pas l'encodage des autres
+        return await asyncio.shield(future)
+
+    def snapshot(self):
+        return {
+            "frames_published": self._latest[0],
+            "frames_encoded": self.encoded,
+            "subscribers": self.subscribers,
+        }
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from app.detections import Detections
+
+# Nombre de bits à 1 pour chaque octet (distance de Hamming vectorisée)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(frame, size=16):
+    """dHash : signe du gradient horizontal sur une vignette (size+1) x size en gris.
+
+    size=16 donne 256 bits (32 octets). Deux images identiques ont le même
+    hash ; une image bruitée ou légèrement différente n'en diffère que de
+    quelques bits.
+    """
+    # Réduction en deux temps : INTER_AREA direct depuis 640x480 coûte ~0.5 ms,
+    # un passage bilinéaire à 8x la vignette d'abord le ramène à ~30 µs
+    coarse = cv2.resize(frame, ((size + 1) * 8, size * 8), interpolation=cv2.INTER_LINEAR)
+    small = cv2.resize(coarse, (size + 1, size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+
+class DetectionCache:
+    """Cache LRU borné : hash perceptuel de l'image -> détections brutes du modèle.
+
+    Les entrées sont liées à l'identité du modèle (empreinte du fichier et
+    résolution d'entrée) et au seuil de score appliqué à la lecture des
+    sorties : si l'un change, tout le cache est vidé avant la recherche
+    suivante. Changer le seuil via /detection-config le vide donc ; changer
+    les classes ou le NMS (appliqués après le cache) ne l'invalide pas.
+    `tolerance` est la distance de Hamming maximale (en bits, sur 256) pour
+    réutiliser le résultat d'une image voisine ; 0 = images identiques seulement.
+    """
+
+    def __init__(self, capacity=256, tolerance=0, hash_size=16):
+        self.capacity = max(1, int(capacity))
+        self.tolerance = int(tolerance)
+        self.hash_size = hash_size
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # hash -> Detections, du moins au plus récemment utilisé
+        self._model_id = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def lookup(self, model_id, frame):
+        """Retourne (clé, Detections ou None). La clé sert ensuite à store()."""
+        start = time.perf_counter()
+        key = perceptual_hash(frame, self.hash_size)
+        with self._lock:
+            if model_id != self._model_id:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._model_id = model_id
+            detections = self._entries.get(key)
+            if detections is None and self.tolerance > 0 and self._entries:
+                key_hit = self._nearest(key)
+                if key_hit is not None:
+                    detections = self._entries[key_hit]
+                    key = key_hit
+                    self.near_hits += 1
+            if detections is None:
+                self.misses += 1
+                return key, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Même tableaux, mais la latence est celle de la recherche
+        return key, Detections(detections.boxes, detections.classes, detections.scores,
+                               (time.perf_counter() - start) * 1000)
+
+    def _nearest(self, key):
+        keys = list(self._entries)
+        stored = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), -1)
+        distances = _POPCOUNT[stored ^ np.frombuffer(key, dtype=np.uint8)].sum(axis=1, dtype=np.int32)
+        best = int(distances.argmin())
+        return keys[best] if distances[best] <= self.tolerance else None
+
+    def store(self, model_id, key, detections):
+        with self._lock:
+            if model_id != self._model_id:
+                return
+            self._entries[key] = detections
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def detect(self, detector, frame, run=None, score_threshold=None):
+        """detector.detect(frame, seuil) (ou run(detector, frame, seuil)) en passant par le cache.
+
+        Les détections mémorisées dépendent du seuil : il fait partie de
+        l'identifiant du modèle, le changer vide le cache.
+        """
+        model_id = (detector.model_id, score_threshold)
+        key, detections = self.lookup(model_id, frame)
+        if detections is None:
+            if run is not None:
+                detections = run(detector, frame, score_threshold)
+            else:
+                detections = detector.detect(frame, score_threshold)
+            self.store(model_id, key, detections)
+        return detections
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "entries": len(entries),
+            "capacity": self.capacity,
+            "tolerance_bits": self.tolerance,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "bytes": sum(d.boxes.nbytes + d.classes.nbytes + d.scores.nbytes for d in entries)
+                     + len(entries) * self.hash_size * self.hash_size // 8,
+        }
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.profiling import TRACER
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# Réduction au décodage JPEG (mise à l'échelle DCT de libjpeg) : facteur -> flag
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def _fit_width(frame, max_width, out=None):
+    """Réduit l'image à max_width pixels de large (ratio conservé), sinon la rend telle quelle.
+
+    Avec `out` (case du pool) de la bonne taille, le résultat y est écrit.
+    """
+    h, w = frame.shape[:2]
+    if not max_width or w <= max_width:
+        return _into(frame, out)
+    size = (max_width, max(1, round(h * max_width / w)))
+    if out is not None and out.shape == (size[1], size[0]) + frame.shape[2:]:
+        return cv2.resize(frame, size, dst=out, interpolation=cv2.INTER_AREA)
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def _into(frame, out):
+    """Copie dans `out` si les formes concordent, sinon l'image telle quelle."""
+    if out is None or out is frame or out.shape != frame.shape:
+        return frame
+    np.copyto(out, frame)
+    return out
+
+
+class VideoSource:
+    """Fichier vidéo, webcam (index) ou flux réseau (rtsp://, http://) via cv2.VideoCapture.
+
+    - webcam : la résolution est demandée au pilote (réduction à la capture) ;
+    - fichier / réseau : décodage matériel demandé au backend FFmpeg quand
+      OpenCV le propose, puis réduction cv2 dans le thread de décodage ;
+    - fin de fichier : le lecteur est rouvert (pas de seek CAP_PROP_POS_FRAMES) ;
+    - flux réseau coupé : reconnexion avec une attente croissante.
+    """
+
+    def __init__(self, source, max_width=0, hw_acceleration=True):
+        self.source = source
+        self.max_width = max_width
+        self.hw_acceleration = hw_acceleration
+        self.live = isinstance(source, int) or "://" in str(source)
+        self.kind = "camera" if isinstance(source, int) else ("stream" if self.live else "file")
+        self.downscale = "none"
+        self.hw_active = False
+        self._failures = 0
+        self._decoded = None  # tampon de décodage avant réduction (mode pool)
+        self._cap = self._open()
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 0.0
+
+    def _open(self):
+        if self.kind == "stream" and str(self.source).startswith("rtsp"):
+            # RTSP sur TCP par défaut : pas de perte de paquets sur réseau chargé
+            os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+        hw_prop = getattr(cv2, "CAP_PROP_HW_ACCELERATION", None)
+        if self.kind != "camera" and self.hw_acceleration and hw_prop is not None:
+            cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG, [hw_prop, cv2.VIDEO_ACCELERATION_ANY])
+            if not cap.isOpened():
+                cap = cv2.VideoCapture(self.source)
+            self.hw_active = bool(cap.get(hw_prop)) if cap.isOpened() else False
+        else:
+            cap = cv2.VideoCapture(self.source)
+        if self.kind == "camera" and self.max_width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.max_width)
+            self.downscale = "capture"
+        return cap
+
+    @property
+    def backend(self):
+        try:
+            return self._cap.getBackendName()
+        except cv2.error:
+            return None
+
+    def read(self, out=None):
+        """Image suivante ; avec `out` (case du pool), décodée ou réduite directement dedans."""
+        # Réduction : décodage dans un tampon réutilisé, puis resize dans `out`
+        target = self._decoded if self.downscale == "resize" else out
+        ret, frame = self._read(target)
+        if not ret:
+            self._cap.release()
+            if self.live:
+                self._failures += 1
+                time.sleep(min(5.0, 0.1 * 2 ** self._failures))
+            self._cap = self._open()
+            ret, frame = self._read(target)
+            if not ret:
+                return None
+        self._failures = 0
+        if self.max_width and frame.shape[1] > self.max_width:
+            self.downscale = "resize"
+            if out is not None:
+                self._decoded = frame
+            frame = _fit_width(frame, self.max_width, out)
+        return frame
+
+    def _read(self, target):
+        if target is None:
+            return self._cap.read()
+        # cv2 réutilise `target` si la taille concorde, sinon alloue une nouvelle image
+        return self._cap.read(target)
+
+    def release(self):
+        self._cap.release()
+
+
+class ImageDirectorySource:
+    """Dossier d'images (ex. data/calibration) rejoué en boucle à `fps` images/s.
+
+    Les JPEG sont réduits pendant le décodage (IMREAD_REDUCED_COLOR_2/4/8) :
+    libjpeg saute une partie de l'IDCT au lieu de décoder puis redimensionner.
+    """
+
+    kind = "images"
+    live = False
+    backend = "imread"
+
+    def __init__(self, path, fps=10.0, max_width=0):
+        self.paths = sorted(str(p) for p in Path(path).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not self.paths:
+            raise FileNotFoundError(f"Aucune image dans {path}")
+        self.fps = fps
+        self.max_width = max_width
+        self.downscale = "none"
+        self._flag = cv2.IMREAD_COLOR
+        self._index = 0
+        first = cv2.imread(self.paths[0])
+        if max_width and first is not None and first.shape[1] > max_width:
+            self.downscale = "resize"
+            for factor, flag in REDUCED_FLAGS:
+                if first.shape[1] // factor >= max_width:
+                    self._flag, self.downscale = flag, f"decode/{factor}"
+                    break
+
+    def read(self, out=None):
+        path = self.paths[self._index % len(self.paths)]
+        self._index += 1
+        frame = cv2.imread(path, self._flag)
+        if frame is None:
+            return None
+        return _fit_width(frame, self.max_width, out)
+
+    def release(self):
+        pass
+
+
+class MemmapSource:
+    """Images pré-décodées dans un np.memmap (N, H, W, 3) : boucle sans décodage ni seek.
+
+    Pour les démos et tests sur un court fichier : le clip est décodé une
+    fois dans `cache_dir` (réutilisé tant que le fichier ne change pas), puis
+    chaque lecture n'est qu'une copie depuis la mémoire mappée. La copie est
+    nécessaire : le pipeline dessine sur l'image reçue.
+    """
+
+    kind = "memmap"
+    live = False
+    backend = "memmap"
+
+    def __init__(self, data_path, meta):
+        self.path = str(data_path)
+        self.fps = meta["fps"]
+        self.downscale = meta["downscale"]
+        self.frames = np.memmap(self.path, dtype=np.uint8, mode="r", shape=tuple(meta["shape"]))
+        self._index = 0
+
+    @classmethod
+    def build(cls, source, cache_dir, max_bytes, max_width=0):
+        """Retourne un MemmapSource, ou None si la vidéo dépasse max_bytes une fois décodée."""
+        stat = os.stat(source)
+        key = hashlib.sha1(f"{os.path.abspath(source)}|{stat.st_size}|{stat.st_mtime_ns}|{max_width}"
+                           .encode()).hexdigest()[:16]
+        cache_dir = Path(cache_dir)
+        data_path, meta_path = cache_dir / f"{key}.frames", cache_dir / f"{key}.json"
+        if data_path.exists() and meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            return cls(data_path, meta) if data_path.stat().st_size <= max_bytes else None
+
+        cap = cv2.VideoCapture(source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frames, total, downscale = [], 0, "none"
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if max_width and frame.shape[1] > max_width:
+                frame, downscale = _fit_width(frame, max_width), "resize"
+            total += frame.nbytes
+            if total > max_bytes:
+                cap.release()
+                return None
+            frames.append(frame)
+        cap.release()
+        if not frames:
+            return None
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        meta = {"source": str(source), "shape": [len(frames), *frames[0].shape], "fps": fps,
+                "downscale": downscale}
+        tmp_path = data_path.with_suffix(".tmp")
+        mapped = np.memmap(tmp_path, dtype=np.uint8, mode="w+", shape=tuple(meta["shape"]))
+        for i, frame in enumerate(frames):
+            mapped[i] = frame
+        mapped.flush()
+        del mapped
+        os.replace(tmp_path, data_path)  # jamais de cache à moitié écrit
+        meta_path.write_text(json.dumps(meta))
+        return cls(data_path, meta)
+
+    def read(self, out=None):
+        frame = self.frames[self._index % len(self.frames)]
+        self._index += 1
+        if out is not None and out.shape == frame.shape:
+            np.copyto(out, frame)
+            return out
+        return np.array(frame)
+
+    def release(self):
+        self.frames = None
+
+
+def open_source(source, max_width=0, image_fps=10.0, predecode=False,
+                cache_dir="/tmp/edge-frames", cache_mb=256, hw_acceleration=True):
+    """Choisit le lecteur adapté : webcam, flux réseau, dossier d'images, fichier (pré-décodé ou non)."""
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageDirectorySource(source, image_fps, max_width)
+    if predecode and isinstance(source, str) and os.path.isfile(source):
+        cached = MemmapSource.build(source, cache_dir, cache_mb * 1024 * 1024, max_width)
+        if cached is not None:
+            return cached
+        print(f"⚠️ {source} trop long pour le cache de {cache_mb} Mo, décodage classique")
+    return VideoSource(source, max_width, hw_acceleration)
+
+
+class Capture:
+    """Thread de décodage d'une source : lit, mesure, cadence, puis passe l'image à `emit`.
+
+    `emit` est typiquement le put d'un RingBuffer (file de préchargement) :
+    le thread consommateur ne touche jamais au décodeur. Les sources locales
+    (fichier, dossier, memmap) sont rejouées à leur cadence native en mode
+    realtime ; les sources live (webcam, réseau) imposent déjà la leur.
+    """
+
+    def __init__(self, source, emit, stats, realtime=True, name="capture", pool=None, **options):
+        self.source = source
+        self.emit = emit
+        self.stats = stats   # StageStats : coût de décodage par image
+        self.realtime = realtime
+        self.name = name
+        self.pool = pool     # FramePool optionnel : décodage dans des cases réutilisées
+        self.options = options  # arguments de open_source
+        self.reader = None
+        self.errors = 0
+        self.skipped = 0     # images non lues faute de case libre dans le pool
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _loop(self):
+        # Ouverture dans le thread : une caméra réseau lente ne bloque pas le démarrage
+        try:
+            reader = self.reader = open_source(self.source, **self.options)
+        except Exception as e:
+            print(f"❌ [{self.name}] Source illisible {self.source} : {e}")
+            return
+        print(f"🎥 [{self.name}] Démarrage du flux vidéo : {self.source} ({reader.kind})")
+        fps = reader.fps if (self.realtime and not reader.live) else 0.0
+        frame_interval = 1.0 / fps if fps > 0 else 0.0
+        next_deadline = time.perf_counter()
+
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            # N° de lecture réussie : le frame_id de VisionPipeline (pas le n° de batch en multiflux)
+            TRACER.frame(self.stats.frames + 1)
+            pool = self.pool
+            buffer = pool.acquire() if pool is not None else None
+            if pool is not None and buffer is None and pool.shape is not None:
+                # Toutes les cases sont prises en aval : on saute l'image, comme une file pleine
+                self.skipped += 1
+                self._stop.wait(0.005)
+                continue
+            with TRACER.span("decode"):
+                frame = reader.read(buffer)
+            if frame is None:
+                if pool is not None:
+                    pool.release(buffer)
+                self.errors += 1
+                self._stop.wait(0.1)
+                continue
+            if pool is not None and frame is not buffer:
+                # Première image ou nouvelle résolution : elle devient une case du pool
+                pool.release(buffer)
+                frame = pool.adopt(frame)
+            self.stats.add((time.perf_counter() - start) * 1000)
+            self.emit(frame)
+
+            # Cadence native du fichier : sans ça le décodage tournerait à vide
+            # et volerait le CPU de l'inférence sur un conteneur à 0.5 CPU.
+            if frame_interval:
+                next_deadline = max(next_deadline + frame_interval, time.perf_counter() - frame_interval)
+                delay = next_deadline - time.perf_counter()
+                if delay > 0:
+                    self._stop.wait(delay)
+
+        reader.release()
+        print(f"🛑 [{self.name}] Arrêt du flux vidéo.")
+
+    def snapshot(self):
+        reader = self.reader
+        if reader is None:
+            return {"source": str(self.source), "open": False}
+        return {
+            "source": str(self.source),
+            "open": True,
+            "kind": reader.kind,
+            "backend": reader.backend,
+            "downscale": reader.downscale,
+            "hw_acceleration": getattr(reader, "hw_active", False),
+            "source_fps": round(reader.fps, 2),
+            "read_errors": self.errors,
+            **({"pool": self.pool.snapshot(), "pool_skipped": self.skipped} if self.pool is not None else {}),
+        }
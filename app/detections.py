@@ -0,0 +1,151 @@
+import numpy as np
+import cv2
+
+
+class Detections:
+    """Détections d'une image, en structure de tableaux NumPy.
+
+    boxes   : (N, 4) float32, coordonnées normalisées [ymin, xmin, ymax, xmax]
+    classes : (N,) int32
+    scores  : (N,) float32
+    Toutes les opérations (seuil, filtre de classe, NMS, passage en pixels)
+    sont vectorisées : aucune boucle Python par détection.
+    """
+
+    __slots__ = ("boxes", "classes", "scores", "latency_ms")
+
+    def __init__(self, boxes, classes, scores, latency_ms=0.0):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.classes = np.asarray(classes).astype(np.int32, copy=False).reshape(-1)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.latency_ms = latency_ms
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _take(self, index):
+        return Detections(self.boxes[index], self.classes[index], self.scores[index], self.latency_ms)
+
+    def filter(self, score_threshold=0.0, classes=None):
+        """Garde les détections au-dessus du seuil (et des classes demandées)."""
+        mask = self.scores > score_threshold
+        if classes is not None:
+            mask &= np.isin(self.classes, list(classes))
+        return self._take(mask)
+
+    def nms(self, iou_threshold=0.5, class_aware=True):
+        """Non-Maximum Suppression glouton, vectorisé sur les boîtes restantes."""
+        if len(self) < 2:
+            return self
+        boxes = self.boxes
+        if class_aware:
+            # Décale chaque classe dans sa propre zone : deux classes ne se recouvrent jamais
+            boxes = boxes + (self.classes.astype(np.float32) * 2.0)[:, None]
+        y1, x1, y2, x2 = boxes.T
+        areas = np.maximum(y2 - y1, 0) * np.maximum(x2 - x1, 0)
+
+        order = np.argsort(-self.scores, kind="stable")
+        keep = []
+        while order.size:
+            i, rest = order[0], order[1:]
+            keep.append(i)
+            inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+            inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+            inter = inter_h * inter_w
+            iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+            order = rest[iou <= iou_threshold]
+        return self._take(np.array(keep, dtype=np.intp))
+
+    def to_pixels(self, width, height):
+        """Boîtes en pixels (N, 4) int32 au format [x1, y1, x2, y2]."""
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        return (self.boxes[:, [1, 0, 3, 2]] * scale).astype(np.int32)
+
+
+class DetectionFilter:
+    """Réglages de post-traitement modifiables à chaud (via /detection-config).
+
+    Objet immuable : pour changer un réglage on en construit un nouveau et on
+    remplace la référence, le pipeline lit toujours une configuration cohérente.
+    """
+
+    def __init__(self, score_threshold=0.10, classes=None, nms_iou=None):
+        self.score_threshold = float(score_threshold)
+        self.classes = frozenset(int(c) for c in classes) if classes else None
+        self.nms_iou = float(nms_iou) if nms_iou else None
+
+    def apply(self, detections):
+        detections = detections.filter(self.score_threshold, self.classes)
+        if self.nms_iou is not None:
+            detections = detections.nms(self.nms_iou)
+        return detections
+
+    def to_dict(self):
+        return {
+            "score_threshold": self.score_threshold,
+            "classes": sorted(self.classes) if self.classes is not None else None,
+            "nms_iou": self.nms_iou,
+        }
+
+
+class Annotator:
+    """Dessine un lot de détections sur une image.
+
+    Tous les rectangles partent en un seul appel cv2.polylines. Les étiquettes
+    "ID x (yy%)" sont rendues une fois en masque puis recollées depuis le cache,
+    au lieu d'un f-string + cv2.putText par détection et par image.
+    """
+
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+    def __init__(self, box_color=(0, 255, 0), text_color=(0, 0, 255),
+                 font_scale=0.5, thickness=2, max_cached_labels=1024):
+        self.box_color = box_color
+        self.text_color = np.array(text_color, dtype=np.uint8)
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.max_cached_labels = max_cached_labels
+        self._labels = {}
+
+    def _label(self, class_id, score_pct):
+        key = (class_id, score_pct)
+        glyph = self._labels.get(key)
+        if glyph is None:
+            text = f"ID {class_id} ({score_pct}%)"
+            (w, h), baseline = cv2.getTextSize(text, self.FONT, self.font_scale, self.thickness)
+            pad = self.thickness
+            canvas = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+            cv2.putText(canvas, text, (pad, h + pad), self.FONT, self.font_scale, 255, self.thickness)
+            # (masque, décalage du coin haut-gauche par rapport à l'origine du texte)
+            glyph = (canvas > 0, (-pad, -(h + pad)))
+            if len(self._labels) >= self.max_cached_labels:
+                self._labels.clear()
+            self._labels[key] = glyph
+        return glyph
+
+    def draw(self, frame, detections):
+        """Dessine toutes les détections, retourne leur nombre."""
+        n = len(detections)
+        if n == 0:
+            return 0
+        h, w = frame.shape[:2]
+        pixels = detections.to_pixels(w, h)
+        x1, y1, x2, y2 = pixels.T
+        corners = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                            np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1)
+        cv2.polylines(frame, list(corners), True, self.box_color, self.thickness)
+
+        score_pcts = np.rint(detections.scores * 100).astype(np.int32)
+        for class_id, score_pct, x, y in zip(detections.classes.tolist(), score_pcts.tolist(),
+                                              x1.tolist(), y1.tolist()):
+            mask, (dx, dy) = self._label(class_id, score_pct)
+            # Même position que l'ancien cv2.putText(..., (x1, y1 - 10))
+            top, left = y - 10 + dy, x + dx
+            mh, mw = mask.shape
+            t, l = max(top, 0), max(left, 0)
+            b, r = min(top + mh, h), min(left + mw, w)
+            if t >= b or l >= r:
+                continue
+            region = frame[t:b, l:r]
+            region[mask[t - top:b - top, l - left:r - left]] = self.text_color
+        return n
@@ -2,24 +2,126 @@ import cv2
 import numpy as np
 import time
 import os
+import hashlib
+import mmap
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from app.detections import Detections
+from app.profiling import TRACER
+
+_tflite = None
+QUANTIZED_DTYPES = (np.uint8, np.int8)
+
+
+def tflite_module():
+    """Module de l'interpréteur TFLite, importé au premier modèle chargé.
+
+    tflite_runtime (image edge, quelques Mo), sinon ai_edge_litert, sinon
+    tensorflow.lite : ce dernier coûte plusieurs secondes et des centaines de
+    Mo de RSS, il ne sert que sur un poste de développement.
+    """
+    global _tflite
+    if _tflite is None:
+        try:
+            import tflite_runtime.interpreter as module
+        except ImportError:
+            try:
+                from ai_edge_litert import interpreter as module
+            except ImportError:
+                import tensorflow.lite as module
+        _tflite = module
+    return _tflite
+
+
+def model_digest(path):
+    """SHA-256 du fichier modèle, lu via mmap (aucune copie en mémoire Python)."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def input_quantization_table(detail):
+    """Entier du tenseur d'entrée pour chaque valeur de pixel 0-255 (None si entrée float).
+
+    Le modèle float attend pixel / 255 : un modèle quantifié attend donc
+    round(pixel / 255 / scale) + zero_point, une valeur fixe par pixel.
+    Sans paramètres de quantification : pixels bruts (uint8), décalés de
+    -128 (int8).
+    """
+    dtype = np.dtype(detail['dtype'])
+    if dtype not in QUANTIZED_DTYPES:
+        return None
+    scale, zero_point = detail['quantization']
+    if not scale:
+        scale, zero_point = 1 / 255.0, (0 if dtype == np.uint8 else -128)
+    info = np.iinfo(dtype)
+    return np.clip(np.round(np.arange(256) / 255.0 / scale) + zero_point, info.min, info.max).astype(dtype)
+
+
+def dequantization_table(detail, default_scale=1 / 255.0, clip=False, rint=False):
+    """Valeur réelle (q - zero_point) x scale de chaque octet d'une sortie 8 bits (None si float).
+
+    Indexée par l'octet brut (vue uint8), int8 compris : table.take(raw.view(np.uint8)).
+    Retourne aussi les valeurs dans l'ordre des entiers (croissant), pour
+    convertir un seuil en entier.
+    """
+    dtype = np.dtype(detail['dtype'])
+    if dtype not in QUANTIZED_DTYPES:
+        return None
+    scale, zero_point = detail['quantization']
+    if not scale:
+        scale, zero_point = default_scale, 0  # ancienne convention : octet / 255
+    info = np.iinfo(dtype)
+    values = np.arange(info.min, info.max + 1)
+    real = (values - zero_point) * scale
+    if rint:
+        real = np.rint(real)  # n° de classe : 2.98 -> 3, pas 2
+    if clip:
+        real = np.clip(real, 0, 1)
+    levels = real.astype(np.float32)
+    table = np.empty(256, dtype=np.float32)
+    table[values.astype(dtype).view(np.uint8)] = levels
+    return table, levels, int(info.min)
 
-try:
-    import tflite_runtime.interpreter as tflite
-except ImportError:
-    import tensorflow.lite as tflite
 
 class EdgeDetector:
-    def __init__(self, model_path):
+    def __init__(self, model_path, batch_size=1, num_threads=None, pool_size=1, model_id=None,
+                 input_size=None):
         print(f"Chargement du modèle : {model_path}")
-        self.interpreter = tflite.Interpreter(model_path=model_path)
-        self.interpreter.allocate_tensors()
+        # TFLite mappe lui-même le fichier (model_path) : tous les interpréteurs
+        # du pool, et tous les détecteurs du même fichier, partagent les mêmes
+        # pages du cache disque au lieu d'une copie bytes chacun
+        self.model_path = model_path
+        digest = model_id or model_digest(model_path)[:16]
+        self.num_threads = num_threads
+        self.interpreters = [self._build_interpreter() for _ in range(max(1, pool_size))]
+        self.interpreter = self.interpreters[0]
+        self._free = queue.Queue()
+        for interpreter in self.interpreters:
+            self._free.put(interpreter)
+        self._executor = None
+        # Latence de la première vraie image (remise à None après préchauffage)
+        self.first_frame_ms = None
+
+        if input_size is not None:
+            self._resize_input(input_size)
+
+        self.batch_size = 1
+        if batch_size > 1:
+            self._try_resize_batch(batch_size)
 
         self.input_details = self.interpreter.get_input_details()
         self.output_details = self.interpreter.get_output_details()
         
         self.input_height = self.input_details[0]['shape'][1]
         self.input_width = self.input_details[0]['shape'][2]
-        self.is_quantized = (self.input_details[0]['dtype'] == np.uint8)
+        # Identité du modèle (contenu, pas chemin) et de sa résolution d'entrée :
+        # clé du cache de détections, model_int8 et model_int8@64x64 ne la partagent pas
+        self.model_id = f"{digest}@{self.input_height}x{self.input_width}"
+        if self.batch_size > 1:
+            self.model_id += f"/{self.batch_size}"
 
         # Mapping automatique
         self.boxes_idx, self.classes_idx, self.scores_idx = -1, -1, -1
@@ -30,8 +132,9 @@ class EdgeDetector:
                 if 'score' in detail['name'].lower(): self.scores_idx = i
                 elif 'class' in detail['name'].lower(): self.classes_idx = i
         
-        # Fallback
-        if self.boxes_idx == -1:
+        # Fallback (aussi quand seuls classes / scores n'ont pas de nom parlant,
+        # sinon l'index -1 pointerait silencieusement sur la dernière sortie)
+        if -1 in (self.boxes_idx, self.classes_idx, self.scores_idx):
             sorted_outputs = sorted(self.output_details, key=lambda x: x['index'])
             for det in sorted_outputs:
                 if len(det['shape']) == 3 and det['shape'][-1] == 4:
@@ -40,40 +143,283 @@ class EdgeDetector:
             if len(leftover) >= 2:
                 self.classes_idx, self.scores_idx = leftover[0], leftover[1]
 
-    def predict(self, image):
-        start_time = time.time()
-        img_resized = cv2.resize(image, (self.input_width, self.input_height))
-        
-        if self.is_quantized:
-            # Mode Int8 : On garde 0-255
-            input_data = np.expand_dims(img_resized, axis=0).astype(np.uint8)
-        else:
-            # Mode Float32 : IL FAUT NORMALISER !
-            # MobileNet attend souvent des valeurs entre -1 et 1
-            input_data = np.expand_dims(img_resized, axis=0).astype(np.float32)
-            input_data = input_data / 255.0  # <--- Juste diviser par 255
+        self._prepare_quantization()
+        self._prepare_buffers()
+
+    @property
+    def pool_size(self):
+        return len(self.interpreters)
+
+    def _build_interpreter(self):
+        interpreter = tflite_module().Interpreter(model_path=self.model_path,
+                                         num_threads=self.num_threads)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    @contextmanager
+    def _acquire(self):
+        """Emprunte un interpréteur libre du pool (bloque si tous sont occupés)."""
+        interpreter = self._free.get()
+        try:
+            yield interpreter
+        finally:
+            self._free.put(interpreter)
+
+    def _resize_input(self, input_size):
+        """Change la résolution d'entrée en (H, W) si le modèle l'accepte, sinon ValueError.
+
+        Un invoke à blanc vérifie que le graphe s'exécute ; pour un SSD dont les
+        ancres sont figées, c'est à l'appelant de valider la qualité obtenue.
+        """
+        detail = self.interpreter.get_input_details()[0]
+        shape = [int(detail['shape'][0]), int(input_size[0]), int(input_size[1]), int(detail['shape'][3])]
+        try:
+            for interpreter in self.interpreters:
+                interpreter.resize_tensor_input(detail['index'], shape)
+                interpreter.allocate_tensors()
+                interpreter.invoke()
+        except Exception as e:
+            raise ValueError(f"Résolution {input_size[0]}x{input_size[1]} non supportée : {e}")
+
+    def _try_resize_batch(self, batch_size):
+        """Redimensionne l'entrée en [batch_size, H, W, C] si le modèle l'accepte.
+
+        Beaucoup de modèles SSD (post-processing figé) refusent un batch > 1 :
+        dans ce cas on revient au batch 1 et l'appelant fait du round-robin.
+        """
+        input_index = self.interpreter.get_input_details()[0]['index']
+        shape = list(self.interpreter.get_input_details()[0]['shape'])
+        try:
+            for interpreter in self.interpreters:
+                interpreter.resize_tensor_input(input_index, [batch_size] + shape[1:])
+                interpreter.allocate_tensors()
+                # Un invoke à blanc : certains modèles n'échouent qu'à l'exécution
+                interpreter.invoke()
+                out_shape = interpreter.get_output_details()[0]['shape']
+                if out_shape[0] != batch_size:
+                    raise ValueError(f"sortie de batch {out_shape[0]}")
+            self.batch_size = batch_size
+            print(f"✅ Entrée redimensionnée en batch {batch_size}")
+        except Exception as e:
+            print(f"⚠️ Batch {batch_size} non supporté ({e}), retour au batch 1")
+            for interpreter in self.interpreters:
+                interpreter.resize_tensor_input(input_index, shape)
+                interpreter.allocate_tensors()
+            self.batch_size = 1
 
-        self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
-        self.interpreter.invoke()
+    def _prepare_quantization(self):
+        """Tables précalculées depuis les paramètres (scale, zero_point) des tenseurs.
 
-        raw_boxes = self.interpreter.get_tensor(self.output_details[self.boxes_idx]['index'])
-        raw_classes = self.interpreter.get_tensor(self.output_details[self.classes_idx]['index'])
-        raw_scores = self.interpreter.get_tensor(self.output_details[self.scores_idx]['index'])
+        Entrée int8 / uint8 : la table pixel -> entier (input_quantization_table)
+        se réduit presque toujours à un décalage d'octet (identité en uint8,
+        +128 modulo 256 en int8 avec zero_point -128) : cv2.resize écrit dans
+        le tenseur et un np.add uint8 en place suffit. Sinon, cv2.LUT.
+        Sorties entières : une table de 256 flottants par tenseur ; le seuil de
+        score est converti une fois en entier (_score_cut), seules les
+        détections qui le passent sont déquantifiées.
+        """
+        lut = input_quantization_table(self.input_details[0])
+        self.is_quantized = lut is not None
+        self._input_lut = None
+        self._input_offset = 0
+        if lut is not None:
+            offsets = (lut.view(np.uint8).astype(np.int16) - np.arange(256)) % 256
+            if np.all(offsets == offsets[0]):
+                self._input_offset = np.uint8(offsets[0])
+            else:
+                self._input_lut = lut
+        self._output_tables = {
+            self.boxes_idx: dequantization_table(self.output_details[self.boxes_idx], clip=True),
+            self.classes_idx: dequantization_table(self.output_details[self.classes_idx], 1.0, rint=True),
+            self.scores_idx: dequantization_table(self.output_details[self.scores_idx]),
+        }
+        self._score_cuts = {}  # seuil -> plus petit entier de score au-dessus du seuil
 
-        # Normalisation
-        if raw_scores.dtype == np.uint8: scores = raw_scores.astype(np.float32) / 255.0
-        else: scores = raw_scores.astype(np.float32)
+    def _score_cut(self, score_threshold):
+        cut = self._score_cuts.get(score_threshold)
+        if cut is None:
+            _, levels, first = self._output_tables[self.scores_idx]
+            # Même comparaison que Detections.filter : score float32 > seuil float32
+            cut = first + int(np.searchsorted(levels, np.float32(score_threshold), side="right"))
+            if len(self._score_cuts) > 64:
+                self._score_cuts.clear()
+            self._score_cuts[score_threshold] = cut
+        return cut
 
-        if raw_boxes.dtype == np.uint8: boxes = raw_boxes.astype(np.float32) / 255.0
-        else: boxes = raw_boxes.astype(np.float32)
+    def _prepare_buffers(self):
+        """Buffers préalloués une fois pour toutes, un jeu par interpréteur du pool."""
+        self._scratch = {
+            interpreter: np.empty((self.input_height, self.input_width, 3), dtype=np.uint8)
+            for interpreter in self.interpreters
+        }
 
-        classes = raw_classes.astype(np.float32)
+    def _fill_input(self, interpreter, images):
+        """Redimensionne chaque image directement dans le tenseur d'entrée (zéro copie).
 
-        # Flatten
-        scores = scores.flatten()
-        classes = classes.flatten()
-        boxes = np.squeeze(boxes)
-        boxes = np.clip(boxes, 0, 1)
+        Une image déjà à la taille d'entrée (ProcessDetector la redimensionne
+        dans la mémoire partagée) est copiée telle quelle, sans second cv2.resize.
+
+        interpreter.tensor() donne une vue numpy sur la mémoire de l'interpréteur :
+        pas de expand_dims / astype / set_tensor, donc aucune allocation par image.
+        """
+        size = (self.input_width, self.input_height)
+        input_tensor = interpreter.tensor(self.input_details[0]['index'])()
+        for slot, image in enumerate(images):
+            # Image déjà à la taille d'entrée (mémoire partagée des workers) : pas de second resize
+            resized = image.shape[:2] == (self.input_height, self.input_width)
+            if self._input_lut is not None:
+                # Quantification quelconque : table pixel -> entier, sans calcul flottant
+                source = image
+                if not resized:
+                    source = self._scratch[interpreter]
+                    with TRACER.span("resize"):
+                        cv2.resize(image, size, dst=source)
+                with TRACER.span("quantize"):
+                    cv2.LUT(source, self._input_lut, dst=input_tensor[slot])
+            elif self.is_quantized:
+                # Mode Int8 : cv2 écrit directement dans les octets du tenseur
+                target = input_tensor[slot].view(np.uint8)
+                with TRACER.span("resize"):
+                    if resized:
+                        np.copyto(target, image)
+                    else:
+                        cv2.resize(image, size, dst=target)
+                if self._input_offset:
+                    with TRACER.span("quantize"):
+                        np.add(target, self._input_offset, out=target)  # modulo 256 : int8 = pixel - 128
+            else:
+                # Mode Float32 : IL FAUT NORMALISER ! (/ 255 écrit en place dans le tenseur)
+                source, target = image, input_tensor[slot]
+                if not resized:
+                    source = self._scratch[interpreter]
+                    with TRACER.span("resize"):
+                        cv2.resize(image, size, dst=source)
+                with TRACER.span("normalize"):
+                    np.copyto(target, source, casting="unsafe")
+                    target /= 255.0  # <--- Juste diviser par 255
+        # Aucune vue ne doit survivre jusqu'à invoke()
+        del input_tensor
+
+    def _read_outputs(self, interpreter, count=1, score_threshold=None):
+        """Lit les sorties via des vues (pas de copie get_tensor), une entrée par image du batch.
+
+        Seuls les résultats déquantifiés sont alloués : ils quittent le détecteur
+        et ne doivent pas être écrasés par l'image suivante. Avec un seuil, les
+        scores sont comparés dans leur domaine (entier pour un modèle quantifié)
+        et seules les détections retenues sont converties.
+        """
+        raw_boxes = interpreter.tensor(self.output_details[self.boxes_idx]['index'])()
+        raw_classes = interpreter.tensor(self.output_details[self.classes_idx]['index'])()
+        raw_scores = interpreter.tensor(self.output_details[self.scores_idx]['index'])()
+
+        results = []
+        for slot in range(count):
+            boxes = raw_boxes[slot].reshape(-1, 4)
+            classes = raw_classes[slot].reshape(-1)
+            scores = raw_scores[slot].reshape(-1)
+            if score_threshold is not None:
+                if self._output_tables[self.scores_idx] is None:
+                    keep = scores > score_threshold
+                else:
+                    keep = scores >= self._score_cut(score_threshold)
+                boxes, classes, scores = boxes[keep], classes[keep], scores[keep]
+            boxes = self._dequantize(self.boxes_idx, boxes)
+            if self._output_tables[self.boxes_idx] is None:
+                np.clip(boxes, 0, 1, out=boxes)
+            results.append((boxes, self._dequantize(self.classes_idx, classes),
+                            self._dequantize(self.scores_idx, scores)))
+        return results
+
+    def _dequantize(self, output_idx, raw):
+        table = self._output_tables[output_idx]
+        if table is None:
+            return np.array(raw, dtype=np.float32)
+        return table[0].take(raw.view(np.uint8))  # take : pas de copie intp de l'index (fancy indexing)
+
+    def predict(self, image, score_threshold=None):
+        """boxes, classes, scores, temps (ms) ; avec score_threshold, seules les détections au-dessus."""
+        if self.batch_size > 1:
+            results, processing_time = self.predict_batch([image], score_threshold)
+            return (*results[0], processing_time)
+
+        start_time = time.time()
+        with self._acquire() as interpreter:
+            self._fill_input(interpreter, (image,))
+            with TRACER.span("invoke"):
+                interpreter.invoke()
+            with TRACER.span("outputs"):
+                boxes, classes, scores = self._read_outputs(interpreter, 1, score_threshold)[0]
+
+        processing_time = (time.time() - start_time) * 1000
+        if self.first_frame_ms is None:
+            self.first_frame_ms = processing_time
+        return boxes, classes, scores, processing_time
+
+    def predict_batch(self, images, score_threshold=None):
+        """Un seul invoke pour plusieurs images (len(images) <= batch_size).
+
+        Les places inutilisées du batch gardent l'image précédente (résultat ignoré).
+        Retourne la liste des (boxes, classes, scores) dans l'ordre des images,
+        et le temps total.
+        """
+        if len(images) > self.batch_size:
+            raise ValueError(f"{len(images)} images pour un batch de {self.batch_size}")
+
+        start_time = time.time()
+        with self._acquire() as interpreter:
+            self._fill_input(interpreter, images)
+            with TRACER.span("invoke"):
+                interpreter.invoke()
+            with TRACER.span("outputs"):
+                results = self._read_outputs(interpreter, len(images), score_threshold)
 
         processing_time = (time.time() - start_time) * 1000
-        return boxes, classes, scores, processing_time
\ No newline at end of file
+        if self.first_frame_ms is None:
+            self.first_frame_ms = processing_time
+        return results, processing_time
+
+    def detect(self, image, score_threshold=None):
+        """Comme predict, mais retourne un objet Detections (latence incluse).
+
+        detect(image, seuil) == detect(image).filter(seuil), sans déquantifier le reste.
+        """
+        boxes, classes, scores, processing_time = self.predict(image, score_threshold)
+        return Detections(boxes, classes, scores, processing_time)
+
+    def detect_batch(self, images, score_threshold=None):
+        results, processing_time = self.predict_batch(images, score_threshold)
+        return [Detections(boxes, classes, scores, processing_time)
+                for boxes, classes, scores in results]
+
+    def detect_many(self, images, score_threshold=None):
+        """detect réparti sur le pool d'interpréteurs."""
+        return [Detections(boxes, classes, scores, processing_time)
+                for boxes, classes, scores, processing_time in self.predict_many(images, score_threshold)]
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size,
+                                                thread_name_prefix="edge-detector")
+        return self._executor
+
+    def predict_async(self, image, score_threshold=None):
+        """Lance predict sur un interpréteur libre du pool, retourne un Future."""
+        return self._get_executor().submit(self.predict, image, score_threshold)
+
+    def predict_many(self, images, score_threshold=None):
+        """Répartit les images sur le pool, résultats dans l'ordre d'entrée."""
+        if self.pool_size == 1:
+            return [self.predict(image, score_threshold) for image in images]
+        # Les threads du pool tracent (ou non) l'image de l'appelant
+        frame = TRACER.current()
+
+        def predict(image):
+            TRACER.adopt(frame)
+            return self.predict(image, score_threshold)
+
+        return list(self._get_executor().map(predict, images))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
\ No newline at end of file
@@ -1,11 +1,23 @@
-from fastapi import FastAPI, Response
-from fastapi.responses import StreamingResponse
-import cv2
-import threading
+from fastapi import FastAPI, Header, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import asyncio
 import time
 import os
-import io
-from app.inference import EdgeDetector
+from app.broadcaster import MJPEGBroadcaster
+from app.cache import DetectionCache
+from app.detections import DetectionFilter
+from app.memory import MemoryPlan, rss_mb
+from app.multistream import MultiStreamEngine
+from app.ota import ModelManager
+from app.pipeline import VisionPipeline
+from app.policy import ModelPolicy, parse_variants
+from app.profiling import PROFILE_MODES, TRACER, Profiler
+from app.regions import RegionPlan, parse_dims, parse_rois
+from app.registry import ModelRegistry, op_profile
+from app.results import FORMATS, ResultBroadcaster, ResultRecord, ResultSink, msgpack
+from app.scheduler import AdaptiveScheduler
+from app.telemetry import Telemetry
+from app.workers import ProcessDetector
 
 
 app = FastAPI(title="Edge Vision System")
@@ -13,151 +25,587 @@ app = FastAPI(title="Edge Vision System")
 # --- Config ---
 # On commence par défaut avec le modèle rapide
 CURRENT_MODEL = "models/model_int8.tflite"
+# Registre : seuls les modèles de MODELS_DIR sont chargeables (OTA comprise)
+MODELS_DIR = os.environ.get("MODELS_DIR", "models")
+MODEL_REGISTRY_INDEX = os.environ.get("MODEL_REGISTRY_INDEX", os.path.join(MODELS_DIR, "registry.json"))
+# Budget mémoire des détecteurs gardés chauds (le conteneur est limité à 512 Mo)
+MODEL_CACHE_MB = float(os.environ.get("MODEL_CACHE_MB", "64"))
 VIDEO_SOURCE = "data/video_test.mp4"
+# Mode multi-caméras : VIDEO_SOURCES="cam1.mp4,rtsp://...,2" (sinon VIDEO_SOURCE seul)
+VIDEO_SOURCES = [src.strip() for src in os.environ.get("VIDEO_SOURCES", VIDEO_SOURCE).split(",") if src.strip()]
+# Régions d'intérêt statiques par flux, en fractions x1,y1,x2,y2 : ";" entre
+# les ROI d'un flux, "|" entre les flux (ex. "0,0.3,0.5,1|" : ROI sur le flux 0 seulement)
+REGIONS_ROIS = os.environ.get("REGIONS_ROIS", "")
+# Inférence par tuiles "lignes x colonnes" (vide = désactivée), pour les images
+# d'au moins REGIONS_TILE_MIN_WIDTH pixels ; la vue entière réduite est ajoutée
+# aux tuiles si REGIONS_FULL_VIEW=1. Fusion des boîtes par NMS (REGIONS_NMS_IOU).
+REGIONS_TILES = os.environ.get("REGIONS_TILES", "")
+REGIONS_TILE_OVERLAP = float(os.environ.get("REGIONS_TILE_OVERLAP", "0.2"))
+REGIONS_TILE_MIN_WIDTH = int(os.environ.get("REGIONS_TILE_MIN_WIDTH", "0"))
+REGIONS_FULL_VIEW = os.environ.get("REGIONS_FULL_VIEW", "1") == "1"
+REGIONS_NMS_IOU = float(os.environ.get("REGIONS_NMS_IOU", "0.5"))
+# Résolution d'entrée du modèle au chargement, "HxW" (vide = native) : précision contre vitesse
+DETECTOR_INPUT_SIZE = parse_dims(os.environ.get("DETECTOR_INPUT_SIZE", ""))
+
+def build_region_plans():
+    """Un RegionPlan par flux (None = image entière)"""
+    rois = REGIONS_ROIS.split("|") if REGIONS_ROIS else []
+    grid = parse_dims(REGIONS_TILES)
+    plans = []
+    for i in range(len(VIDEO_SOURCES)):
+        stream_rois = parse_rois(rois[i]) if i < len(rois) else None
+        if stream_rois is None and grid is None:
+            plans.append(None)
+            continue
+        plans.append(RegionPlan(stream_rois, grid, REGIONS_TILE_OVERLAP, REGIONS_TILE_MIN_WIDTH,
+                                REGIONS_FULL_VIEW, REGIONS_NMS_IOU))
+    return plans
+
+REGION_PLANS = build_region_plans()
+# Un batch = une image (ou toutes ses régions) par caméra, si le modèle accepte le redimensionnement
+BATCH_SIZE = sum(plan.count() if plan is not None else 1 for plan in REGION_PLANS)
+# Threads TFLite par interpréteur (vide = défaut du runtime) et nombre d'interpréteurs
+DETECTOR_NUM_THREADS = int(os.environ["DETECTOR_NUM_THREADS"]) if os.environ.get("DETECTOR_NUM_THREADS") else None
+DETECTOR_POOL_SIZE = int(os.environ.get("DETECTOR_POOL_SIZE", "1"))
+# Inférence dans N processus séparés (mémoire partagée) au lieu du process uvicorn (0 = désactivé)
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))
+# Taille des files entre étages et politique quand elles sont pleines
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "1"))
+PIPELINE_DROP_POLICY = os.environ.get("PIPELINE_DROP_POLICY", "drop_oldest")
+# Post-traitement par défaut (modifiable à chaud via /detection-config)
+SCORE_THRESHOLD = float(os.environ.get("SCORE_THRESHOLD", "0.10"))
+DETECTION_CLASSES = os.environ.get("DETECTION_CLASSES", "")  # ex. "1,3" (vide = toutes)
+NMS_IOU = float(os.environ.get("NMS_IOU", "0"))              # 0 = NMS désactivé
+# Valeurs par défaut du flux MJPEG (surchargeables par client : ?quality=..&fps=..)
+STREAM_JPEG_QUALITY = int(os.environ.get("STREAM_JPEG_QUALITY", "80"))
+STREAM_MAX_FPS = float(os.environ.get("STREAM_MAX_FPS", "20"))
+# Inférence adaptative : saut des images statiques + pas réglé sur un budget de FPS
+ADAPTIVE_INFERENCE = os.environ.get("ADAPTIVE_INFERENCE", "0") == "1"
+ADAPTIVE_TARGET_FPS = float(os.environ.get("ADAPTIVE_TARGET_FPS", "15"))
+ADAPTIVE_MAX_STRIDE = int(os.environ.get("ADAPTIVE_MAX_STRIDE", "8"))
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", "0.01"))  # part de pixels changés
+# Cache de détections par hash perceptuel (0 = désactivé) et tolérance en bits (sur 256)
+DETECTION_CACHE_SIZE = int(os.environ.get("DETECTION_CACHE_SIZE", "0"))
+DETECTION_CACHE_TOLERANCE = int(os.environ.get("DETECTION_CACHE_TOLERANCE", "0"))
+# Période de publication des instantanés de télémétrie (secondes)
+TELEMETRY_INTERVAL = float(os.environ.get("TELEMETRY_INTERVAL", "0.5"))
+# Capture : largeur max des images décodées (0 = native), décodage matériel si disponible
+CAPTURE_MAX_WIDTH = int(os.environ.get("CAPTURE_MAX_WIDTH", "0"))
+CAPTURE_HW_ACCEL = os.environ.get("CAPTURE_HW_ACCEL", "1") == "1"
+# Clips courts pré-décodés une fois dans un cache mappé en mémoire (boucle sans décodage)
+CAPTURE_PREDECODE = os.environ.get("CAPTURE_PREDECODE", "0") == "1"
+CAPTURE_CACHE_DIR = os.environ.get("CAPTURE_CACHE_DIR", "/tmp/edge-frames")
+CAPTURE_CACHE_MB = int(os.environ.get("CAPTURE_CACHE_MB", "256"))
+# Politique automatique : variantes (précise -> rapide, "modele@HxW" pour changer
+# la résolution d'entrée) et SLO (FPS cible, ou latence p95 explicite en ms)
+AUTO_MODEL = os.environ.get("AUTO_MODEL", "0") == "1"
+AUTO_MODEL_VARIANTS = os.environ.get("AUTO_MODEL_VARIANTS", "model_float32,model_int8")
+SLO_TARGET_FPS = float(os.environ.get("SLO_TARGET_FPS", "15"))
+SLO_LATENCY_MS = float(os.environ["SLO_LATENCY_MS"]) if os.environ.get("SLO_LATENCY_MS") else None
+POLICY_INTERVAL = float(os.environ.get("POLICY_INTERVAL", "2"))
+POLICY_COOLDOWN_S = float(os.environ.get("POLICY_COOLDOWN_S", "10"))  # délai mini entre deux bascules
+# Flux de détections (WebSocket / SSE) : résultats en attente par client avant perte
+RESULTS_QUEUE_SIZE = int(os.environ.get("RESULTS_QUEUE_SIZE", "64"))
+# Journal des détections (vide = désactivé), format jsonl ou parquet, rotation par taille
+RESULTS_LOG_DIR = os.environ.get("RESULTS_LOG_DIR", "")
+RESULTS_LOG_FORMAT = os.environ.get("RESULTS_LOG_FORMAT", "jsonl")
+RESULTS_LOG_MAX_MB = float(os.environ.get("RESULTS_LOG_MAX_MB", "64"))
+RESULTS_LOG_KEEP = int(os.environ.get("RESULTS_LOG_KEEP", "10"))
+RESULTS_LOG_BATCH = int(os.environ.get("RESULTS_LOG_BATCH", "256"))
+# Cadence de relecture d'un dossier d'images (VIDEO_SOURCES=data/calibration)
+CAPTURE_IMAGE_FPS = float(os.environ.get("CAPTURE_IMAGE_FPS", "10"))
+# Traçage permanent : une image sur N découpée en spans (0 = désactivé, réglable via /debug/trace)
+PROFILE_SAMPLE_EVERY = int(os.environ.get("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_TRACE_CAPACITY = int(os.environ.get("PROFILE_TRACE_CAPACITY", "4096"))  # spans gardés pour l'export
+PROFILE_STACK_INTERVAL_MS = float(os.environ.get("PROFILE_STACK_INTERVAL_MS", "5"))  # /debug/profile?mode=sample
+# Mode mémoire bornée (devices 512 Mo) : budget des tampons (images, files, caches, détecteurs chauds)
+# hors runtime, 0 = désactivé. Les réglages ci-dessus sont plafonnés par ce budget, et les images
+# circulent dans un pool de cases préallouées, estimées à MEMORY_FRAME_SIZE (HxW, la plus grande attendue)
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB", "0"))
+MEMORY_FRAME_SIZE = os.environ.get("MEMORY_FRAME_SIZE", "720x1280")
+RESULTS_LOG_QUEUE = 10000  # records en attente d'écriture dans le journal
+
+def build_memory_plan():
+    if MEMORY_BUDGET_MB <= 0:
+        return None
+    height, width = parse_dims(MEMORY_FRAME_SIZE)
+    if CAPTURE_MAX_WIDTH and width > CAPTURE_MAX_WIDTH:
+        height, width = max(1, round(height * CAPTURE_MAX_WIDTH / width)), CAPTURE_MAX_WIDTH
+    plan = MemoryPlan(MEMORY_BUDGET_MB, len(VIDEO_SOURCES), (height, width, 3),
+                      multistream=len(VIDEO_SOURCES) > 1, queue_size=PIPELINE_QUEUE_SIZE,
+                      detection_cache=DETECTION_CACHE_SIZE, results_queue=RESULTS_QUEUE_SIZE,
+                      results_log_queue=RESULTS_LOG_QUEUE, trace_capacity=PROFILE_TRACE_CAPACITY,
+                      model_cache_mb=MODEL_CACHE_MB, capture_cache_mb=CAPTURE_CACHE_MB)
+    print(f"🧮 Mémoire bornée : {plan.snapshot()}")
+    if plan.over_budget:
+        print(f"⚠️ {plan.frame_slots} images de {MEMORY_FRAME_SIZE} par flux dépassent la part images "
+              f"du budget ({MEMORY_BUDGET_MB} Mo) : minimum conservé")
+    return plan
+
+memory_plan = build_memory_plan()
+if memory_plan is not None:
+    PIPELINE_QUEUE_SIZE = memory_plan.queue_size
+    DETECTION_CACHE_SIZE = memory_plan.limits["detection_cache"]
+    RESULTS_QUEUE_SIZE = memory_plan.limits["results_queue"]
+    RESULTS_LOG_QUEUE = memory_plan.limits["results_log_queue"]
+    PROFILE_TRACE_CAPACITY = memory_plan.limits["trace_capacity"]
+    MODEL_CACHE_MB = memory_plan.limits["model_cache_mb"]
+    CAPTURE_CACHE_MB = memory_plan.limits["capture_cache_mb"]
+# Un pool d'images par flux, partagé par la capture, le pipeline et le diffuseur MJPEG
+frame_pools = memory_plan.pools() if memory_plan is not None else [None] * len(VIDEO_SOURCES)
 
 # --- Variables Globales ---
-detector = None
-stop_thread = False
-latest_frame_processed = None 
-lock = threading.Lock() 
-
-telemetry = {
-    "fps": 0.0,
-    "latency_ms": 0.0,
-    "model_version": "v1_int8",
-    "objects_detected": 0
+pipeline = None
+broadcasters = [MJPEGBroadcaster(pool) for pool in frame_pools]
+
+def parse_classes(value):
+    return [int(c) for c in value.split(",") if c.strip()] or None
+
+detection_filter = DetectionFilter(SCORE_THRESHOLD, parse_classes(DETECTION_CLASSES), NMS_IOU)
+
+TRACER.configure(PROFILE_SAMPLE_EVERY, PROFILE_TRACE_CAPACITY)
+profile_lock = asyncio.Lock()
+
+telemetry = Telemetry(model_version="v1_int8", interval=TELEMETRY_INTERVAL)
+
+results = ResultBroadcaster(RESULTS_QUEUE_SIZE)
+
+def build_sink():
+    if not RESULTS_LOG_DIR:
+        return None
+    fmt = RESULTS_LOG_FORMAT
+    try:
+        return ResultSink(RESULTS_LOG_DIR, fmt, int(RESULTS_LOG_MAX_MB * 1024 * 1024),
+                          RESULTS_LOG_KEEP, RESULTS_LOG_BATCH, queue_size=RESULTS_LOG_QUEUE)
+    except ImportError:
+        print(f"⚠️ pyarrow absent : journal des détections en jsonl au lieu de {fmt}")
+        return ResultSink(RESULTS_LOG_DIR, "jsonl", int(RESULTS_LOG_MAX_MB * 1024 * 1024),
+                          RESULTS_LOG_KEEP, RESULTS_LOG_BATCH, queue_size=RESULTS_LOG_QUEUE)
+
+sink = build_sink()
+
+def emit_results(stream_id, frame_id, captured_at, frame_shape, detections):
+    """Résultats structurés de chaque image : clients WebSocket / SSE + journal"""
+    if not results.subscribers and sink is None:
+        return
+    record = ResultRecord(stream_id, frame_id, captured_at, frame_shape, detections)
+    results.publish(record)
+    if sink is not None:
+        sink.write(record)
+
+def publish_frame(frame, count, latency, stream_id=0):
+    """Dernier étage du pipeline : met à jour la télémétrie et l'image servie"""
+    telemetry.record_frame(latency, count)
+    policy.record(latency)
+    broadcasters[stream_id].publish(frame)
+
+registry = ModelRegistry(MODELS_DIR, MODEL_REGISTRY_INDEX, MODEL_CACHE_MB)
+
+def build_detector(model_path, input_size=None):
+    input_size = input_size or DETECTOR_INPUT_SIZE
+    if INFERENCE_WORKERS > 0:
+        if input_size is not None:
+            raise ValueError("Résolution d'entrée non modifiable en mode INFERENCE_WORKERS")
+        return ProcessDetector(registry.resolve(model_path)["path"], workers=INFERENCE_WORKERS,
+                               num_threads=DETECTOR_NUM_THREADS)
+    # Détecteur déjà chaud si ce modèle a servi récemment (retour int8 <-> float32)
+    return registry.detector(model_path, batch_size=BATCH_SIZE, num_threads=DETECTOR_NUM_THREADS,
+                             pool_size=DETECTOR_POOL_SIZE, input_size=input_size)
+
+# Modèle actif + précédent (gardé en mémoire pour le rollback)
+models = ModelManager(build_detector, release_detector=registry.release)
+
+def switch_variant(variant, commit):
+    """Bascule décidée par la politique : même chemin que l'OTA (chargement, préchauffage)"""
+    if models.swap(variant["model"], commit=commit, input_size=variant["input_size"]) is None:
+        return False  # OTA / rollback manuel pendant le chargement
+    telemetry.model_version = variant["name"]
+    return True
+
+policy = ModelPolicy(parse_variants(AUTO_MODEL_VARIANTS), switch_variant,
+                     target_fps=SLO_TARGET_FPS, latency_ms=SLO_LATENCY_MS,
+                     get_fps=lambda: telemetry.snapshot()["fps"],
+                     interval=POLICY_INTERVAL, cooldown_s=POLICY_COOLDOWN_S, enabled=AUTO_MODEL)
+
+# Sections ajoutées à chaque instantané (calculées hors des requêtes HTTP)
+telemetry.add_source("pipeline", lambda: pipeline.snapshot() if pipeline is not None else None)
+telemetry.add_source("stream", lambda: [broadcaster.snapshot() for broadcaster in broadcasters])
+telemetry.add_source("ota", lambda: models.snapshot())
+telemetry.add_source("registry", lambda: registry.snapshot())
+telemetry.add_source("policy", lambda: policy.snapshot())
+telemetry.add_source("results", lambda: {**results.snapshot(),
+                                         "log": sink.snapshot() if sink is not None else None})
+telemetry.add_source("feed", lambda: telemetry.feed.snapshot())
+telemetry.add_source("profiling", lambda: TRACER.snapshot() if TRACER.enabled else None)
+telemetry.add_source("workers", lambda: models.active.snapshot()
+                     if isinstance(models.active, ProcessDetector) else None)
+telemetry.add_source("memory", lambda: {
+    "rss_mb": round(rss_mb(), 1),
+    **({"plan": memory_plan.snapshot(), "pools": [pool.snapshot() for pool in frame_pools]}
+       if memory_plan is not None else {}),
+})
+
+def parse_source(source):
+    """'0' -> index de webcam, sinon chemin / URL tel quel"""
+    return int(source) if source.isdigit() else source
+
+CAPTURE_OPTIONS = {
+    "max_width": CAPTURE_MAX_WIDTH,
+    "image_fps": CAPTURE_IMAGE_FPS,
+    "predecode": CAPTURE_PREDECODE,
+    "cache_dir": CAPTURE_CACHE_DIR,
+    "cache_mb": CAPTURE_CACHE_MB,
+    "hw_acceleration": CAPTURE_HW_ACCEL,
 }
 
-def video_processing_loop():
-    """Boucle principale : Lit vidéo -> Détecte -> Dessine"""
-    global detector, telemetry, stop_thread, latest_frame_processed
-    
-    print(f"🎥 Démarrage du flux vidéo : {VIDEO_SOURCE}")
-    cap = cv2.VideoCapture(VIDEO_SOURCE)
-    
-    while not stop_thread:
-        ret, frame = cap.read()
-        if not ret:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
+def make_scheduler():
+    return AdaptiveScheduler(ADAPTIVE_TARGET_FPS, ADAPTIVE_MAX_STRIDE, changed_ratio=MOTION_THRESHOLD)
 
-        if detector:
-            try:
-                # 1. Inférence
-                boxes, classes, scores, latency = detector.predict(frame)
-                
-                # 2. Dessin (Filtre 15%)
-                count = 0
-                h, w, _ = frame.shape
-                for i in range(len(scores)):
-                    # 1. ON BAISSE LE SEUIL AU MINIMUM (10%)
-                    # 2. ON ENLÈVE LE FILTRE DE CLASSE (On veut tout voir)
-                    if scores[i] > 0.10:  
-                        count += 1
-                        
-                        ymin, xmin, ymax, xmax = boxes[i]
-                        start = (int(xmin * w), int(ymin * h))
-                        end = (int(xmax * w), int(ymax * h))
-                        
-                        # On change la couleur en ROUGE pour bien voir (0, 0, 255) en BGR
-                        cv2.rectangle(frame, start, end, (0, 255, 0), 2)
-                        
-                        # On affiche L'ID et le SCORE
-                        label = f"ID {int(classes[i])} ({scores[i]*100:.0f}%)"
-                        cv2.putText(frame, label, (start[0], start[1]-10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-                # 3. Mise à jour Télémétrie
-                telemetry["latency_ms"] = latency
-                telemetry["objects_detected"] = count
-                if latency > 0:
-                    telemetry["fps"] = 1000.0 / latency
-                
-                # 4. Sauvegarder pour le web
-                with lock:
-                    latest_frame_processed = frame.copy()
-                
-                time.sleep(0.01)
-                
-            except Exception as e:
-                print(f"Erreur boucle : {e}")
-                time.sleep(0.1)
-
-    cap.release()
-    print("🛑 Arrêt du flux vidéo (Thread terminé).")
-
-def generate_mjpeg():
-    """Générateur web"""
-    global latest_frame_processed
-    while True:
-        with lock:
-            if latest_frame_processed is None:
-                time.sleep(0.1)
+def start_pipeline():
+    """Lance Décodage -> Inférence -> Dessin dans des threads séparés"""
+    global pipeline
+    # Vidé automatiquement dès que le modèle actif (OTA, rollback, variante) ou le seuil change
+    cache = DetectionCache(DETECTION_CACHE_SIZE, DETECTION_CACHE_TOLERANCE) if DETECTION_CACHE_SIZE > 0 else None
+    if len(VIDEO_SOURCES) > 1:
+        pipeline = MultiStreamEngine([parse_source(src) for src in VIDEO_SOURCES],
+                                     lambda: models.active, publish_frame,
+                                     get_filter=lambda: detection_filter,
+                                     make_scheduler=make_scheduler if ADAPTIVE_INFERENCE else None,
+                                     cache=cache, capture_options=CAPTURE_OPTIONS,
+                                     emit_results=emit_results, regions=REGION_PLANS, pools=frame_pools)
+    else:
+        pipeline = VisionPipeline(parse_source(VIDEO_SOURCES[0]), lambda: models.active, publish_frame,
+                                  queue_size=PIPELINE_QUEUE_SIZE,
+                                  drop_policy=PIPELINE_DROP_POLICY,
+                                  get_filter=lambda: detection_filter,
+                                  scheduler=make_scheduler() if ADAPTIVE_INFERENCE else None,
+                                  cache=cache, capture_options=CAPTURE_OPTIONS,
+                                  emit_results=emit_results, regions=REGION_PLANS[0], pool=frame_pools[0])
+    pipeline.start()
+
+async def generate_mjpeg(broadcaster, quality, max_fps):
+    """Générateur web asynchrone : attend l'événement "nouvelle image", sans thread bloqué"""
+    min_interval = 1.0 / max_fps
+    last_seq = 0
+    broadcaster.subscribe()
+    try:
+        while True:
+            seq, chunk = await broadcaster.next_chunk_async(last_seq, quality, timeout=1.0)
+            if chunk is None:
                 continue
-            (flag, encodedImage) = cv2.imencode(".jpg", latest_frame_processed)
-            if not flag: continue
-        
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + 
-              bytearray(encodedImage) + b'\r\n')
-        time.sleep(0.05)
+            last_seq = seq
+            sent_at = time.perf_counter()
+            yield chunk
+            # Limite de FPS propre à ce client
+            remaining = min_interval - (time.perf_counter() - sent_at)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+    finally:
+        broadcaster.unsubscribe()
 
 @app.on_event("startup")
-def startup_event():
-    global detector
+async def startup_event():
+    loop = asyncio.get_running_loop()
+    for broadcaster in broadcasters:
+        broadcaster.attach_loop(loop)
+    results.attach_loop(loop)
+    telemetry.feed.attach_loop(loop)
+    if sink is not None:
+        sink.start()
+    telemetry.start()
+    await loop.run_in_executor(None, registry.scan)
+    print(f"📚 Registre : {len(registry.entries())} modèle(s) dans {MODELS_DIR}")
     if os.path.exists(CURRENT_MODEL):
-        detector = EdgeDetector(CURRENT_MODEL)
+        await loop.run_in_executor(None, models.load, CURRENT_MODEL)
         print("✅ Modèle chargé.")
-        # On lance le thread vidéo
-        thread = threading.Thread(target=video_processing_loop, daemon=True)
-        thread.start()
+        policy.adopt(models.active_path, models.active_options)
+        policy.start()
+        # On lance le pipeline vidéo
+        start_pipeline()
     else:
         print(f"❌ Modèle introuvable : {CURRENT_MODEL}")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    # Arrête proprement les threads et les éventuels processus d'inférence
+    if pipeline is not None:
+        pipeline.stop()
+    telemetry.stop()
+    policy.stop()
+    if sink is not None:
+        sink.stop()
+    models.close()
+    registry.close()
+
 @app.get("/")
-def index():
-    return "Système Prêt. Routes: /video_feed, /metrics, /update-model"
+async def index():
+    return "Système Prêt. Routes: /video_feed, /metrics, /metrics/prometheus, /update-model, /rollback-model, /models, /policy, /detection-config, /ws/detections, /detections/stream, /debug/profile, /debug/trace"
 
 @app.get("/metrics")
-def get_metrics():
-    return telemetry
+async def get_metrics():
+    # Dernier instantané publié : toutes les valeurs viennent du même calcul
+    return telemetry.snapshot()
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_metrics_prometheus():
+    return PlainTextResponse(telemetry.prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def generate_metrics_sse(resolution, last_id):
+    feed = telemetry.feed
+    feed.subscribers += 1
+    try:
+        if last_id is None or last_id > feed.seq:
+            last_id = 0  # premier abonnement, ou service redémarré depuis
+        state_seq = feed.state_seq
+        yield f"retry: 2000\nevent: state\ndata: {feed.state_json()}\n\n"
+        # Rattrapage : tout l'historique, ou seulement ce qui a suivi Last-Event-ID
+        history = feed.since(resolution, last_id)
+        seq = history[-1][0] if history else last_id
+        if history:
+            yield f"id: {seq}\nevent: history\ndata: [{','.join(p for _, p in history)}]\n\n"
+        observed = feed.seq
+        while True:
+            if not await feed.wait(observed, timeout=15.0):
+                yield ": keepalive\n\n"
+                continue
+            observed = feed.seq
+            if feed.state_seq != state_seq:
+                state_seq = feed.state_seq
+                yield f"event: state\ndata: {feed.state_json()}\n\n"
+            for seq, payload in feed.since(resolution, seq):
+                yield f"id: {seq}\nevent: point\ndata: {payload}\n\n"
+    finally:
+        feed.subscribers -= 1
+
+@app.get("/metrics/stream")
+async def metrics_stream(interval: float = Query(1.0, gt=0, le=60, description="secondes entre deux points"),
+                         last_event_id: int = Header(None)):
+    """Server-Sent Events : un point agrégé par période (état, historique, puis deltas)"""
+    resolution = telemetry.feed.resolution(interval)
+    return StreamingResponse(generate_metrics_sse(resolution, last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/video_feed")
-def video_feed():
-    return StreamingResponse(generate_mjpeg(), 
+async def video_feed(quality: int = Query(STREAM_JPEG_QUALITY, ge=1, le=100),
+               fps: float = Query(STREAM_MAX_FPS, gt=0, le=60),
+               stream: int = Query(0, ge=0)):
+    if stream >= len(broadcasters):
+        return Response(f"Flux inconnu : {stream}", status_code=404)
+    return StreamingResponse(generate_mjpeg(broadcasters[stream], quality, fps), 
                              media_type="multipart/x-mixed-replace;boundary=frame")
 
-# --- LA PARTIE CORRIGÉE POUR L'OTA ---
+def parse_result_filter(classes, min_score):
+    return (set(parse_classes(classes)) if classes else None), min_score
+
+async def next_record(pending, stream, timeout):
+    """Prochain résultat du flux demandé (None = tous), ou None après timeout"""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            record = await asyncio.wait_for(pending.get(), remaining)
+        except asyncio.TimeoutError:
+            return None
+        if stream is None or record.stream == stream:
+            return record
+
+@app.websocket("/ws/detections")
+async def detections_ws(websocket: WebSocket,
+                        stream: int = Query(None, ge=0),
+                        classes: str = Query(None, description="ex. 1,3"),
+                        min_score: float = Query(0.0, ge=0, le=1),
+                        fmt: str = Query("json", alias="format", description="json, msgpack ou binary")):
+    """Un message par image : boîtes normalisées, classes, scores, n° d'image, horodatages"""
+    await websocket.accept()
+    if fmt not in FORMATS or (fmt == "msgpack" and msgpack is None):
+        await websocket.close(code=1003, reason=f"Format indisponible : {fmt}")
+        return
+    selected, min_score = parse_result_filter(classes, min_score)
+    pending = results.subscribe()
+    # Pipeline au repos : aucun envoi n'échoue, seule la lecture voit partir le client
+    receiving = asyncio.ensure_future(websocket.receive())
+    waiting = None
+    try:
+        while True:
+            if waiting is None:
+                waiting = asyncio.ensure_future(next_record(pending, stream, timeout=30.0))
+            done, _ = await asyncio.wait({receiving, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            if receiving in done:
+                if receiving.result()["type"] == "websocket.disconnect":
+                    break
+                receiving = asyncio.ensure_future(websocket.receive())  # messages du client ignorés
+            if waiting not in done:
+                continue
+            record, waiting = waiting.result(), None
+            if record is None:
+                continue
+            payload = record.encode(fmt, record.select(selected, min_score))
+            if isinstance(payload, str):
+                await websocket.send_text(payload)
+            else:
+                await websocket.send_bytes(payload)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in (receiving, waiting):
+            if task is not None:
+                task.cancel()
+        results.unsubscribe(pending)
+
+async def generate_sse(stream, selected, min_score):
+    pending = results.subscribe()
+    try:
+        while True:
+            record = await next_record(pending, stream, timeout=15.0)
+            if record is None:
+                yield ": keepalive\n\n"  # garde la connexion ouverte à travers les proxys
+                continue
+            payload = record.encode("json", record.select(selected, min_score))
+            yield f"id: {record.stream}-{record.frame_id}\nevent: detections\ndata: {payload}\n\n"
+    finally:
+        results.unsubscribe(pending)
+
+@app.get("/detections/stream")
+async def detections_sse(stream: int = Query(None, ge=0),
+                         classes: str = Query(None, description="ex. 1,3"),
+                         min_score: float = Query(0.0, ge=0, le=1)):
+    """Server-Sent Events : mêmes enregistrements que /ws/detections, en JSON"""
+    selected, min_score = parse_result_filter(classes, min_score)
+    return StreamingResponse(generate_sse(stream, selected, min_score), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/detection-config")
+async def get_detection_config():
+    return detection_filter.to_dict()
+
+@app.post("/detection-config")
+async def update_detection_config(score_threshold: float = Query(None, ge=0, le=1),
+                            classes: str = Query(None, description="ex. 1,3 ('' = toutes)"),
+                            nms_iou: float = Query(None, ge=0, le=1, description="0 = désactivé")):
+    """Seuil, filtre de classes et NMS appliqués dès l'image suivante.
+
+    Un nouveau seuil vide le cache de détections (DETECTION_CACHE_SIZE) à
+    l'image suivante : son taux de succès chute le temps qu'il se remplisse
+    à nouveau (`cache_reset` dans la réponse).
+    """
+    global detection_filter
+    current = detection_filter
+    try:
+        detection_filter = DetectionFilter(
+            current.score_threshold if score_threshold is None else score_threshold,
+            current.classes if classes is None else parse_classes(classes),
+            current.nms_iou if nms_iou is None else nms_iou,
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", **detection_filter.to_dict(),
+            "cache_reset": DETECTION_CACHE_SIZE > 0 and detection_filter.score_threshold != current.score_threshold}
+
+@app.get("/models")
+async def list_models():
+    """Index du registre (empreinte, signature, mesures) et détecteurs chauds"""
+    return {"models": registry.entries(), "cache": registry.snapshot()}
+
+@app.get("/policy")
+async def get_policy():
+    """État de la politique automatique et historique de ses décisions (avec raisons)"""
+    return policy.snapshot(decisions=50)
+
+@app.post("/policy")
+async def update_policy(enabled: bool = Query(None),
+                        target_fps: float = Query(None, gt=0, le=120),
+                        latency_ms: float = Query(None, gt=0, description="SLO p95 (conservé si omis ; jamais réglé : 1000 / target_fps)")):
+    """Active / désactive la politique et règle son SLO à chaud"""
+    if target_fps is not None or latency_ms is not None:
+        policy.configure(target_fps or policy.target_fps, latency_ms)
+    if enabled is False:
+        policy.disable("désactivée via /policy")
+    elif enabled and not policy.enabled:
+        policy.adopt(models.active_path, models.active_options)
+        policy.enabled = True
+    return {"status": "success", **policy.snapshot()}
+
+# --- PROFILAGE ---
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = Query(5.0, gt=0, le=60),
+                        mode: str = Query("sample", description="sample (piles de tous les threads) ou cprofile"),
+                        ops: bool = Query(False, description="temps par opérateur TFLite (benchmark_model)"),
+                        fmt: str = Query("json", alias="format", description="json ou chrome")):
+    """Profil du service pendant `seconds` s + spans de toutes les images de la période"""
+    if mode not in PROFILE_MODES or fmt not in ("json", "chrome"):
+        return {"status": "error", "message": f"Mode ou format inconnu : {mode}, {fmt}"}
+    if profile_lock.locked():
+        return {"status": "error", "message": "Profilage déjà en cours"}
+    loop = asyncio.get_running_loop()
+    async with profile_lock:
+        profiler = Profiler(TRACER, mode, PROFILE_STACK_INTERVAL_MS / 1000)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await loop.run_in_executor(None, profiler.stop)
+        report = {"model": models.active_path, **profiler.report()}
+        if ops and models.active_path:
+            report["tflite_ops"] = await loop.run_in_executor(None, op_profile, models.active_path,
+                                                              50, DETECTOR_NUM_THREADS)
+    if fmt == "chrome":
+        # À ouvrir dans ui.perfetto.dev ou chrome://tracing ; le rapport est dans otherData
+        return profiler.chrome_trace(metadata=report)
+    return report
+
+@app.get("/debug/trace")
+async def debug_trace():
+    """Chrome trace des dernières images échantillonnées (PROFILE_SAMPLE_EVERY)"""
+    return TRACER.chrome_trace(metadata={"model": models.active_path, "sample_every": TRACER.sample_every})
+
+@app.post("/debug/trace")
+async def update_trace(sample_every: int = Query(..., ge=0, description="une image sur N tracée (0 = désactivé)")):
+    TRACER.configure(sample_every)
+    return {"status": "success", **TRACER.snapshot()}
+
+# --- OTA À CHAUD ---
 @app.post("/update-model")
-def update_model(model_path: str):
-    global detector, stop_thread, telemetry
-    
+async def update_model(model_path: str):
     print(f"📥 Demande OTA reçue pour : {model_path}")
     
-    if not os.path.exists(model_path):
-        return {"status": "error", "message": "Fichier introuvable"}
+    try:
+        entry = await asyncio.get_running_loop().run_in_executor(None, registry.resolve, model_path)
+    except KeyError as e:
+        return {"status": "error", "message": str(e.args[0])}
+    model_path = entry["path"]
+    # Choix manuel : l'opérateur reprend la main sur la politique automatique
+    policy.disable(f"OTA manuelle vers {entry['name']}")
 
     try:
-        # 1. On signale au thread vidéo de s'arrêter
-        stop_thread = True
-        
-        # 2. On attend un peu qu'il s'arrête proprement
-        time.sleep(1) 
-        
-        # 3. On charge le nouveau modèle
-        print("🔄 Rechargement du moteur IA...")
-        detector = EdgeDetector(model_path)
+        # Chargement + vérification + préchauffage pendant que la vidéo continue
+        # avec l'ancien modèle, puis bascule entre deux images
+        print("🔄 Préchargement du nouveau moteur IA (sans coupure)...")
+        # Le chargement part dans un executor : la boucle asyncio continue de
+        # servir /metrics et les flux pendant ce temps
+        report = await asyncio.get_running_loop().run_in_executor(None, models.swap, model_path)
+        policy.adopt(models.active_path, models.active_options)
         
         # On met à jour le nom dans le JSON pour le dashboard
-        telemetry["model_version"] = os.path.basename(model_path)
+        telemetry.model_version = os.path.basename(model_path)
         
-        # 4. On REDÉMARRE un nouveau thread vidéo (car l'ancien est mort)
-        stop_thread = False
-        new_thread = threading.Thread(target=video_processing_loop, daemon=True)
-        new_thread.start()
-        
-        print("✅ OTA Terminée avec succès.")
-        return {"status": "success", "message": f"Modèle basculé sur {model_path}"}
+        print(f"✅ OTA Terminée avec succès (bascule en {report['swap_ms']} ms).")
+        return {"status": "success", "message": f"Modèle basculé sur {model_path}", "swap": report}
         
     except Exception as e:
         print(f"❌ Erreur OTA : {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.post("/rollback-model")
+async def rollback_model():
+    """Retour instantané au modèle précédent, toujours chargé en mémoire"""
+    try:
+        policy.disable("rollback manuel")
+        report = models.rollback()
+        policy.adopt(models.active_path, models.active_options)
+        telemetry.model_version = report["model"]
+        print(f"↩️ Rollback vers {report['model']}")
+        return {"status": "success", "message": f"Retour sur {models.active_path}", "swap": report}
+    except Exception as e:
         return {"status": "error", "message": str(e)}
\ No newline at end of file
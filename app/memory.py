@@ -0,0 +1,185 @@
+import os
+import threading
+
+import numpy as np
+
+# Images détenues en même temps par un flux, hors files : lecture en cours
+# (capture), image en cours de traitement par étage, image publiée (front) et
+# image en cours d'encodage JPEG (back).
+PIPELINE_FRAMES_IN_FLIGHT = 5   # décodage, inférence, dessin, publiée, encodage
+MULTISTREAM_FRAMES_IN_FLIGHT = 4  # décodage, batch, publiée, encodage (+ file d'une place)
+
+
+def rss_mb():
+    """Mémoire résidente du process (Mo), lue dans /proc ; pic (getrusage) à défaut."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+class FramePool:
+    """Cases d'images préallouées, réutilisées de la capture à l'encodage.
+
+    Une image du pool porte un compteur de références : le pipeline la prend
+    à la capture (acquire), le diffuseur MJPEG la retient tant qu'elle est
+    l'image publiée ou en cours d'encodage (retain / release). Revenue à zéro,
+    la case repart dans la liste libre au lieu d'être rendue à l'allocateur :
+    plus d'allocation de la taille d'une image par image, donc plus de
+    fragmentation qui fait dériver la RSS.
+
+    Les cases sont allouées à la demande, au plus `slots`, à la résolution de
+    la première image (adopt). Pool épuisé : acquire rend None et la capture
+    saute l'image, comme une file pleine. Un changement de résolution
+    réoriente le pool ; les anciennes cases disparaissent à leur libération.
+    release / retain ignorent les tableaux qui ne viennent pas du pool.
+    """
+
+    def __init__(self, slots, name="frames"):
+        self.slots = max(1, int(slots))
+        self.name = name
+        self.shape = None
+        self.allocated = 0   # cases de la résolution courante (libres + utilisées)
+        self.allocations = 0
+        self.exhausted = 0
+        self._free = []
+        self._refs = {}      # id(tableau) -> [tableau, références]
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Case libre (1 référence) ; None si la résolution est inconnue ou le pool épuisé."""
+        with self._lock:
+            if self.shape is None:
+                return None
+            if self._free:
+                frame = self._free.pop()
+            elif self.allocated < self.slots:
+                frame = np.empty(self.shape, dtype=np.uint8)
+                self.allocated += 1
+                self.allocations += 1
+            else:
+                self.exhausted += 1
+                return None
+            self._refs[id(frame)] = [frame, 1]
+            return frame
+
+    def adopt(self, frame):
+        """Fait d'une image décodée hors du pool une case (première image, nouvelle résolution)."""
+        with self._lock:
+            if frame.shape != self.shape:
+                self.shape = frame.shape
+                self._free = []
+                self.allocated = sum(1 for held, _ in self._refs.values() if held.shape == frame.shape)
+            if self.allocated >= self.slots:
+                return frame  # pool plein : image hors pool, libérée normalement
+            self.allocated += 1
+            self.allocations += 1
+            self._refs[id(frame)] = [frame, 1]
+            return frame
+
+    def retain(self, frame):
+        with self._lock:
+            entry = self._refs.get(id(frame))
+            if entry is not None:
+                entry[1] += 1
+
+    def release(self, frame):
+        if frame is None:
+            return
+        with self._lock:
+            entry = self._refs.get(id(frame))
+            if entry is None or entry[0] is not frame:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._refs[id(frame)]
+            if frame.shape == self.shape:
+                self._free.append(frame)
+
+    @property
+    def in_use(self):
+        return len(self._refs)
+
+    def snapshot(self):
+        with self._lock:
+            frame_bytes = int(np.prod(self.shape)) if self.shape is not None else 0
+            return {
+                "name": self.name,
+                "slots": self.slots,
+                "allocated": self.allocated,
+                "in_use": len(self._refs),
+                "free": len(self._free),
+                "allocations": self.allocations,
+                "exhausted": self.exhausted,
+                "shape": list(self.shape) if self.shape is not None else None,
+                "bytes": frame_bytes * self.allocated,
+            }
+
+
+class MemoryPlan:
+    """Budget mémoire des tampons (images, files, caches) -> tailles à ne pas dépasser.
+
+    Le budget ne couvre pas le runtime (Python, OpenCV, TFLite, poids du
+    modèle mappés) : c'est la part qui grandit avec la configuration. Il est
+    réparti en parts (SHARES) ; chaque réglage demandé est plafonné par ce que
+    sa part permet, jamais augmenté. Les images sont estimées à `frame_shape`
+    (la plus grande résolution attendue) : le nombre de cases par flux fixe
+    la profondeur des files entre étages.
+    """
+
+    SHARES = {"frames": 0.40, "models": 0.35, "capture_cache": 0.10, "queues": 0.15}
+    # Coût estimé d'un élément (tableaux numpy + objets Python)
+    ENTRY_BYTES = {"detection_cache": 2048, "results_queue": 2048, "results_log_queue": 2048,
+                   "trace_capacity": 256}
+    RESULTS_SUBSCRIBERS = 4  # results_queue est par abonné WebSocket / SSE
+
+    def __init__(self, budget_mb, streams=1, frame_shape=(720, 1280, 3), multistream=False,
+                 queue_size=1, detection_cache=0, results_queue=64, results_log_queue=10000,
+                 trace_capacity=4096, model_cache_mb=64, capture_cache_mb=256):
+        self.budget_mb = float(budget_mb)
+        self.streams = max(1, int(streams))
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        budget = self.budget_mb * 1e6
+        share = {name: budget * ratio for name, ratio in self.SHARES.items()}
+
+        affordable = int(share["frames"] // (self.streams * self.frame_bytes))
+        if multistream:
+            # Une file d'une place par caméra : seul le nombre de cases compte
+            self.queue_size = 1
+            needed = MULTISTREAM_FRAMES_IN_FLIGHT + 1
+        else:
+            deepest = (affordable - PIPELINE_FRAMES_IN_FLIGHT) // 2  # deux files entre étages
+            self.queue_size = max(1, min(int(queue_size), deepest))
+            needed = PIPELINE_FRAMES_IN_FLIGHT + 2 * self.queue_size
+        self.frame_slots = needed
+        self.over_budget = needed > affordable  # minimum pour tourner : le budget est dépassé
+
+        per_queue = share["queues"] / len(self.ENTRY_BYTES)
+        requested = {"detection_cache": detection_cache, "results_queue": results_queue,
+                     "results_log_queue": results_log_queue, "trace_capacity": trace_capacity}
+        self.limits = {}
+        for name, value in requested.items():
+            cap = per_queue // self.ENTRY_BYTES[name]
+            if name == "results_queue":
+                cap //= self.RESULTS_SUBSCRIBERS
+            self.limits[name] = int(min(value, max(1, cap))) if value else 0
+        self.limits["model_cache_mb"] = round(min(model_cache_mb, share["models"] / 1e6), 1)
+        self.limits["capture_cache_mb"] = int(min(capture_cache_mb, share["capture_cache"] / 1e6))
+
+    def pools(self):
+        return [FramePool(self.frame_slots, name=f"stream-{i}") for i in range(self.streams)]
+
+    def snapshot(self):
+        return {
+            "budget_mb": self.budget_mb,
+            "frame_shape": list(self.frame_shape),
+            "frame_slots_per_stream": self.frame_slots,
+            "frames_mb": round(self.frame_slots * self.streams * self.frame_bytes / 1e6, 1),
+            "queue_size": self.queue_size,
+            "over_budget": self.over_budget,
+            **self.limits,
+        }
@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+
+from app.capture import Capture
+from app.detections import Annotator
+from app.pipeline import DEFAULT_FILTER, RingBuffer, StageStats
+from app.profiling import TRACER
+from app.regions import infer_images
+
+
+class CaptureWorker:
+    """Un thread de décodage par caméra. Ne garde que l'image la plus récente."""
+
+    def __init__(self, stream_id, source, realtime=True, scheduler=None, capture_options=None,
+                 regions=None, pool=None):
+        self.stream_id = stream_id
+        self.source = source
+        self.scheduler = scheduler  # AdaptiveScheduler propre à ce flux (optionnel)
+        self.regions = regions      # RegionPlan propre à ce flux (ROI, tuiles ; optionnel)
+        self.pool = pool            # FramePool propre à ce flux (mode mémoire bornée ; optionnel)
+        self.latest = RingBuffer(1, "drop_oldest", lambda item: self.release(item[2]))
+        self.decode_stats = StageStats()
+        self.output_stats = StageStats()  # images réellement inférées -> FPS par flux
+        self.capture = Capture(source, self._on_frame, self.decode_stats, realtime,
+                               name=f"capture-{stream_id}", pool=pool, **(capture_options or {}))
+        self._frame_id = 0
+        self.current = (0, 0.0)  # (n° d'image, horodatage de capture) de l'image en cours
+
+    def _on_frame(self, frame):
+        self._frame_id += 1
+        self.latest.put((self._frame_id, time.time(), frame))
+
+    def release(self, frame):
+        if self.pool is not None:
+            self.pool.release(frame)
+
+    def start(self):
+        self.capture.start()
+
+    def stop(self, timeout=2.0):
+        self.capture.stop(timeout)
+        self.latest.close()
+
+
+class MultiStreamEngine:
+    """N caméras -> un ordonnanceur qui regroupe les images en batch -> un invoke.
+
+    Si le détecteur a pu être redimensionné (detector.batch_size > 1), les images
+    disponibles sont envoyées en un seul predict_batch. Sinon on retombe sur du
+    round-robin en batch 1, en tournant le point de départ pour rester équitable.
+    Les résultats sont dessinés et renvoyés flux par flux via publish.
+    Avec des RegionPlan par flux (`regions`), ce sont les régions de toutes
+    les images retenues qui remplissent le batch.
+    """
+
+    def __init__(self, sources, get_detector, publish, get_filter=None,
+                 max_wait_ms=10.0, realtime=True, make_scheduler=None, cache=None,
+                 capture_options=None, emit_results=None, regions=None, pools=None):
+        # make_scheduler : callable() -> AdaptiveScheduler, un par flux (None = tout inférer)
+        regions = regions or [None] * len(sources)
+        pools = pools or [None] * len(sources)  # FramePool par flux (mode mémoire bornée)
+        self.workers = [CaptureWorker(i, source, realtime, make_scheduler() if make_scheduler else None,
+                                      capture_options, regions[i], pools[i])
+                        for i, source in enumerate(sources)]
+        self.get_detector = get_detector
+        self.publish = publish  # callable(frame, count, latency_ms, stream_id)
+        self.get_filter = get_filter or (lambda: DEFAULT_FILTER)
+        self.annotator = Annotator()
+        self.cache = cache  # DetectionCache optionnel, partagé par tous les flux
+        # callable(stream_id, frame_id, captured_at, frame_shape, detections) optionnel
+        self.emit_results = emit_results
+        self.max_wait = max_wait_ms / 1000.0
+        self.inference_stats = StageStats()
+        self._fill = deque(maxlen=100)  # (images utiles, places du batch)
+        self._next_stream = 0
+        self._batches = 0  # n° de batch : unité de traçage de l'ordonnanceur
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        for worker in self.workers:
+            worker.start()
+        self._thread = threading.Thread(target=self._schedule_loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for worker in self.workers:
+            worker.stop(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _collect(self, capacity):
+        """Prend au plus `capacity` images fraîches, en attendant max_wait pour remplir."""
+        batch = []
+        deadline = time.perf_counter() + self.max_wait
+        n = len(self.workers)
+        order = [self.workers[(self._next_stream + k) % n] for k in range(n)]
+        self._next_stream = (self._next_stream + 1) % n
+
+        while not self._stop.is_set():
+            taken = {worker.stream_id for worker, _ in batch}
+            for worker in order:
+                if len(batch) >= capacity:
+                    break
+                if worker.stream_id in taken:
+                    continue
+                item = worker.latest.get(timeout=0)
+                if item is not None:
+                    # Un flux au plus une fois par batch : ses métadonnées restent sur le worker
+                    frame_id, captured_at, frame = item
+                    worker.current = (frame_id, captured_at)
+                    batch.append((worker, frame))
+            if len(batch) >= capacity or time.perf_counter() >= deadline:
+                break
+            time.sleep(0.001)
+        return batch
+
+    def _schedule_loop(self):
+        while not self._stop.is_set():
+            detector = self.get_detector()
+            if detector is None:
+                self._stop.wait(0.1)
+                continue
+
+            capacity = detector.batch_size if detector.batch_size > 1 else detector.pool_size
+            batch = self._collect(min(capacity, len(self.workers)))
+            if not batch:
+                continue
+            self._batches += 1
+            TRACER.frame(self._batches)  # tracé par batch : indépendant des n° d'image des caméras
+
+            try:
+                detection_filter = self.get_filter()
+                key = (detector, detection_filter)
+                # Détections du cache valables pour ce modèle et ce seuil seulement
+                model_id = (detector.model_id, detection_filter.score_threshold)
+                # Flux statiques : pas de place dans le batch, détections suivies/réutilisées
+                infer = [worker.scheduler is None or worker.scheduler.should_infer(frame, key)
+                         for worker, frame in batch]
+                # Images déjà vues : résultat du cache, pas de place dans le batch
+                cached, keys = {}, {}
+                if self.cache is not None:
+                    for i, ((_, frame), selected) in enumerate(zip(batch, infer)):
+                        if selected:
+                            keys[i], hit = self.cache.lookup(model_id, frame)
+                            if hit is not None:
+                                cached[i] = hit
+                selected_items = [(worker, frame) for i, ((worker, frame), selected)
+                                  in enumerate(zip(batch, infer)) if selected and i not in cached]
+                threshold = detection_filter.score_threshold
+                with TRACER.span("batch_infer"):
+                    results = iter(self._infer(detector, selected_items, threshold) if selected_items else ())
+
+                for i, ((worker, frame), selected) in enumerate(zip(batch, infer)):
+                    if not selected:
+                        detections = worker.scheduler.on_skip()
+                    else:
+                        raw = cached.get(i)
+                        if raw is None:
+                            raw = next(results)
+                            if self.cache is not None:
+                                self.cache.store(model_id, keys[i], raw)
+                        with TRACER.span("filter"):
+                            detections = detection_filter.apply(raw)
+                        if worker.scheduler is not None:
+                            worker.scheduler.on_inference(detections, detections.latency_ms)
+                    with TRACER.span("draw"):
+                        count = self.annotator.draw(frame, detections)
+                    worker.output_stats.add(detections.latency_ms)
+                    with TRACER.span("publish"):
+                        self.publish(frame, count, detections.latency_ms, worker.stream_id)
+                    if self.emit_results is not None:
+                        with TRACER.span("emit_results"):
+                            self.emit_results(worker.stream_id, *worker.current, frame.shape, detections)
+            except Exception as e:
+                print(f"Erreur ordonnanceur : {e}")
+                time.sleep(0.1)
+            finally:
+                # Les diffuseurs ont pris leur référence pendant publish
+                for worker, frame in batch:
+                    worker.release(frame)
+
+    def _infer(self, detector, items, score_threshold=None):
+        start = time.perf_counter()
+        # Une image entière, ou ses régions (ROI, tuiles), par flux
+        images, spans = [], []
+        for worker, frame in items:
+            crops = worker.regions.crops(frame) if worker.regions is not None else [frame]
+            spans.append((len(images), len(crops)))
+            images.extend(crops)
+        # Au-delà de batch_size, plusieurs invokes ; en batch 1, repli round-robin
+        # sur le pool d'interpréteurs du détecteur s'il en a plusieurs
+        raw = infer_images(detector, images, score_threshold)
+        if detector.batch_size > 1:
+            self._fill.extend((min(detector.batch_size, len(images) - i), detector.batch_size)
+                              for i in range(0, len(images), detector.batch_size))
+        else:
+            self._fill.extend([(1, 1)] * len(images))
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.inference_stats.add(latency_ms)
+        results = []
+        for (worker, frame), (first, n) in zip(items, spans):
+            if worker.regions is not None:
+                with TRACER.span("merge"):
+                    results.append(worker.regions.merge(frame.shape, raw[first:first + n], latency_ms))
+            else:
+                results.append(raw[first])
+        return results
+
+    def snapshot(self):
+        fill = list(self._fill)
+        used = sum(n for n, _ in fill)
+        slots = sum(c for _, c in fill)
+        detector = self.get_detector()
+        return {
+            "mode": "batch" if detector is not None and detector.batch_size > 1 else "round_robin",
+            "batch_size": detector.batch_size if detector is not None else 0,
+            "batch_fill_rate": round(used / slots, 3) if slots else 0.0,
+            "inference": self.inference_stats.snapshot(),
+            "streams": {
+                str(worker.stream_id): {
+                    "source": worker.source,
+                    "fps": worker.output_stats.snapshot()["fps"],
+                    "decode": worker.decode_stats.snapshot(),
+                    "capture": worker.capture.snapshot(),
+                    "depth": len(worker.latest),
+                    "dropped": worker.latest.dropped,
+                    **({"adaptive": worker.scheduler.snapshot()} if worker.scheduler is not None else {}),
+                    **({"regions": worker.regions.to_dict()} if worker.regions is not None else {}),
+                }
+                for worker in self.workers
+            },
+            "dropped_frames": sum(worker.latest.dropped for worker in self.workers),
+            **({"cache": self.cache.snapshot()} if self.cache is not None else {}),
+        }
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def check_signature(detector):
+    """Vérifie que le modèle a les E/S attendues par le pipeline, sinon ValueError."""
+    shape = detector.input_details[0]['shape']
+    if len(shape) != 4 or shape[-1] != 3:
+        raise ValueError(f"Entrée attendue [N, H, W, 3], reçu {list(shape)}")
+    if -1 in (detector.boxes_idx, detector.classes_idx, detector.scores_idx):
+        raise ValueError("Sorties boxes / classes / scores introuvables")
+    n_boxes = detector.output_details[detector.boxes_idx]['shape'][-2]
+    n_scores = detector.output_details[detector.scores_idx]['shape'][-1]
+    if n_boxes != n_scores:
+        raise ValueError(f"{n_boxes} boîtes pour {n_scores} scores")
+
+
+class ModelManager:
+    """Détecteur actif + précédent, bascule à chaud sans arrêter la capture.
+
+    Le nouveau modèle est chargé, vérifié et préchauffé à côté du modèle actif,
+    puis la référence est remplacée d'un bloc : le pipeline, qui relit
+    `manager.active` à chaque image, passe au nouveau modèle à l'image suivante.
+    L'ancien reste en mémoire pour un retour arrière instantané.
+    """
+
+    def __init__(self, build_detector, warmup_frames=3, warmup_shape=(480, 640, 3),
+                 release_detector=None):
+        self.build_detector = build_detector  # callable(model_path, **options) -> EdgeDetector
+        # callable(detector) : détecteur qui n'est plus ni actif ni précédent
+        # (par défaut fermé ; le registre le garde chaud dans son cache)
+        self.release_detector = release_detector or (lambda detector: detector.close())
+        self.warmup_frames = warmup_frames
+        self.warmup_shape = warmup_shape
+        self.active = None
+        self.active_path = None
+        self.active_options = {}   # ex. {"input_size": (64, 64)} (politique automatique)
+        self.previous = None
+        self.previous_path = None
+        self.previous_options = {}
+        self.state = "idle"
+        self.last_swap = {}
+        self._swap_lock = threading.Lock()
+
+    def load(self, model_path, **options):
+        """Chargement initial (démarrage) : pas de modèle à remplacer."""
+        detector = self.build_detector(model_path, **options)
+        check_signature(detector)
+        self.active, self.active_path, self.active_options = detector, model_path, options
+
+    def _warmup(self, detector):
+        frame = np.zeros(self.warmup_shape, dtype=np.uint8)
+        latencies = [detector.predict(frame)[3] for _ in range(self.warmup_frames)]
+        # La latence "première image" mesurée ensuite doit être celle d'une vraie image
+        detector.first_frame_ms = None
+        return latencies
+
+    def swap(self, model_path, commit=None, **options):
+        """Charge + préchauffe + bascule. Bloque l'appelant, jamais la vidéo.
+
+        `commit` (callable() -> bool) est relu juste avant la bascule : False
+        l'annule, le nouveau détecteur est rendu et swap() retourne None.
+        """
+        if not self._swap_lock.acquire(blocking=False):
+            raise RuntimeError("Une bascule de modèle est déjà en cours")
+        detector = None
+        try:
+            self.state = "loading"
+            start = time.perf_counter()
+            detector = self.build_detector(model_path, **options)
+            check_signature(detector)
+            loaded = time.perf_counter()
+
+            self.state = "warming_up"
+            latencies = self._warmup(detector)
+            warmed = time.perf_counter()
+
+            if commit is not None and not commit():
+                self.release_detector(detector)
+                detector = None
+                self.state = "idle"
+                return None
+
+            # Bascule atomique : une seule affectation de référence entre deux images
+            old, old_path, old_options = self.active, self.active_path, self.active_options
+            self.active, self.active_path, self.active_options = detector, model_path, options
+            swapped = time.perf_counter()
+            detector = None  # appartient désormais au manager
+
+            # Chaque référence (actif, précédent) compte pour une utilisation
+            if self.previous is not None:
+                self.release_detector(self.previous)
+            self.previous, self.previous_path, self.previous_options = old, old_path, old_options
+            self.state = "idle"
+
+            self.last_swap = {
+                "model": os.path.basename(model_path),
+                "load_ms": round((loaded - start) * 1000, 2),
+                "warmup_ms": round((warmed - loaded) * 1000, 2),
+                "warmup_first_invoke_ms": round(latencies[0], 2) if latencies else None,
+                "swap_ms": round((swapped - warmed) * 1000, 4),
+                "total_ms": round((swapped - start) * 1000, 2),
+                "at": time.time(),
+            }
+            return self.last_swap
+        except Exception:
+            self.state = "failed"
+            if detector is not None:
+                self.release_detector(detector)
+            raise
+        finally:
+            self._swap_lock.release()
+
+    def rollback(self):
+        """Échange actif et précédent (tous deux déjà chargés et chauds)."""
+        if not self._swap_lock.acquire(blocking=False):
+            raise RuntimeError("Une bascule de modèle est déjà en cours")
+        try:
+            if self.previous is None:
+                raise RuntimeError("Aucun modèle précédent en mémoire")
+            start = time.perf_counter()
+            self.active, self.previous = self.previous, self.active
+            self.active_path, self.previous_path = self.previous_path, self.active_path
+            self.active_options, self.previous_options = self.previous_options, self.active_options
+            self.active.first_frame_ms = None
+            self.last_swap = {
+                "model": os.path.basename(self.active_path),
+                "rollback": True,
+                "swap_ms": round((time.perf_counter() - start) * 1000, 4),
+                "at": time.time(),
+            }
+            return self.last_swap
+        finally:
+            self._swap_lock.release()
+
+    def close(self):
+        for detector in (self.active, self.previous):
+            if detector is not None:
+                self.release_detector(detector)
+        self.active = self.previous = None
+
+    def snapshot(self):
+        active = self.active
+        return {
+            "state": self.state,
+            "active": os.path.basename(self.active_path) if self.active_path else None,
+            "active_options": {key: value for key, value in self.active_options.items() if value is not None},
+            "previous": os.path.basename(self.previous_path) if self.previous_path else None,
+            "first_frame_ms": getattr(active, "first_frame_ms", None),
+            "last_swap": self.last_swap,
+        }
@@ -0,0 +1,274 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from app.capture import Capture
+from app.detections import Annotator, DetectionFilter
+from app.profiling import TRACER
+
+DROP_POLICIES = ("drop_oldest", "drop_newest")
+DEFAULT_FILTER = DetectionFilter()
+
+
+class RingBuffer:
+    """File bornée entre deux étages du pipeline.
+
+    Quand la file est pleine, 'drop_oldest' jette l'élément le plus ancien
+    (on garde toujours l'image la plus fraîche), 'drop_newest' refuse le nouveau.
+    `on_drop(item)` est appelé pour chaque élément jeté ou refusé (rendre sa
+    case au FramePool).
+    """
+
+    def __init__(self, capacity=1, policy="drop_oldest", on_drop=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Politique inconnue : {policy} (attendu : {DROP_POLICIES})")
+        self.capacity = max(1, int(capacity))
+        self.policy = policy
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if self._closed:
+                self._drop(item)
+                return False
+            if len(self._items) >= self.capacity:
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    self._drop(item)
+                    return False
+                self._drop(self._items.popleft())
+            self._items.append(item)
+            self._cond.notify()
+            return True
+
+    def _drop(self, item):
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def get(self, timeout=None):
+        """Retourne le prochain élément, ou None si timeout / file fermée."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StageStats:
+    """Temps d'exécution glissants d'un étage (fenêtre des N dernières images).
+
+    Un seul thread écrit (l'étage), les lecteurs copient la fenêtre d'un coup :
+    pas de verrou sur le chemin chaud.
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)  # (horodatage, durée) ajoutés d'un bloc
+        self.frames = 0
+
+    def add(self, duration_ms):
+        self._samples.append((time.perf_counter(), duration_ms))
+        self.frames += 1
+
+    def snapshot(self):
+        samples = tuple(self._samples)
+        if not samples:
+            return {"avg_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0,
+                    **{f"p{p}_ms": 0.0 for p in self.PERCENTILES}, "fps": 0.0, "frames": self.frames}
+        timestamps, durations = np.array(samples, dtype=np.float64).T
+        span = timestamps[-1] - timestamps[0]
+        percentiles = np.percentile(durations, self.PERCENTILES)
+        return {
+            "avg_ms": round(float(durations.mean()), 2),
+            "last_ms": round(float(durations[-1]), 2),
+            "max_ms": round(float(durations.max()), 2),
+            **{f"p{p}_ms": round(float(v), 2) for p, v in zip(self.PERCENTILES, percentiles)},
+            # Débit réel de l'étage (et pas 1000 / durée)
+            "fps": round((len(samples) - 1) / span, 2) if span > 0 else 0.0,
+            "frames": self.frames,
+        }
+
+
+class VisionPipeline:
+    """Pipeline en 3 étages : Décodage -> Inférence -> Dessin.
+
+    Chaque étage tourne dans son propre thread, reliés par des RingBuffer bornés.
+    Le décodage est confié à app.capture (fichier, webcam, flux réseau, dossier
+    d'images ou clip pré-décodé) ; `capture_options` est passé à open_source.
+    Les images décodées pendant que l'inférence est occupée sont écrasées
+    (drop_oldest) au lieu de s'accumuler. Avec un FramePool (`pool`), chaque
+    image est décodée dans une case du pool, qui y retourne quand l'image est
+    jetée par une file ou publiée (le diffuseur garde sa propre référence).
+    """
+
+    STAGES = ("decode", "inference", "annotate")
+
+    def __init__(self, source, get_detector, publish, queue_size=1,
+                 drop_policy="drop_oldest", get_filter=None, realtime=True, scheduler=None,
+                 cache=None, capture_options=None, emit_results=None, regions=None, pool=None):
+        self.source = source
+        self.get_detector = get_detector  # callable -> EdgeDetector courant (ou None)
+        self.publish = publish            # callable(frame, count, latency_ms)
+        # callable -> DetectionFilter courant (seuil, classes, NMS réglables à chaud)
+        self.get_filter = get_filter or (lambda: DEFAULT_FILTER)
+        self.annotator = Annotator()
+        self.realtime = realtime          # Fichier vidéo : on décode à la cadence native
+        self.scheduler = scheduler        # AdaptiveScheduler optionnel (saut d'images)
+        self.cache = cache                # DetectionCache optionnel (images déjà vues)
+        self.regions = regions            # RegionPlan optionnel (ROI, tuiles)
+        # callable(stream_id, frame_id, captured_at, frame_shape, detections) optionnel
+        self.emit_results = emit_results
+        self.pool = pool                  # FramePool optionnel (mode mémoire bornée)
+        self.decode_queue = RingBuffer(queue_size, drop_policy, self._drop_item)
+        self.annotate_queue = RingBuffer(queue_size, drop_policy, self._drop_item)
+        self.stats = {name: StageStats() for name in self.STAGES}
+        self.capture = Capture(source, self._on_frame, self.stats["decode"], realtime,
+                               name="pipeline-decode", pool=pool, **(capture_options or {}))
+        self._frame_id = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self.capture.start()
+        targets = (self._inference_loop, self._annotate_loop)
+        self._threads = [
+            threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            for name, target in zip(self.STAGES[1:], targets)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self.capture.stop(timeout)
+        self.decode_queue.close()
+        self.annotate_queue.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def is_running(self):
+        return self.capture.is_alive() or any(thread.is_alive() for thread in self._threads)
+
+    def _release(self, frame):
+        if self.pool is not None:
+            self.pool.release(frame)
+
+    def _drop_item(self, item):
+        self._release(item[2])  # (n° d'image, horodatage, image, ...)
+
+    # --- Étage 1 : Décodage (thread app.capture.Capture) ---
+    def _on_frame(self, frame):
+        self._frame_id += 1
+        self.decode_queue.put((self._frame_id, time.time(), frame))
+
+    # --- Étage 2 : Inférence ---
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            item = self.decode_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            frame_id, captured_at, frame = item
+            detector = self.get_detector()
+            if detector is None:
+                self._release(frame)
+                continue
+            TRACER.frame(frame_id)
+            try:
+                start = time.perf_counter()
+                detections = self._detect(detector, frame)
+                self.stats["inference"].add((time.perf_counter() - start) * 1000)
+                self.annotate_queue.put((frame_id, captured_at, frame, detections))
+            except Exception as e:
+                self._release(frame)
+                print(f"Erreur inférence : {e}")
+                time.sleep(0.1)
+
+    def _run_model(self, detector, frame, score_threshold=None):
+        run = self.regions.detect if self.regions is not None else None
+        if self.cache is not None:
+            return self.cache.detect(detector, frame, run, score_threshold)
+        if run is not None:
+            return run(detector, frame, score_threshold)
+        return detector.detect(frame, score_threshold)
+
+    def _detect(self, detector, frame):
+        detection_filter = self.get_filter()
+        scheduler = self.scheduler
+        if scheduler is not None:
+            with TRACER.span("motion"):
+                infer = scheduler.should_infer(frame, (detector, detection_filter))
+            if not infer:
+                return scheduler.on_skip()
+        with TRACER.span("model"):
+            # Seuil appliqué dès la lecture des sorties (domaine entier si modèle quantifié)
+            raw = self._run_model(detector, frame, detection_filter.score_threshold)
+        with TRACER.span("filter"):
+            detections = detection_filter.apply(raw)
+        if scheduler is None:
+            return detections
+        return scheduler.on_inference(detections, detections.latency_ms)
+
+    # --- Étage 3 : Dessin + publication ---
+    def _annotate_loop(self):
+        while not self._stop.is_set():
+            item = self.annotate_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            frame_id, captured_at, frame, detections = item
+            TRACER.frame(frame_id)
+            try:
+                start = time.perf_counter()
+                with TRACER.span("draw"):
+                    count = self.annotator.draw(frame, detections)
+                # La frame appartient au pipeline : pas besoin de copie avant publication
+                with TRACER.span("publish"):
+                    self.publish(frame, count, detections.latency_ms)
+                if self.emit_results is not None:
+                    with TRACER.span("emit_results"):
+                        self.emit_results(0, frame_id, captured_at, frame.shape, detections)
+                self.stats["annotate"].add((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                print(f"Erreur dessin : {e}")
+                time.sleep(0.1)
+            finally:
+                self._release(frame)  # le diffuseur a pris sa référence pendant publish
+
+    def snapshot(self):
+        """Timings par étage + état des files pour /metrics."""
+        stages = {name: stats.snapshot() for name, stats in self.stats.items()}
+        snapshot = {
+            "stages": stages,
+            # L'étage le plus lent est celui qui plafonne les FPS
+            "bottleneck": max(stages, key=lambda name: stages[name]["avg_ms"]),
+            "queues": {
+                "decode": {"depth": len(self.decode_queue), "dropped": self.decode_queue.dropped},
+                "annotate": {"depth": len(self.annotate_queue), "dropped": self.annotate_queue.dropped},
+            },
+            "dropped_frames": self.decode_queue.dropped + self.annotate_queue.dropped,
+            "capture": self.capture.snapshot(),
+        }
+        if self.scheduler is not None:
+            snapshot["adaptive"] = self.scheduler.snapshot()
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.snapshot()
+        if self.regions is not None:
+            snapshot["regions"] = self.regions.to_dict()
+        return snapshot
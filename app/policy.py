@@ -0,0 +1,300 @@
+import os
+import threading
+import time
+from collections import deque
+
+from app.pipeline import StageStats
+
+
+def parse_variants(value):
+    """'model_float32,model_int8,model_int8@64x64' -> variantes, de la plus précise à la plus rapide."""
+    variants = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, size = item.partition("@")
+        input_size = tuple(int(v) for v in size.lower().split("x")) if size else None
+        if input_size is not None and len(input_size) != 2:
+            raise ValueError(f"Résolution invalide : {item} (attendu modele@HxW)")
+        if not model.endswith(".tflite"):
+            model += ".tflite"
+        variants.append({"name": item, "model": model, "input_size": input_size})
+    return variants
+
+
+class CpuMeter:
+    """Charge CPU du process (tous threads) entre deux appels, rapportée aux cœurs disponibles."""
+
+    def __init__(self):
+        cores = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else range(os.cpu_count() or 1)
+        self.cores = max(1, len(cores))
+        self._last = (time.perf_counter(), time.process_time())
+
+    def sample(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        last_wall, last_cpu = self._last
+        self._last = (wall, cpu)
+        if wall <= last_wall:
+            return 0.0
+        return (cpu - last_cpu) / (wall - last_wall) / self.cores
+
+
+class ModelPolicy:
+    """Choix automatique modèle / résolution d'entrée à partir d'un SLO de latence.
+
+    Les variantes vont de la plus précise à la plus rapide. Toutes les
+    `interval` secondes, la latence p95 des images publiées depuis la dernière
+    bascule, le FPS réel et la charge CPU sont comparés au SLO :
+
+    - SLO dépassé (p95, FPS cible ou CPU saturé) `downgrade_after` fois de
+      suite -> variante plus rapide ;
+    - large marge (p95 < (1 - margin) x SLO, CPU bas) `upgrade_after` fois de
+      suite -> variante plus précise, sauf si elle a déjà été vue hors SLO
+      récemment (`memory_s`).
+
+    Après une bascule, rien ne bouge pendant `cooldown_s` ni avant
+    `min_samples` images : c'est cette hystérésis qui évite l'oscillation.
+    La bascule passe par `switch(variant, commit)` (ModelManager + registre :
+    les variantes déjà utilisées sont encore chaudes). Le chargement dure
+    plusieurs secondes : il se fait hors du verrou, que adopt() / disable()
+    n'attendent donc jamais. `commit()` est relu juste avant la bascule : une
+    reprise en main pendant le chargement (OTA, rollback, désactivation)
+    l'annule.
+    """
+
+    def __init__(self, variants, switch, target_fps=None, latency_ms=None, get_fps=None,
+                 interval=2.0, downgrade_after=2, upgrade_after=5, cooldown_s=10.0, margin=0.3,
+                 cpu_high=0.9, cpu_low=0.6, min_samples=30, memory_s=300.0, enabled=True):
+        if not variants:
+            raise ValueError("Aucune variante de modèle pour la politique")
+        self.variants = variants
+        self.switch = switch              # callable(variant, commit) -> False si annulée, lève en cas d'échec
+        self.get_fps = get_fps            # callable() -> FPS réel publié (None = ignoré)
+        self.interval = interval
+        self.downgrade_after = downgrade_after
+        self.upgrade_after = upgrade_after
+        self.cooldown_s = cooldown_s
+        self.margin = margin
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.min_samples = min_samples
+        self.memory_s = memory_s
+        self.enabled = enabled
+        self.latency_ms = None            # SLO explicite (None = dérivé de target_fps)
+        self.configure(target_fps, latency_ms)
+        self.level = None                 # index de la variante active (None = hors politique)
+        self.switches = 0
+        self.state = {}
+        self.decisions = deque(maxlen=50)
+        self._latency = StageStats(window=300)
+        self._observed = {}               # index -> (p95 observé, instant)
+        self._failed = {}                 # index -> instant de l'échec de chargement
+        self._streak = ("hold", 0)
+        self._last_switch = 0.0
+        self._epoch = 0                   # incrémenté à chaque reprise en main (adopt, disable)
+        self._cpu = CpuMeter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, target_fps=None, latency_ms=None):
+        """SLO : latence p95 explicite, sinon budget d'une image à target_fps.
+
+        Une latence explicite déjà réglée est conservée si `latency_ms` est omis.
+        """
+        latency_ms = latency_ms or self.latency_ms
+        if not target_fps and not latency_ms:
+            raise ValueError("SLO manquant : target_fps ou latency_ms")
+        self.target_fps = target_fps
+        self.latency_ms = latency_ms
+        self.slo_ms = latency_ms or 1000.0 / target_fps
+
+    def record(self, latency_ms):
+        """Chemin chaud (publication d'une image) : un ajout dans une fenêtre."""
+        self._latency.add(latency_ms)
+
+    def adopt(self, model_path, options):
+        """Aligne la politique sur le modèle effectivement actif (démarrage, OTA manuelle)."""
+        name = os.path.basename(model_path) if model_path else None
+        input_size = options.get("input_size")
+        with self._lock:
+            self.level = next((i for i, v in enumerate(self.variants)
+                               if v["model"] == name and v["input_size"] == input_size), None)
+            self._epoch += 1
+            self._reset_window()
+
+    def _reset_window(self):
+        self._latency = StageStats(window=300)
+        self._streak = ("hold", 0)
+        self._last_switch = time.monotonic()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="model-policy", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.evaluate()
+            except Exception as e:
+                print(f"Erreur politique modèle : {e}")
+
+    def evaluate(self):
+        """Une évaluation : mesure, décide, bascule éventuellement. Retourne l'action."""
+        with self._lock:
+            decision = self._decide()
+            if isinstance(decision, str):
+                return decision
+            epoch = self._epoch
+        return self._apply(*decision, epoch)
+
+    def _decide(self):
+        """Action finale, ou (variante cible, action, raison) à appliquer hors verrou."""
+        cpu = self._cpu.sample()
+        stats = self._latency.snapshot()
+        fps = self.get_fps() if self.get_fps is not None else None
+        # Fenêtre remise à zéro à chaque bascule : que des images de la variante active
+        self.state = {"p95_ms": stats["p95_ms"], "samples": stats["frames"],
+                      "fps": fps, "cpu": round(cpu, 3)}
+        if not self.enabled:
+            return "disabled"
+        if self.level is None:
+            level = next((i for i in range(len(self.variants)) if not self._unavailable(i)), None)
+            if level is None:
+                return "hold"
+            return level, "upgrade", "modèle actif hors des variantes"
+
+        enough = self.state["samples"] >= self.min_samples
+        if enough:
+            self._observed[self.level] = (stats["p95_ms"], time.monotonic())
+        if not enough or time.monotonic() - self._last_switch < self.cooldown_s:
+            return "hold"
+
+        reason = self._violation(stats["p95_ms"], fps, cpu)
+        if reason is not None:
+            action = "downgrade"
+        elif self._headroom(stats["p95_ms"], cpu):
+            action = "upgrade"
+            reason = (f"p95 {stats['p95_ms']:.2f} ms < {(1 - self.margin) * self.slo_ms:.2f} ms "
+                      f"et CPU {cpu:.0%}")
+        else:
+            self._streak = ("hold", 0)
+            return "hold"
+
+        previous, count = self._streak
+        count = count + 1 if previous == action else 1
+        self._streak = (action, count)
+        if count < (self.downgrade_after if action == "downgrade" else self.upgrade_after):
+            return "hold"
+        target = self._next_level(action)
+        if target is None:
+            return "hold"  # déjà à l'extrême : rien de mieux à proposer
+        return target, action, f"{reason} ({count} évaluations de suite)"
+
+    def _violation(self, p95_ms, fps, cpu):
+        if p95_ms > self.slo_ms:
+            return f"p95 {p95_ms:.2f} ms > SLO {self.slo_ms:.2f} ms"
+        if self.target_fps and fps is not None and fps < 0.9 * self.target_fps:
+            return f"{fps:.1f} FPS < cible {self.target_fps:.1f}"
+        if cpu > self.cpu_high:
+            return f"CPU {cpu:.0%} > {self.cpu_high:.0%}"
+        return None
+
+    def _headroom(self, p95_ms, cpu):
+        return p95_ms < (1 - self.margin) * self.slo_ms and cpu < self.cpu_low
+
+    def _next_level(self, action):
+        step = 1 if action == "downgrade" else -1
+        level = self.level + step
+        while 0 <= level < len(self.variants):
+            if self._unavailable(level):
+                level += step
+                continue
+            if action == "upgrade":
+                # Variante plus précise déjà vue hors marge récemment : on n'y retourne pas
+                seen = self._observed.get(level)
+                if seen is not None and time.monotonic() - seen[1] < self.memory_s \
+                        and seen[0] > (1 - self.margin) * self.slo_ms:
+                    return None
+            return level
+        return None
+
+    def _unavailable(self, level):
+        """Échec de chargement récent (un OTA concurrent peut aussi faire échouer la bascule)."""
+        failed_at = self._failed.get(level)
+        return failed_at is not None and time.monotonic() - failed_at < self.memory_s
+
+    def _apply(self, level, action, reason, epoch):
+        """Bascule hors verrou ; annulée si la main a été reprise pendant le chargement."""
+        variant = self.variants[level]
+        with self._lock:
+            decision = {
+                "at": time.time(),
+                "action": action,
+                "from": self.variants[self.level]["name"] if self.level is not None else None,
+                "to": variant["name"],
+                "reason": reason,
+                **self.state,
+            }
+
+        def commit():
+            with self._lock:
+                return self.enabled and self._epoch == epoch
+
+        try:
+            switched = self.switch(variant, commit)
+        except Exception as e:
+            with self._lock:
+                self._failed[level] = time.monotonic()
+                decision.update(action="failed", reason=f"{reason} ; échec : {e}")
+                self.decisions.append(decision)
+            print(f"⚠️ Politique : {variant['name']} indisponible ({e})")
+            return "failed"
+        with self._lock:
+            if switched is False:
+                decision.update(action="cancelled", reason=f"{reason} ; annulée : reprise en main manuelle")
+                self.decisions.append(decision)
+                return "cancelled"
+            if self._epoch == epoch:  # sinon adopt() a déjà aligné le niveau sur le modèle actif
+                self.level = level
+                self._reset_window()
+            self.switches += 1
+            self.decisions.append(decision)
+        print(f"🎯 Politique : {decision['from']} -> {variant['name']} ({reason})")
+        return action
+
+    def disable(self, reason):
+        """Reprise en main manuelle (OTA, rollback) : la politique ne bascule plus.
+
+        Une bascule en cours de chargement est annulée (commit() rend False).
+        """
+        with self._lock:
+            self._epoch += 1
+            if self.enabled:
+                self.enabled = False
+                self.decisions.append({"at": time.time(), "action": "disabled", "reason": reason})
+
+    def snapshot(self, decisions=1):
+        current = self.variants[self.level]["name"] if self.level is not None else None
+        return {
+            "enabled": self.enabled,
+            "variant": current,
+            "level": self.level,
+            "variants": [v["name"] for v in self.variants],
+            "unavailable": [v["name"] for i, v in enumerate(self.variants) if self._unavailable(i)],
+            "slo_ms": round(self.slo_ms, 2),
+            "slo_explicit": self.latency_ms is not None,
+            "target_fps": self.target_fps,
+            "observed": self.state,
+            "switches": self.switches,
+            "decisions": list(self.decisions)[-decisions:] if decisions else [],
+        }
@@ -0,0 +1,367 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+PROFILE_MODES = ("sample", "cprofile")
+# Fonctions sur lesquelles un thread attend (file vide, Event, select) : relevé « inactif »
+IDLE_FUNCTIONS = {"threading.py:wait", "threading.py:_wait_for_tstate_lock", "queue.py:get",
+                  "selectors.py:select", "thread.py:_worker", "pipeline.py:get"}
+
+
+class _NullSpan:
+    """Span d'une image non tracée : un seul objet réutilisé, rien n'est mesuré."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "frame", "start")
+
+    def __init__(self, tracer, name, frame):
+        self.tracer = tracer
+        self.name = name
+        self.frame = frame
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter() - self.start, self.frame)
+        return False
+
+
+class Tracer:
+    """Spans nommés sur le chemin chaud (décodage, redimensionnement, normalisation, invoke...).
+
+    Seules les images échantillonnées sont tracées : une sur `sample_every`
+    (0 = désactivé). Chaque thread appelle frame(n) au début de son travail
+    et le numéro est gardé par thread : la décision ne dépend que du numéro
+    reçu. Dans VisionPipeline, le décodage numérote ses lectures réussies et
+    les étages inférence et dessin reçoivent le frame_id qui en découle : les
+    trois threads tracent les mêmes images. En multiflux, chaque caméra
+    numérote ses propres lectures et l'ordonnanceur passe des numéros de
+    batch : ses spans sont regroupés par batch, sans lien avec les images
+    tracées au décodage. Désactivé, frame() et span() ne coûtent qu'un test
+    d'attribut (span rend un objet vide partagé).
+
+    Les spans fermés vont dans un anneau borné (export Chrome trace) et dans
+    une fenêtre de durées par nom (répartition du temps par sous-étape dans
+    /metrics). Une capture /debug/profile force le traçage de toutes les
+    images le temps de la mesure.
+    """
+
+    def __init__(self, sample_every=0, capacity=4096, window=200):
+        self.sample_every = sample_every
+        self.window = window
+        self.enabled = False
+        self.recorded = 0
+        self._forced = 0                      # captures en cours
+        self._events = deque(maxlen=capacity)  # (nom, thread, début, durée, n° d'image)
+        self._durations = {}                  # nom -> dernières durées (s)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._capture = None                  # Profiler en mode cprofile (profileurs par thread)
+        self._origin = time.perf_counter()
+        self.configure(sample_every, capacity)
+
+    def configure(self, sample_every=None, capacity=None):
+        with self._lock:
+            if sample_every is not None:
+                if sample_every < 0:
+                    raise ValueError(f"Échantillonnage invalide : {sample_every} (0 = désactivé)")
+                self.sample_every = int(sample_every)
+            if capacity is not None and capacity != self._events.maxlen:
+                self._events = deque(self._events, maxlen=max(1, int(capacity)))
+            self.enabled = self.sample_every > 0 or self._forced > 0
+
+    def frame(self, frame_id):
+        """Début du travail du thread courant sur l'image (ou le batch) n° `frame_id` : tracé ou non.
+
+        Le numéro n'est retenu que pour ce thread ; rien ne le relie à celui
+        d'un autre thread, sauf si l'appelant passe le même (frame_id du pipeline).
+        """
+        if not self.enabled:
+            return
+        local = self._local
+        every = self.sample_every
+        traced = self._forced > 0 or (every > 0 and frame_id % every == 0)
+        local.frame = frame_id if traced else None
+        if self._capture is not None or getattr(local, "profiler", None) is not None:
+            self._profile_thread(local)
+
+    def span(self, name):
+        """`with TRACER.span("invoke"):` ; mesuré seulement si l'image courante est tracée."""
+        if not self.enabled:
+            return _NULL_SPAN
+        frame = getattr(self._local, "frame", None)
+        if frame is None:
+            return _NULL_SPAN
+        return _Span(self, name, frame)
+
+    def current(self):
+        """N° de l'image tracée par ce thread (None sinon), à transmettre aux threads d'un pool."""
+        return getattr(self._local, "frame", None) if self.enabled else None
+
+    def adopt(self, frame):
+        """Le thread courant travaille pour l'image `frame` (None = non tracée) d'un autre thread."""
+        self._local.frame = frame
+
+    def add(self, name, start, duration, frame=None):
+        """Span déjà mesuré (perf_counter de début, durée en secondes)."""
+        self._events.append((name, threading.get_ident(), start, duration, frame))
+        durations = self._durations.get(name)
+        if durations is None:
+            durations = self._durations.setdefault(name, deque(maxlen=self.window))
+        durations.append(duration)
+        self.recorded += 1
+
+    # --- Captures /debug/profile ---
+    def _begin_capture(self, capture):
+        with self._lock:
+            self._forced += 1
+            if capture.mode == "cprofile":
+                self._capture = capture
+            self.enabled = True
+
+    def _release_threads(self, capture):
+        """Plus de nouveaux profileurs ; les threads attachés se détachent à leur prochaine image."""
+        with self._lock:
+            if self._capture is capture:
+                self._capture = None
+
+    def _end_capture(self, capture):
+        self._release_threads(capture)
+        with self._lock:
+            self._forced -= 1
+            self.enabled = self.sample_every > 0 or self._forced > 0
+
+    def _profile_thread(self, local):
+        """cProfile ne suit que le thread qui l'active : chaque étage s'attache lui-même."""
+        capture = self._capture
+        profiler = getattr(local, "profiler", None)
+        if profiler is not None and profiler[0] is not capture:
+            # Capture terminée (ou remplacée) : on se détache à la première image suivante
+            profiler[1].disable()
+            profiler[0].detached(profiler[1])
+            local.profiler = profiler = None
+        if profiler is None and capture is not None and not capture.stopped:
+            cprofile = cProfile.Profile()
+            capture.attached(cprofile)
+            local.profiler = (capture, cprofile)
+            cprofile.enable()
+
+    # --- Exports ---
+    def chrome_trace(self, since=None, metadata=None):
+        """Spans au format Chrome trace (chrome://tracing, ui.perfetto.dev), en µs."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        pid = os.getpid()
+        events, threads = [], set()
+        for name, tid, start, duration, frame in list(self._events):
+            if since is not None and start < since:
+                continue
+            threads.add(tid)
+            events.append({"name": name, "cat": "edge", "ph": "X", "pid": pid, "tid": tid,
+                           "ts": round((start - self._origin) * 1e6, 1),
+                           "dur": round(duration * 1e6, 1), "args": {"frame": frame}})
+        events.extend({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                       "args": {"name": names.get(tid, str(tid))}} for tid in sorted(threads))
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": metadata or {}}
+
+    def spans(self):
+        """Durées par span sur les dernières images tracées (même forme que StageStats)."""
+        summary = {}
+        for name, durations in list(self._durations.items()):
+            samples = np.array(tuple(durations), dtype=np.float64) * 1000
+            if not len(samples):
+                continue
+            p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+            summary[name] = {"avg_ms": round(float(samples.mean()), 3), "p50_ms": round(float(p50), 3),
+                             "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+                             "max_ms": round(float(samples.max()), 3), "frames": len(samples)}
+        return summary
+
+    def snapshot(self):
+        return {
+            "sample_every": self.sample_every,
+            "capturing": self._forced > 0,
+            "spans_recorded": self.recorded,
+            "buffered": len(self._events),
+            "spans": self.spans(),
+        }
+
+
+# Traceur unique du process, configuré par app.main (PROFILE_SAMPLE_EVERY)
+TRACER = Tracer()
+
+
+class Profiler:
+    """Capture à la demande : piles échantillonnées ou cProfile, plus la trace des images.
+
+    - "sample" : un thread relève toutes les `interval` secondes la pile de
+      chaque thread (sys._current_frames). Aucune coopération des threads
+      n'est nécessaire, le pipeline déjà lancé est vu tel quel ; un thread
+      en attente apparaît sur son wait(), le code natif (invoke, cv2) sur
+      l'appel Python qui l'a lancé ;
+    - "cprofile" : chaque étage du pipeline active son propre cProfile à sa
+      prochaine image (cProfile ne voit que le thread qui l'active) ; temps
+      exacts par fonction, au prix d'un surcoût notable pendant la capture.
+
+    Pendant la capture, toutes les images sont tracées (spans -> Chrome trace).
+    """
+
+    def __init__(self, tracer=TRACER, mode="sample", interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Mode de profilage inconnu : {mode} (attendu : {PROFILE_MODES})")
+        self.tracer = tracer
+        self.mode = mode
+        self.interval = interval
+        self.stopped = False
+        self.started_at = None
+        self.duration = 0.0
+        self.samples = 0
+        self._stacks = Counter()  # (thread, pile de fonctions) -> échantillons
+        self._profilers = []      # cProfile.Profile détachés (un par thread)
+        self._attached = 0
+        self._end_pending = False
+        self._detached = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.tracer._begin_capture(self)
+        if self.mode == "sample":
+            self._thread = threading.Thread(target=self._sample_loop, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self, grace=1.0):
+        """Fin de la capture ; en cprofile, attend que les threads se détachent (au plus `grace` s).
+
+        Un thread resté attaché (aucune image depuis) garde le traçage forcé
+        jusqu'à sa prochaine image : sinon son profileur ne serait jamais coupé.
+        """
+        self.stopped = True
+        self.duration = time.perf_counter() - self.started_at
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.mode == "cprofile":
+            self.tracer._release_threads(self)
+            with self._detached:
+                if not self._detached.wait_for(lambda: self._attached == 0, grace):
+                    self._end_pending = True
+                    return
+        self.tracer._end_capture(self)
+
+    # --- cProfile (appelé depuis les threads du pipeline) ---
+    def attached(self, profiler):
+        with self._detached:
+            self._attached += 1
+
+    def detached(self, profiler):
+        profiler.create_stats()
+        with self._detached:
+            self._profilers.append(profiler)
+            self._attached -= 1
+            self._detached.notify_all()
+            end = self._end_pending and self._attached == 0
+            if end:
+                self._end_pending = False
+        if end:
+            self.tracer._end_capture(self)
+
+    # --- Échantillonnage de piles ---
+    def _sample_loop(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for tid, frame in frames.items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.reverse()
+                self._stacks[(names.get(tid, str(tid)), tuple(stack))] += 1
+            self.samples += 1
+
+    def _sample_report(self, top):
+        """Fonctions des relevés actifs ; les attentes (IDLE_FUNCTIONS) ne comptent que par thread."""
+        own, total = Counter(), Counter()
+        busy = Counter()
+        for (thread, stack), n in self._stacks.items():
+            busy[thread] += 0
+            if not stack or stack[-1] in IDLE_FUNCTIONS:
+                continue
+            busy[thread] += n
+            own[stack[-1]] += n
+            for function in set(stack):
+                total[function] += n
+        ticks = max(1, self.samples)
+        return {
+            "interval_ms": round(self.interval * 1000, 2),
+            "samples": self.samples,
+            # Part du temps où le thread travaillait (ou attendait du code natif)
+            "threads_busy": {name: round(n / ticks, 3) for name, n in busy.most_common()},
+            "top_self": [{"function": f, "samples": n, "ratio": round(n / ticks, 3)}
+                         for f, n in own.most_common(top)],
+            "top_total": [{"function": f, "samples": n, "ratio": round(n / ticks, 3)}
+                          for f, n in total.most_common(top)],
+            # Format « folded » : flamegraph.pl, speedscope, inferno
+            "folded": [f"{thread};{';'.join(stack)} {n}"
+                       for (thread, stack), n in self._stacks.most_common()],
+        }
+
+    def _cprofile_report(self, top):
+        with self._detached:
+            profilers = list(self._profilers)
+            pending = self._attached
+        if not profilers:
+            return {"threads": 0, "pending_threads": pending, "functions": []}
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+        return {
+            "threads": len(profilers),
+            "pending_threads": pending,  # threads sans image depuis la fin de la capture
+            "total_s": round(stats.total_tt, 4),
+            "functions": [{"function": f"{os.path.basename(filename)}:{line}({name})", "calls": calls,
+                           "self_ms": round(own_s * 1000, 3), "total_ms": round(cumulative_s * 1000, 3)}
+                          for (filename, line, name), (_, calls, own_s, cumulative_s, _) in rows],
+        }
+
+    def report(self, top=30):
+        profile = self._sample_report(top) if self.mode == "sample" else self._cprofile_report(top)
+        return {
+            "mode": self.mode,
+            "seconds": round(self.duration, 3),
+            "profile": profile,
+            "spans": self.tracer.spans(),
+            "trace_events": sum(1 for event in list(self.tracer._events) if event[2] >= self.started_at),
+        }
+
+    def chrome_trace(self, metadata=None):
+        """Spans des images de la capture, le rapport dans otherData."""
+        return self.tracer.chrome_trace(since=self.started_at, metadata=metadata)
@@ -0,0 +1,147 @@
+import time
+
+import numpy as np
+
+from app.detections import Detections
+from app.profiling import TRACER
+
+
+def parse_dims(value):
+    """'2x3' -> (2, 3) ; vide -> None. Sert aux grilles de tuiles et aux résolutions HxW."""
+    if not value or not value.strip():
+        return None
+    dims = tuple(int(v) for v in value.lower().split("x"))
+    if len(dims) != 2 or min(dims) < 1:
+        raise ValueError(f"Dimensions invalides : {value} (attendu AxB)")
+    return dims
+
+
+def parse_rois(value):
+    """'0,0,0.5,1;0.5,0,1,1' -> [(x1, y1, x2, y2), ...] en fractions de l'image."""
+    rois = []
+    for item in (value or "").split(";"):
+        if not item.strip():
+            continue
+        x1, y1, x2, y2 = (float(v) for v in item.split(","))
+        if not (0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1):
+            raise ValueError(f"ROI invalide : {item} (fractions x1,y1,x2,y2 avec x1 < x2, y1 < y2)")
+        rois.append((x1, y1, x2, y2))
+    return rois or None
+
+
+def tile_windows(area, grid, overlap):
+    """Découpe `area` (x1, y1, x2, y2 en pixels) en rows x cols tuiles qui se recouvrent de `overlap`."""
+    x1, y1, x2, y2 = area
+    rows, cols = grid
+    windows = []
+    for axis_start, axis_end, count in ((y1, y2, rows), (x1, x2, cols)):
+        size = (axis_end - axis_start) / (count - (count - 1) * overlap)
+        step = size * (1 - overlap)
+        windows.append([(axis_start + round(i * step), min(axis_end, axis_start + round(i * step + size)))
+                        for i in range(count)])
+    return [(left, top, right, bottom) for top, bottom in windows[0] for left, right in windows[1]]
+
+
+class RegionPlan:
+    """Inférence sur des régions de l'image au lieu de l'image entière réduite.
+
+    - ROI statiques (`rois`, fractions x1,y1,x2,y2) : seules ces zones sont
+      passées au modèle, à leur propre échelle ; le reste de l'image ne coûte rien ;
+    - tuiles (`grid` = (lignes, colonnes), recouvrement `overlap`) : chaque zone
+      est découpée pour que les petits objets lointains gardent assez de
+      pixels à la taille d'entrée du modèle. Seules les images d'au moins
+      `min_width` pixels de large sont découpées. `full_view` ajoute la zone
+      entière réduite, pour les grands objets coupés par les tuiles.
+
+    Toutes les régions d'une image partent en un batch (detect_batch si le
+    détecteur a été redimensionné, sinon le pool). Les boîtes sont remises
+    en coordonnées de l'image puis fusionnées par NMS ; les détections de
+    score inférieur à `score_floor` sont écartées avant la fusion.
+    """
+
+    def __init__(self, rois=None, grid=None, overlap=0.2, min_width=0, full_view=True,
+                 nms_iou=0.5, score_floor=0.01):
+        if not 0 <= overlap < 1:
+            raise ValueError(f"Recouvrement invalide : {overlap} (attendu 0 <= overlap < 1)")
+        self.rois = rois
+        self.grid = grid
+        self.overlap = overlap
+        self.min_width = min_width
+        self.full_view = full_view
+        self.nms_iou = nms_iou
+        self.score_floor = score_floor
+        self._windows = {}  # (h, w) -> régions en pixels, calculées une fois par résolution
+
+    def count(self):
+        """Régions par image quand le découpage s'applique (taille de batch à prévoir)."""
+        per_area = 1
+        if self.grid is not None:
+            per_area = self.grid[0] * self.grid[1] + (1 if self.full_view else 0)
+        return per_area * (len(self.rois) if self.rois else 1)
+
+    def windows(self, frame_shape):
+        h, w = frame_shape[:2]
+        windows = self._windows.get((h, w))
+        if windows is None:
+            areas = [(round(x1 * w), round(y1 * h), round(x2 * w), round(y2 * h))
+                     for x1, y1, x2, y2 in (self.rois or [(0.0, 0.0, 1.0, 1.0)])]
+            tiled = self.grid is not None and w >= self.min_width
+            windows = []
+            for area in areas:
+                if not tiled or self.full_view:
+                    windows.append(area)
+                if tiled:
+                    windows.extend(tile_windows(area, self.grid, self.overlap))
+            self._windows[(h, w)] = windows
+        return windows
+
+    def crops(self, frame):
+        """Vues (sans copie) sur les régions : cv2.resize lit directement dedans."""
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.windows(frame.shape)]
+
+    def merge(self, frame_shape, results, latency_ms):
+        """Détections de chaque région -> une seule liste en coordonnées de l'image."""
+        h, w = frame_shape[:2]
+        windows = self.windows(frame_shape)
+        if windows == [(0, 0, w, h)]:
+            raw = results[0]
+            return Detections(raw.boxes, raw.classes, raw.scores, latency_ms)
+        boxes, classes, scores = [], [], []
+        for (x1, y1, x2, y2), raw in zip(windows, results):
+            # [ymin, xmin, ymax, xmax] relatifs à la région -> relatifs à l'image
+            scale = np.array([(y2 - y1) / h, (x2 - x1) / w] * 2, dtype=np.float32)
+            offset = np.array([y1 / h, x1 / w] * 2, dtype=np.float32)
+            keep = raw.scores >= self.score_floor
+            boxes.append(raw.boxes[keep] * scale + offset)
+            classes.append(raw.classes[keep])
+            scores.append(raw.scores[keep])
+        merged = Detections(np.concatenate(boxes), np.concatenate(classes), np.concatenate(scores), latency_ms)
+        return merged.nms(self.nms_iou)
+
+    def detect(self, detector, frame, score_threshold=None):
+        """Équivalent de detector.detect(frame, score_threshold), région par région."""
+        start = time.perf_counter()
+        results = infer_images(detector, self.crops(frame), score_threshold)
+        with TRACER.span("merge"):
+            return self.merge(frame.shape, results, (time.perf_counter() - start) * 1000)
+
+    def to_dict(self):
+        return {
+            "rois": [list(roi) for roi in self.rois] if self.rois else None,
+            "grid": list(self.grid) if self.grid else None,
+            "overlap": self.overlap,
+            "min_width": self.min_width,
+            "full_view": self.full_view,
+            "nms_iou": self.nms_iou,
+            "regions_per_frame": self.count(),
+        }
+
+
+def infer_images(detector, images, score_threshold=None):
+    """Detections de chaque image : batchs de detector.batch_size, sinon répartition sur le pool."""
+    if detector.batch_size > 1:
+        results = []
+        for i in range(0, len(images), detector.batch_size):
+            results.extend(detector.detect_batch(images[i:i + detector.batch_size], score_threshold))
+        return results
+    return detector.detect_many(images, score_threshold)
@@ -0,0 +1,282 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from app.inference import EdgeDetector, model_digest, tflite_module
+
+
+def read_signature(model_path):
+    """Entrées / sorties déclarées par le modèle (sans allouer les tenseurs)."""
+    interpreter = tflite_module().Interpreter(model_path=str(model_path))
+
+    def describe(details):
+        return [{"name": d["name"], "shape": [int(v) for v in d["shape"]], "dtype": np.dtype(d["dtype"]).name}
+                for d in details]
+
+    return {"inputs": describe(interpreter.get_input_details()),
+            "outputs": describe(interpreter.get_output_details())}
+
+
+def op_profile(model_path, runs=50, num_threads=None, binary=None, timeout=120):
+    """Temps par type d'opérateur TFLite, quand l'outillage le permet.
+
+    L'interpréteur Python n'expose pas le profileur d'opérateurs de TFLite :
+    on lance l'outil benchmark_model (--enable_op_profiling) s'il est
+    installé (TFLITE_BENCHMARK_MODEL ou PATH). Les opérateurs confiés à un
+    délégué (XNNPACK) y apparaissent regroupés sous le nom du délégué.
+    Sans l'outil, seul l'inventaire des opérateurs du graphe est rendu.
+    """
+    interpreter = tflite_module().Interpreter(model_path=str(model_path))
+    try:
+        inventory = Counter(op["op_name"] for op in interpreter._get_ops_details())
+    except Exception:
+        inventory = Counter()  # API interne absente de ce runtime
+    report = {"model": str(model_path), "ops": dict(inventory.most_common()), "timing": None}
+    binary = binary or os.environ.get("TFLITE_BENCHMARK_MODEL") or shutil.which("benchmark_model")
+    if binary is None:
+        report["reason"] = "benchmark_model introuvable (TFLITE_BENCHMARK_MODEL) : pas de temps par opérateur"
+        return report
+    command = [binary, f"--graph={model_path}", "--enable_op_profiling=true", f"--num_runs={runs}"]
+    if num_threads:
+        command.append(f"--num_threads={num_threads}")
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        report["reason"] = f"benchmark_model : {e}"
+        return report
+    report["timing"] = parse_op_profile(output.stdout + output.stderr)
+    if not report["timing"]:
+        report["reason"] = f"benchmark_model (code {output.returncode}) : pas de profil par opérateur"
+    return report
+
+
+def parse_op_profile(text):
+    """Section 'Summary by node type' de benchmark_model -> [{op, count, avg_ms, ratio}]."""
+    rows, in_summary = [], False
+    for line in text.splitlines():
+        if "Summary by node type" in line:
+            in_summary, rows = True, []  # la dernière section est celle des runs mesurés
+            continue
+        if not in_summary or "[Node type]" in line:
+            continue
+        parts = line.split()
+        if len(parts) >= 4 and parts[1].isdigit():
+            rows.append({"op": parts[0], "count": int(parts[1]), "avg_ms": float(parts[2]),
+                         "ratio": round(float(parts[3].rstrip("%")) / 100, 4)})
+        elif rows:
+            in_summary = False  # fin du tableau
+    return rows
+
+
+def detector_bytes(detector):
+    """Estimation de la mémoire d'un détecteur chaud : tenseurs non constants de chaque interpréteur.
+
+    Les poids restent dans le fichier mappé (cache disque partagé) : seuls
+    comptent les tenseurs produits à l'exécution (entrées du graphe, sorties
+    des opérateurs), c'est-à-dire les arènes d'activations et les buffers.
+    """
+    interpreter = detector.interpreter
+    details = interpreter.get_tensor_details()
+    sizes = {d["index"]: int(np.prod(d["shape"])) * np.dtype(d["dtype"]).itemsize for d in details}
+    try:
+        produced = {index for op in interpreter._get_ops_details() for index in op["outputs"]}
+        produced.update(d["index"] for d in interpreter.get_input_details())
+        per_interpreter = sum(size for index, size in sizes.items() if index in produced)
+    except Exception:
+        # API interne absente de ce runtime : les poids ne sont pas séparables,
+        # on retire au moins le fichier mappé (compté une fois, pas par tenseur)
+        per_interpreter = max(0, sum(sizes.values()) - os.path.getsize(detector.model_path))
+    return per_interpreter * detector.pool_size
+
+
+def measure(model_path, iterations=50, warmup=5, num_threads=None, frame_shape=(480, 640, 3)):
+    """Mesure réelle d'un modèle : chargement, latence predict de bout en bout, mémoire."""
+    start = time.perf_counter()
+    detector = EdgeDetector(model_path, num_threads=num_threads)
+    load_ms = (time.perf_counter() - start) * 1000
+    frame = np.random.default_rng(0).integers(0, 256, frame_shape, dtype=np.uint8)
+    for _ in range(warmup):
+        detector.predict(frame)
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        detector.predict(frame)
+        samples[i] = (time.perf_counter() - start) * 1000
+    memory = detector_bytes(detector)
+    detector.close()
+    return {
+        "load_ms": round(load_ms, 2),
+        "latency_ms": {
+            "mean": round(float(samples.mean()), 3),
+            "p50": round(float(np.percentile(samples, 50)), 3),
+            "p99": round(float(np.percentile(samples, 99)), 3),
+        },
+        "fps": round(1000.0 / float(samples.mean()), 1),
+        "memory_mb": round(memory / 1e6, 3),
+        "iterations": iterations,
+        "num_threads": num_threads,
+        "measured_at": time.time(),
+    }
+
+
+class ModelRegistry:
+    """Registre local des modèles de `models_dir` + cache LRU de détecteurs chauds.
+
+    L'index (empreinte, signature d'E/S, mesures) est persisté dans
+    `index_path` et n'est recalculé que pour les fichiers modifiés. Les
+    détecteurs déjà chargés et alloués sont gardés tant que leur mémoire
+    estimée tient dans `memory_budget_mb` : revenir de float32 à int8 ne
+    relit ni ne réalloue rien. Un détecteur en service (actif ou précédent
+    du ModelManager) n'est jamais évincé ; il est rendu via release().
+    """
+
+    def __init__(self, models_dir="models", index_path=None, memory_budget_mb=64):
+        self.models_dir = Path(models_dir)
+        self.index_path = Path(index_path) if index_path else None
+        self.memory_budget = int(memory_budget_mb * 1e6)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = {}
+        self._warm = OrderedDict()  # (sha256, options) -> [détecteur, octets, utilisations en cours]
+        self._lock = threading.RLock()
+        if self.index_path is not None and self.index_path.exists():
+            try:
+                self._index = {entry["name"]: entry for entry in json.loads(self.index_path.read_text())}
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Index du registre illisible ({e}), reconstruction")
+
+    # --- Index ---
+    def scan(self):
+        """Indexe models_dir/*.tflite ; seuls les fichiers nouveaux ou modifiés sont relus."""
+        with self._lock:
+            index = {}
+            for path in sorted(self.models_dir.glob("*.tflite")):
+                stat = path.stat()
+                entry = self._index.get(path.name)
+                if entry is None or entry["size_bytes"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+                    try:
+                        signature = read_signature(path)
+                    except Exception as e:
+                        print(f"⚠️ {path.name} ignoré : {e}")
+                        continue
+                    entry = {
+                        "name": path.name,
+                        "path": str(path),
+                        "size_bytes": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        "sha256": model_digest(path),
+                        "signature": signature,
+                        "quantized": signature["inputs"][0]["dtype"] != "float32",
+                        "benchmark": None,
+                    }
+                index[path.name] = entry
+            self._index = index
+            self._save()
+            return self.entries()
+
+    def _save(self):
+        if self.index_path is None:
+            return
+        try:
+            tmp_path = self.index_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(list(self._index.values()), indent=2))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"⚠️ Index du registre non sauvegardé : {e}")
+
+    def entries(self):
+        return [dict(entry) for entry in self._index.values()]
+
+    def resolve(self, name):
+        """Entrée du registre pour 'model_int8', 'model_int8.tflite' ou 'models/model_int8.tflite'.
+
+        Un chemin hors de models_dir n'est pas un modèle du registre : KeyError.
+        """
+        path = Path(name)
+        if path.parent != Path(".") and path.resolve().parent != self.models_dir.resolve():
+            raise KeyError(f"{name} n'est pas dans {self.models_dir}")
+        filename = path.name if path.suffix == ".tflite" else f"{path.name}.tflite"
+        if filename not in self._index:
+            self.scan()  # fichier déposé depuis le dernier scan
+        if filename not in self._index:
+            raise KeyError(f"Modèle inconnu du registre : {name}")
+        return dict(self._index[filename])
+
+    def benchmark(self, name, iterations=50, num_threads=None):
+        entry = self.resolve(name)
+        stats = measure(entry["path"], iterations=iterations, num_threads=num_threads)
+        with self._lock:
+            self._index[entry["name"]]["benchmark"] = stats
+            self._save()
+        return stats
+
+    # --- Détecteurs chauds ---
+    def detector(self, name, **options):
+        """Détecteur prêt à l'emploi (options = celles d'EdgeDetector), depuis le cache si possible."""
+        entry = self.resolve(name)
+        key = (entry["sha256"], tuple(sorted(options.items())))
+        with self._lock:
+            cached = self._warm.get(key)
+            if cached is not None:
+                cached[2] += 1
+                self._warm.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        # Chargement hors verrou : un autre appelant peut utiliser le cache pendant ce temps
+        detector = EdgeDetector(entry["path"], model_id=entry["sha256"][:16], **options)
+        with self._lock:
+            self._warm[key] = [detector, detector_bytes(detector), 1]
+            self._evict()
+        return detector
+
+    def release(self, detector):
+        """Le détecteur n'est plus utilisé par l'appelant (il reste chaud s'il tient dans le budget)."""
+        with self._lock:
+            for cached in self._warm.values():
+                if cached[0] is detector:
+                    cached[2] = max(0, cached[2] - 1)
+                    self._evict()
+                    return
+        detector.close()  # pas issu du registre (ex. ProcessDetector)
+
+    def _evict(self):
+        used = sum(cached[1] for cached in self._warm.values())
+        for key in list(self._warm):
+            if used <= self.memory_budget:
+                break
+            detector, size, in_use = self._warm[key]
+            if in_use:
+                continue
+            del self._warm[key]
+            detector.close()
+            used -= size
+            self.evictions += 1
+
+    def close(self):
+        with self._lock:
+            for detector, _, _ in self._warm.values():
+                detector.close()
+            self._warm.clear()
+
+    def snapshot(self):
+        with self._lock:
+            warm = [{"model": detector.model_path, "bytes": size, "in_use": in_use}
+                    for detector, size, in_use in self._warm.values()]
+        return {
+            "models": len(self._index),
+            "warm": warm,
+            "memory_used_mb": round(sum(item["bytes"] for item in warm) / 1e6, 3),
+            "memory_budget_mb": round(self.memory_budget / 1e6, 3),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # format msgpack indisponible, json / binary restent servis
+    msgpack = None
+
+FORMATS = ("json", "msgpack", "binary")
+# En-tête du format binaire (little-endian) : flux, n° d'image, horodatage de
+# capture, horodatage de publication, latence, largeur, hauteur, nb de détections
+BINARY_HEADER = struct.Struct("<IQddfHHH")
+
+
+class ResultRecord:
+    """Résultat d'une image : détections filtrées par le pipeline + métadonnées.
+
+    Les tableaux sont ceux des Detections (déjà propres à l'image) : aucune
+    copie ni conversion sur le chemin du pipeline, l'encodage se fait à la
+    demande, par abonné.
+    """
+
+    __slots__ = ("stream", "frame_id", "captured_at", "published_at", "latency_ms",
+                 "width", "height", "boxes", "classes", "scores")
+
+    def __init__(self, stream, frame_id, captured_at, frame_shape, detections):
+        self.stream = stream
+        self.frame_id = frame_id
+        self.captured_at = captured_at
+        self.published_at = time.time()
+        self.latency_ms = float(detections.latency_ms)
+        self.height, self.width = frame_shape[:2]
+        self.boxes = detections.boxes
+        self.classes = detections.classes
+        self.scores = detections.scores
+
+    def select(self, classes=None, min_score=0.0):
+        """Index des détections à envoyer à un abonné (filtre côté serveur)."""
+        mask = self.scores >= min_score
+        if classes is not None:
+            mask &= np.isin(self.classes, list(classes))
+        return mask
+
+    def to_dict(self, mask=None):
+        boxes, classes, scores = self.boxes, self.classes, self.scores
+        if mask is not None:
+            boxes, classes, scores = boxes[mask], classes[mask], scores[mask]
+        return {
+            "stream": self.stream,
+            "frame": self.frame_id,
+            "captured_at": round(self.captured_at, 4),
+            "published_at": round(self.published_at, 4),
+            "latency_ms": round(self.latency_ms, 2),
+            "width": self.width,
+            "height": self.height,
+            # [ymin, xmin, ymax, xmax] normalisés, 4 décimales (< 0.1 px en 640x480)
+            "boxes": np.round(boxes.astype(np.float64), 4).tolist(),
+            "classes": classes.tolist(),
+            "scores": np.round(scores.astype(np.float64), 3).tolist(),
+        }
+
+    def to_binary(self, mask=None):
+        """En-tête BINARY_HEADER puis, par détection : 4 x uint16 (boîte x 65535),
+        uint16 (classe), uint8 (score x 255). 11 octets par boîte au lieu de ~60 en JSON."""
+        boxes, classes, scores = self.boxes, self.classes, self.scores
+        if mask is not None:
+            boxes, classes, scores = boxes[mask], classes[mask], scores[mask]
+        header = BINARY_HEADER.pack(self.stream, self.frame_id, self.captured_at, self.published_at,
+                                    self.latency_ms, self.width, self.height, len(scores))
+        return b"".join((
+            header,
+            np.round(np.clip(boxes, 0, 1) * 65535).astype("<u2").tobytes(),
+            classes.astype("<u2").tobytes(),
+            np.round(np.clip(scores, 0, 1) * 255).astype(np.uint8).tobytes(),
+        ))
+
+    def encode(self, fmt, mask=None):
+        """str (json) ou bytes (msgpack, binary) prêts à envoyer."""
+        if fmt == "binary":
+            return self.to_binary(mask)
+        if fmt == "msgpack":
+            return msgpack.packb(self.to_dict(mask), use_single_float=True)
+        return json.dumps(self.to_dict(mask), separators=(",", ":"))
+
+
+class ResultBroadcaster:
+    """Diffuse chaque ResultRecord aux clients WebSocket / SSE.
+
+    Le pipeline appelle publish() : s'il n'y a aucun abonné, rien d'autre
+    qu'un test. Sinon le record est remis à la boucle asyncio
+    (call_soon_threadsafe), qui le dépose dans la file bornée de chaque
+    abonné ; un client lent perd ses plus anciens résultats, jamais le pipeline.
+    """
+
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self.published = 0
+        self.dropped = 0
+        self._loop = None
+        self._queues = set()
+
+    def attach_loop(self, loop):
+        self._loop = loop
+
+    @property
+    def subscribers(self):
+        return len(self._queues)
+
+    def publish(self, record):
+        self.published += 1
+        loop = self._loop
+        if self._queues and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch, record)
+
+    def _dispatch(self, record):
+        for pending in self._queues:
+            if pending.full():
+                pending.get_nowait()
+                self.dropped += 1
+            pending.put_nowait(record)
+
+    def subscribe(self):
+        """À appeler depuis la boucle asyncio : retourne la file du nouvel abonné."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        pending = asyncio.Queue(self.queue_size)
+        self._queues.add(pending)
+        return pending
+
+    def unsubscribe(self, pending):
+        self._queues.discard(pending)
+
+    def snapshot(self):
+        return {"records_published": self.published, "subscribers": self.subscribers,
+                "dropped": self.dropped}
+
+
+class ResultSink:
+    """Journal append-only des résultats (JSONL ou Parquet), écrit par lots dans un thread.
+
+    write() ne fait qu'un put_nowait : si le disque ne suit pas, les records
+    en trop sont comptés dans `dropped` au lieu de ralentir l'inférence. Le
+    fichier courant change dès qu'il dépasse `max_bytes` ; seuls les `keep`
+    plus récents sont conservés. Parquet nécessite pyarrow.
+    """
+
+    def __init__(self, directory, fmt="jsonl", max_bytes=64 * 1024 * 1024, keep=10,
+                 batch_size=256, flush_interval=1.0, queue_size=10000):
+        if fmt not in ("jsonl", "parquet"):
+            raise ValueError(f"Format de journal inconnu : {fmt} (attendu : jsonl, parquet)")
+        if fmt == "parquet":
+            import pyarrow  # noqa: F401  (échoue tôt, au démarrage, si absent)
+        self.directory = Path(directory)
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.files = 0
+        self._queue = queue.Queue(queue_size)
+        self._path = None
+        self._file = None     # JSONL : fichier texte ; Parquet : ParquetWriter
+        self._file_bytes = 0  # octets écrits dans le fichier courant (Parquet bufferise)
+        self._thread = None
+
+    def write(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._loop, name="results-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Vide la file puis ferme le fichier courant (None = fin du thread)."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    running = False
+                    break
+                batch.append(record)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    print(f"Erreur journal des détections : {e}")
+        self._close_file()
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._open_file()
+        if self.fmt == "jsonl":
+            text = "".join(record.encode("json") + "\n" for record in batch)
+            self._file.write(text)
+            self._file.flush()
+            self._file_bytes += len(text)
+        else:
+            table = _parquet_table(batch)
+            self._file.write_table(table)
+            self._file_bytes += table.nbytes  # taille Arrow : majorant de la taille compressée
+        self.written += len(batch)
+        self.batches += 1
+        if self._file_bytes >= self.max_bytes:
+            self._close_file()
+
+    def _open_file(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self._path = self.directory / f"detections-{stamp}-{self.files:04d}.{self.fmt}"
+        if self.fmt == "jsonl":
+            self._file = open(self._path, "a", encoding="utf-8")
+        else:
+            import pyarrow.parquet as pq
+            self._file = pq.ParquetWriter(self._path, _parquet_schema())
+        self._file_bytes = 0
+        self.files += 1
+        self._prune()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _prune(self):
+        logs = sorted(self.directory.glob(f"detections-*.{self.fmt}"), key=os.path.getmtime)
+        for path in logs[:-self.keep] if self.keep > 0 else []:
+            path.unlink(missing_ok=True)
+
+    def snapshot(self):
+        return {
+            "format": self.fmt,
+            "file": str(self._path) if self._path else None,
+            "records_written": self.written,
+            "batches": self.batches,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("stream", pa.int32()), ("frame", pa.int64()),
+        ("captured_at", pa.float64()), ("published_at", pa.float64()),
+        ("latency_ms", pa.float32()), ("width", pa.int32()), ("height", pa.int32()),
+        # Boîtes aplaties : 4 valeurs [ymin, xmin, ymax, xmax] par détection
+        ("boxes", pa.list_(pa.float32())), ("classes", pa.list_(pa.int32())),
+        ("scores", pa.list_(pa.float32())),
+    ])
+
+
+def _parquet_table(batch):
+    """Un lot de records -> une table Arrow (un row group par lot)."""
+    import pyarrow as pa
+
+    columns = {
+        "stream": [r.stream for r in batch],
+        "frame": [r.frame_id for r in batch],
+        "captured_at": [r.captured_at for r in batch],
+        "published_at": [r.published_at for r in batch],
+        "latency_ms": [r.latency_ms for r in batch],
+        "width": [r.width for r in batch],
+        "height": [r.height for r in batch],
+        "boxes": [r.boxes.reshape(-1) for r in batch],
+        "classes": [r.classes for r in batch],
+        "scores": [r.scores for r in batch],
+    }
+    return pa.Table.from_pydict(columns, schema=_parquet_schema())
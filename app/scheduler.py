@@ -0,0 +1,202 @@
+import math
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from app.detections import Detections
+
+
+class MotionGate:
+    """Détecteur de changement bon marché : différence d'images sous-échantillonnées.
+
+    L'image est réduite (64x48 en niveaux de gris) puis comparée à la référence,
+    c'est-à-dire la dernière image réellement inférée : un mouvement lent finit
+    donc par déclencher une inférence même s'il est faible d'une image à l'autre.
+    """
+
+    def __init__(self, size=(64, 48), pixel_threshold=25, changed_ratio=0.01):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.changed_ratio = changed_ratio
+        self._reference = None
+        self._current = None
+        self.last_ratio = 0.0
+
+    def moved(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self._current = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        if self._reference is None:
+            return True
+        diff = cv2.absdiff(self._current, self._reference)
+        self.last_ratio = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+        return self.last_ratio > self.changed_ratio
+
+    def accept(self):
+        """L'image courante vient d'être inférée : elle devient la référence."""
+        self._reference = self._current
+
+
+class StrideController:
+    """Régulateur de budget de latence : choisit 1 inférence toutes les `stride` images.
+
+    Avec un budget de 1000 / target_fps ms par image, il faut au moins
+    ceil(latence d'inférence / budget) images par inférence. Le pas monte dès
+    que le budget est dépassé et ne redescend qu'avec 20 % de marge, pour ne
+    pas osciller entre deux valeurs.
+    """
+
+    def __init__(self, target_fps=15.0, max_stride=8, smoothing=0.2):
+        self.budget_ms = 1000.0 / target_fps
+        self.max_stride = max(1, int(max_stride))
+        self.smoothing = smoothing
+        self.stride = 1
+        self.inference_ms = None  # moyenne exponentielle
+
+    def update(self, inference_ms):
+        if self.inference_ms is None:
+            self.inference_ms = inference_ms
+        else:
+            self.inference_ms += self.smoothing * (inference_ms - self.inference_ms)
+        required = min(self.max_stride, max(1, math.ceil(self.inference_ms / self.budget_ms)))
+        if required > self.stride:
+            self.stride = required
+        elif required < self.stride and self.inference_ms < 0.8 * self.budget_ms * (self.stride - 1):
+            self.stride -= 1
+
+
+def iou_matrix(a, b):
+    """IoU (N, M) entre deux tableaux de boîtes [ymin, xmin, ymax, xmax]."""
+    y1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    x1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    y2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    x2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(y2 - y1, 0, None) * np.clip(x2 - x1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class BoxTracker:
+    """Suivi à vitesse constante entre deux inférences.
+
+    À chaque inférence, chaque boîte est associée (même classe, meilleure IoU)
+    à une boîte de l'inférence précédente pour estimer sa vitesse par image.
+    Entre deux inférences les boîtes sont simplement translatées : quelques
+    opérations NumPy, aucun appel au modèle.
+    """
+
+    def __init__(self, iou_threshold=0.3):
+        self.iou_threshold = iou_threshold
+        self._base = None
+        self._velocity = None
+        self._age = 0
+
+    def update(self, detections, frames_elapsed):
+        velocity = np.zeros_like(detections.boxes)
+        previous = self._base
+        if previous is not None and len(detections) and len(previous.boxes) and frames_elapsed > 0:
+            iou = iou_matrix(detections.boxes, previous.boxes)
+            iou[detections.classes[:, None] != previous.classes[None, :]] = 0.0
+            best = iou.argmax(axis=1)
+            matched = iou[np.arange(len(best)), best] >= self.iou_threshold
+            velocity[matched] = (detections.boxes[matched] - previous.boxes[best[matched]]) / frames_elapsed
+        self._base, self._velocity, self._age = detections, velocity, 0
+
+    def _current_boxes(self):
+        if self._base is None:
+            return None
+        if self._age == 0:
+            return self._base
+        boxes = np.clip(self._base.boxes + self._velocity * self._age, 0.0, 1.0)
+        return Detections(boxes, self._base.classes, self._base.scores, self._base.latency_ms)
+
+    def step(self, moving=True):
+        """Détections de l'image courante sans inférence (avancées d'une image si mouvement)."""
+        if self._base is None:
+            return Detections(np.empty((0, 4)), np.empty(0), np.empty(0))
+        if moving:
+            self._age += 1
+        return self._current_boxes()
+
+
+class AdaptiveScheduler:
+    """Décide, image par image, s'il faut lancer le modèle.
+
+    - pas de changement dans l'image        -> on réutilise les détections
+    - changement mais pas encore `stride`   -> on translate les boîtes (tracker)
+    - sinon (ou toutes les max_interval images, ou modèle / réglages changés)
+                                            -> inférence complète
+    """
+
+    def __init__(self, target_fps=15.0, max_stride=8, max_interval=50,
+                 changed_ratio=0.01, window=100):
+        self.gate = MotionGate(changed_ratio=changed_ratio)
+        self.controller = StrideController(target_fps, max_stride)
+        self.tracker = BoxTracker()
+        self.max_interval = max_interval
+        self.frames = 0
+        self.inferences = 0
+        self.decisions = {"infer": 0, "track": 0, "reuse": 0}
+        self.saved_ms = 0.0       # temps d'inférence évité (estimé), coût du gate déduit
+        self.overhead_ms = 0.0    # gate + tracker, images inférées comprises
+        self._recent = deque(maxlen=window)  # 1 = image inférée
+        self._since = 0
+        self._key = None
+        self._moving = True
+        self._gate_ms = 0.0
+
+    def should_infer(self, frame, key=None):
+        """`key` identifie le modèle et les réglages : s'il change, on ré-infère."""
+        start = time.perf_counter()
+        self._moving = self.gate.moved(frame)
+        self._gate_ms = (time.perf_counter() - start) * 1000
+        self.frames += 1
+        self._since += 1
+        infer = (key != self._key or self._since >= self.max_interval or
+                 (self._moving and self._since >= self.controller.stride))
+        self._key = key
+        return infer
+
+    def on_inference(self, detections, inference_ms):
+        self.gate.accept()
+        self.tracker.update(detections, self._since)
+        self.controller.update(inference_ms)
+        self.overhead_ms += self._gate_ms
+        self.saved_ms -= self._gate_ms
+        self.inferences += 1
+        self.decisions["infer"] += 1
+        self._recent.append(1)
+        self._since = 0
+        return detections
+
+    def on_skip(self):
+        start = time.perf_counter()
+        detections = self.tracker.step(self._moving)
+        cost_ms = self._gate_ms + (time.perf_counter() - start) * 1000
+        self.overhead_ms += cost_ms
+        self.saved_ms += (self.controller.inference_ms or 0.0) - cost_ms
+        self.decisions["track" if self._moving else "reuse"] += 1
+        self._recent.append(0)
+        return detections
+
+    def snapshot(self):
+        recent = tuple(self._recent)
+        inference_ms = self.controller.inference_ms or 0.0
+        full_cost = self.frames * inference_ms
+        return {
+            "stride": self.controller.stride,
+            "target_fps": round(1000.0 / self.controller.budget_ms, 2),
+            "inference_ms": round(inference_ms, 2),
+            "frames": self.frames,
+            "inferences": self.inferences,
+            "decisions": dict(self.decisions),
+            # Part des images réellement passées au modèle (fenêtre récente)
+            "inference_ratio": round(sum(recent) / len(recent), 3) if recent else 1.0,
+            # Temps CPU évité par rapport à une inférence par image
+            "cpu_saved_ms": round(self.saved_ms, 1),
+            "cpu_saved_ratio": round(self.saved_ms / full_cost, 3) if full_cost else 0.0,
+            "overhead_ms_per_frame": round(self.overhead_ms / self.frames, 3) if self.frames else 0.0,
+            "motion_ratio": round(self.gate.last_ratio, 4),
+        }
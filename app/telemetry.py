@@ -0,0 +1,346 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from app.pipeline import StageStats
+
+QUANTILES = (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms"))
+# Sous-échantillonnages proposés aux tableaux de bord (en nombre d'instantanés par point)
+FEED_RESOLUTIONS = (1, 2, 4, 10, 20, 60)
+
+
+class Telemetry:
+    """Télémétrie du service, publiée sous forme d'instantanés immuables.
+
+    Le pipeline ne fait qu'ajouter un échantillon par image (record_frame).
+    Un thread dédié assemble toutes les `interval` secondes un instantané
+    complet (FPS réel, percentiles, files, OTA...) et le rend visible en
+    remplaçant une seule référence : /metrics et /metrics/prometheus lisent
+    cet objet figé, sans verrou et sans toucher aux threads du pipeline.
+    """
+
+    def __init__(self, model_version="", interval=0.5, window=300, history=600):
+        self.model_version = model_version
+        self.interval = interval
+        self.feed = MetricsFeed(interval, history)
+        self.frames = StageStats(window)  # une entrée par image publiée (tous flux confondus)
+        self._last_frame = (0.0, 0)       # (latence, objets) de la même image, remplacé d'un bloc
+        self._sources = {}                # nom -> callable() -> dict (ou None pour l'omettre)
+        self._published = ({}, "")        # (instantané JSON, texte Prometheus)
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh()
+
+    def add_source(self, name, collect):
+        self._sources[name] = collect
+
+    def record_frame(self, latency_ms, objects):
+        """Chemin chaud : deux affectations, aucun calcul."""
+        self._last_frame = (latency_ms, objects)
+        self.frames.add(latency_ms)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Erreur télémétrie : {e}")
+
+    def refresh(self):
+        """Construit un nouvel instantané puis le publie par échange de référence."""
+        latency_ms, objects = self._last_frame
+        frames = self.frames.snapshot()
+        snapshot = {
+            # FPS mesuré à l'horloge murale sur les images réellement publiées
+            "fps": frames["fps"],
+            "latency_ms": round(latency_ms, 2),
+            "model_version": self.model_version,
+            "objects_detected": objects,
+            "frames": frames,
+            "updated_at": time.time(),
+        }
+        for name, collect in list(self._sources.items()):
+            value = collect()
+            if value is not None:
+                snapshot[name] = value
+        self._published = (snapshot, to_prometheus(snapshot))
+        self.feed.publish(snapshot)
+
+    def snapshot(self):
+        return self._published[0]
+
+    def prometheus(self):
+        return self._published[1]
+
+
+class MetricsFeed:
+    """Séries de métriques poussées aux tableaux de bord (SSE /metrics/stream).
+
+    À chaque instantané de Telemetry, un point compact (FPS, latences,
+    objets) est ajouté à chaque résolution de FEED_RESOLUTIONS : la série
+    `k` agrège k instantanés par point. Chaque point est encodé une seule
+    fois, à sa création ; un client ne fait ensuite que recopier des octets
+    déjà prêts. Le coût côté device ne dépend donc pas du nombre de tableaux
+    de bord : un réveil de la boucle asyncio par instantané, pas par client.
+    L'état (modèle actif, variante de la politique) n'est renvoyé que
+    lorsqu'il change.
+    """
+
+    def __init__(self, interval=0.5, history=600):
+        self.interval = interval
+        self.history = history
+        self.seq = 0
+        self.state_seq = 0
+        self.state = None
+        self.subscribers = 0
+        self._series = {k: deque(maxlen=history) for k in FEED_RESOLUTIONS}  # k -> (seq, JSON)
+        self._pending = {k: [] for k in FEED_RESOLUTIONS}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._event = None  # asyncio.Event de la génération courante (créé dans la boucle)
+
+    def attach_loop(self, loop):
+        self._loop = loop
+
+    def resolution(self, interval):
+        """Plus petite agrégation dont la période couvre `interval` secondes."""
+        return next((k for k in FEED_RESOLUTIONS if k * self.interval >= interval), FEED_RESOLUTIONS[-1])
+
+    def publish(self, snapshot):
+        """Thread de télémétrie : ajoute le point aux séries, réveille les clients."""
+        frames = snapshot["frames"]
+        point = {"t": round(snapshot["updated_at"], 3), "fps": snapshot["fps"],
+                 "latency_ms": snapshot["latency_ms"], "p95_ms": frames["p95_ms"],
+                 "objects": snapshot["objects_detected"]}
+        policy = snapshot.get("policy") or {}
+        state = {"model_version": snapshot["model_version"], "variant": policy.get("variant"),
+                 "policy_enabled": policy.get("enabled")}
+        with self._lock:
+            self.seq += 1
+            for k, pending in self._pending.items():
+                pending.append(point)
+                if self.seq % k == 0:
+                    merged = _merge_points(pending) if k > 1 else point
+                    pending.clear()
+                    self._series[k].append((self.seq, json.dumps({"seq": self.seq, **merged},
+                                                                  separators=(",", ":"))))
+            if state != self.state:
+                self.state = state
+                self.state_seq = self.seq
+        loop = self._loop
+        if self.subscribers and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    async def wait(self, seq, timeout):
+        """Attend un instantané plus récent que `seq` (False après timeout)."""
+        if self.seq > seq:
+            return True
+        if self._event is None:
+            self._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def since(self, resolution, seq):
+        """Points JSON déjà encodés de la série `resolution`, postérieurs à `seq`."""
+        with self._lock:
+            series = self._series[resolution]
+            new = []
+            for i in range(len(series) - 1, -1, -1):
+                if series[i][0] <= seq:
+                    break
+                new.append(series[i])
+        new.reverse()
+        return new
+
+    def state_json(self):
+        return json.dumps({**(self.state or {}), "interval_s": self.interval}, separators=(",", ":"))
+
+    def snapshot(self):
+        return {"subscribers": self.subscribers, "seq": self.seq,
+                "points": {k: len(series) for k, series in self._series.items()}}
+
+
+def _merge_points(points):
+    """Un point pour k instantanés : moyennes, pire p95, dernier horodatage."""
+    n = len(points)
+    return {
+        "t": points[-1]["t"],
+        "fps": round(sum(p["fps"] for p in points) / n, 2),
+        "latency_ms": round(sum(p["latency_ms"] for p in points) / n, 2),
+        "p95_ms": max(p["p95_ms"] for p in points),
+        "objects": round(sum(p["objects"] for p in points) / n, 1),
+    }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class _Exposition:
+    """Accumule les échantillons par métrique, pour n'écrire HELP/TYPE qu'une fois."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def add(self, name, kind, help_text, value, **labels):
+        if value is None:
+            return
+        entry = self._metrics.setdefault(name, (kind, help_text, []))
+        entry[2].append((name, _labels(**labels), value))
+
+    def summary(self, name, help_text, stats, **labels):
+        """Percentiles d'une fenêtre StageStats au format summary."""
+        entry = self._metrics.setdefault(name, ("summary", help_text, []))
+        for quantile, key in QUANTILES:
+            entry[2].append((name, _labels(**labels, quantile=quantile), stats[key]))
+        entry[2].append((f"{name}_count", _labels(**labels), stats["frames"]))
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, samples) in self._metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{sample}{labels} {_format(value)}" for sample, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _adaptive(out, adaptive, **labels):
+    out.add("edge_inference_ratio", "gauge", "Part des images passées au modèle",
+            adaptive["inference_ratio"], **labels)
+    out.add("edge_inference_stride", "gauge", "Pas d'inférence choisi par le régulateur",
+            adaptive["stride"], **labels)
+    out.add("edge_cpu_saved_ratio", "gauge", "Temps d'inférence évité (estimé)",
+            adaptive["cpu_saved_ratio"], **labels)
+
+
+def to_prometheus(snapshot):
+    """Format texte Prometheus (v0.0.4) d'un instantané de Telemetry."""
+    out = _Exposition()
+    out.add("edge_fps", "gauge", "Images publiées par seconde (horloge murale)", snapshot["fps"])
+    out.add("edge_latency_ms", "gauge", "Latence d'inférence de la dernière image", snapshot["latency_ms"])
+    out.add("edge_objects_detected", "gauge", "Objets détectés sur la dernière image",
+            snapshot["objects_detected"])
+    out.add("edge_model_info", "gauge", "Modèle actif", 1, version=snapshot["model_version"])
+    out.add("edge_frames_total", "counter", "Images publiées depuis le démarrage",
+            snapshot["frames"]["frames"])
+    out.summary("edge_frame_latency_ms", "Latence d'inférence par image (fenêtre glissante)",
+                snapshot["frames"])
+
+    pipeline = snapshot.get("pipeline")
+    if pipeline is not None:
+        stage_help = "Durée par étage du pipeline (fenêtre glissante)"
+        for stage, stats in pipeline.get("stages", {}).items():
+            out.summary("edge_stage_latency_ms", stage_help, stats, stage=stage)
+            out.add("edge_stage_fps", "gauge", "Débit réel par étage", stats["fps"], stage=stage)
+        for queue, state in pipeline.get("queues", {}).items():
+            out.add("edge_queue_depth", "gauge", "Éléments en attente dans la file", state["depth"], queue=queue)
+            out.add("edge_dropped_frames_total", "counter", "Images jetées par file pleine",
+                    state["dropped"], queue=queue)
+        cache = pipeline.get("cache")
+        if cache is not None:
+            out.add("edge_cache_hits_total", "counter", "Détections servies par le cache", cache["hits"])
+            out.add("edge_cache_misses_total", "counter", "Recherches sans résultat en cache", cache["misses"])
+            out.add("edge_cache_entries", "gauge", "Entrées dans le cache de détections", cache["entries"])
+            out.add("edge_cache_invalidations_total", "counter", "Vidages du cache (changement de modèle)",
+                    cache["invalidations"])
+        adaptive = pipeline.get("adaptive")
+        if adaptive is not None:
+            _adaptive(out, adaptive)
+        # Mode multi-caméras : une file d'une place par flux
+        if "inference" in pipeline:
+            out.summary("edge_stage_latency_ms", stage_help, pipeline["inference"], stage="inference")
+            out.add("edge_stage_fps", "gauge", "Débit réel par étage", pipeline["inference"]["fps"],
+                    stage="inference")
+            out.add("edge_batch_fill_rate", "gauge", "Taux de remplissage des batchs",
+                    pipeline.get("batch_fill_rate"))
+        for stream, state in pipeline.get("streams", {}).items():
+            out.summary("edge_stage_latency_ms", stage_help, state["decode"], stage="decode", stream=stream)
+            out.add("edge_stream_fps", "gauge", "Images inférées par seconde et par flux", state["fps"],
+                    stream=stream)
+            out.add("edge_queue_depth", "gauge", "Éléments en attente dans la file", state.get("depth"),
+                    queue="capture", stream=stream)
+            out.add("edge_dropped_frames_total", "counter", "Images jetées par file pleine",
+                    state["dropped"], queue="capture", stream=stream)
+            if "adaptive" in state:
+                _adaptive(out, state["adaptive"], stream=stream)
+
+    policy = snapshot.get("policy")
+    if policy is not None:
+        out.add("edge_policy_enabled", "gauge", "Politique automatique modèle / résolution active",
+                int(policy["enabled"]))
+        if policy["variant"] is not None:
+            out.add("edge_policy_variant_info", "gauge", "Variante choisie par la politique", 1,
+                    variant=policy["variant"])
+            out.add("edge_policy_level", "gauge", "Rang de la variante (0 = la plus précise)", policy["level"])
+        out.add("edge_policy_slo_ms", "gauge", "SLO de latence p95", policy["slo_ms"])
+        out.add("edge_policy_latency_p95_ms", "gauge", "Latence p95 depuis la dernière bascule",
+                policy["observed"].get("p95_ms"))
+        out.add("edge_cpu_load_ratio", "gauge", "Charge CPU du process (1 = tous les cœurs)",
+                policy["observed"].get("cpu"))
+        out.add("edge_policy_switches_total", "counter", "Bascules décidées par la politique",
+                policy["switches"])
+
+    profiling = snapshot.get("profiling")
+    if profiling is not None:
+        for span, stats in profiling["spans"].items():
+            out.summary("edge_span_latency_ms", "Durée des sous-étapes sur les images tracées", stats, span=span)
+
+    memory = snapshot.get("memory")
+    if memory is not None:
+        out.add("edge_rss_bytes", "gauge", "Mémoire résidente du process", int(memory["rss_mb"] * 1e6))
+        if "plan" in memory:
+            out.add("edge_memory_budget_bytes", "gauge", "Budget des tampons (MEMORY_BUDGET_MB)",
+                    int(memory["plan"]["budget_mb"] * 1e6))
+        for stream, pool in enumerate(memory.get("pools", [])):
+            out.add("edge_frame_pool_slots", "gauge", "Cases du pool d'images", pool["slots"], stream=stream)
+            out.add("edge_frame_pool_in_use", "gauge", "Cases du pool détenues (files, étages, diffusion)",
+                    pool["in_use"], stream=stream)
+            out.add("edge_frame_pool_allocations_total", "counter", "Cases allouées depuis le démarrage",
+                    pool["allocations"], stream=stream)
+            out.add("edge_frame_pool_exhausted_total", "counter", "Demandes de case sans case libre",
+                    pool["exhausted"], stream=stream)
+
+    feed = snapshot.get("feed")
+    if feed is not None:
+        out.add("edge_metrics_stream_subscribers", "gauge", "Tableaux de bord connectés à /metrics/stream",
+                feed["subscribers"])
+
+    for stream, state in enumerate(snapshot.get("stream", [])):
+        out.add("edge_stream_subscribers", "gauge", "Clients /video_feed connectés",
+                state["subscribers"], stream=stream)
+        out.add("edge_stream_frames_encoded_total", "counter", "Images encodées en JPEG",
+                state["frames_encoded"], stream=stream)
+    return out.render()
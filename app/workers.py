@@ -0,0 +1,386 @@
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from app.detections import Detections
+
+
+class SharedRing:
+    """Bloc multiprocessing.shared_memory découpé en emplacements de taille fixe.
+
+    Chaque emplacement contient l'image déjà à la taille d'entrée du modèle
+    (uint8, H x W x 3) suivie des sorties (max_detections x [4 boîtes, classe,
+    score] en float32). Seuls des numéros d'emplacement transitent par les
+    files multiprocessing : les pixels et les résultats ne sont jamais picklés.
+    """
+
+    def __init__(self, slots, frame_shape, max_detections, name=None):
+        self.slots = slots
+        self.frame_shape = tuple(int(d) for d in frame_shape)
+        self.max_detections = int(max_detections)
+        frame_bytes = int(np.prod(self.frame_shape))
+        self.frame_bytes = (frame_bytes + 63) // 64 * 64  # sorties alignées sur 64 octets
+        self.slot_bytes = self.frame_bytes + self.max_detections * 6 * 4
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+    def layout(self):
+        return {"slots": self.slots, "frame_shape": self.frame_shape, "max_detections": self.max_detections}
+
+    def frame(self, slot):
+        return np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+
+    def _outputs(self, slot):
+        return np.ndarray((self.max_detections, 6), dtype=np.float32, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes + self.frame_bytes)
+
+    def write_outputs(self, slot, boxes, classes, scores):
+        n = min(len(scores), self.max_detections)
+        out = self._outputs(slot)
+        out[:n, :4] = boxes[:n]
+        out[:n, 4] = classes[:n]
+        out[:n, 5] = scores[:n]
+        return n
+
+    def read_outputs(self, slot, n):
+        """Copie les sorties : l'emplacement peut être réutilisé juste après."""
+        out = self._outputs(slot)[:n].copy()
+        return out[:, :4], out[:, 4], out[:, 5]
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _worker_main(worker_id, model_path, num_threads, requests, responses):
+    """Boucle d'un processus d'inférence (EdgeDetector privé, hors du GIL de l'API)."""
+    from app.inference import EdgeDetector
+
+    try:
+        detector = EdgeDetector(model_path, num_threads=num_threads)
+    except Exception as e:
+        responses.put(("failed", worker_id, str(e)))
+        return
+    responses.put(("ready", worker_id, {
+        "input_details": detector.input_details,
+        "output_details": detector.output_details,
+        "boxes_idx": detector.boxes_idx,
+        "classes_idx": detector.classes_idx,
+        "scores_idx": detector.scores_idx,
+        "is_quantized": detector.is_quantized,
+    }))
+
+    ring = None
+    parent = mp.parent_process()
+    while True:
+        try:
+            message = requests.get(timeout=1.0)
+        except queue.Empty:
+            # API arrêtée brutalement : on ne reste pas orphelin
+            if parent is not None and not parent.is_alive():
+                break
+            continue
+        if message is None:
+            break
+        if message[0] == "attach":
+            _, name, layout = message
+            ring = SharedRing(name=name, **layout)
+            continue
+        _, request_id, slot, score_threshold = message
+        try:
+            # Déjà à la taille d'entrée : predict la copie dans le tenseur sans second resize
+            boxes, classes, scores, processing_time = detector.predict(ring.frame(slot), score_threshold)
+            n = ring.write_outputs(slot, boxes, classes, scores)
+            responses.put(("result", worker_id, request_id, slot, n, processing_time))
+        except Exception as e:
+            responses.put(("error", worker_id, request_id, slot, str(e)))
+    if ring is not None:
+        ring.close()
+
+
+class _WorkerHandle:
+    """État côté API d'un processus d'inférence."""
+
+    def __init__(self, worker_id, slots):
+        self.worker_id = worker_id
+        self.slots = tuple(slots)
+        self.process = None
+        self.requests = None
+        self.ready = False
+        self.free = deque(self.slots)
+        self.in_flight = {}  # request_id -> emplacement
+        self.restarts = 0
+        self.hung = 0        # arrêts forcés : requête sans réponse après request_timeout
+
+
+class ProcessDetector:
+    """Même interface qu'EdgeDetector, mais l'inférence tourne dans des processus.
+
+    Chaque processus charge son propre modèle. L'API redimensionne l'image
+    directement dans un emplacement de mémoire partagée et n'envoie que son
+    numéro ; le processus écrit ses sorties dans ce même emplacement. Un thread
+    superviseur redémarre les processus morts, et arrête d'abord ceux qui
+    restent sans réponse plus de `request_timeout` (leurs requêtes en cours
+    échouent en RuntimeError, le pipeline passe à l'image suivante) : un
+    plantage ou un blocage du runtime TFLite ne fait plus tomber l'API.
+    """
+
+    def __init__(self, model_path, workers=2, num_threads=None, depth=2,
+                 start_timeout=60.0, request_timeout=10.0):
+        from app.inference import model_digest
+
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.request_timeout = request_timeout
+        self.batch_size = 1
+        self.first_frame_ms = None
+        self.completed = 0
+        self.errors = 0
+        self._ctx = mp.get_context("spawn")
+        self._responses = self._ctx.Queue()
+        self._cond = threading.Condition()
+        self._futures = {}  # request_id -> (Future, instant d'envoi)
+        self._ids = itertools.count()
+        self._closing = False
+        self._workers = [_WorkerHandle(i, range(i * depth, (i + 1) * depth)) for i in range(max(1, workers))]
+
+        print(f"Chargement du modèle : {model_path} ({len(self._workers)} processus)")
+        for worker in self._workers:
+            self._spawn(worker)
+        try:
+            signature = self._wait_ready(start_timeout)
+        except Exception:
+            self._shutdown_processes()
+            raise
+
+        self.input_details = signature["input_details"]
+        self.output_details = signature["output_details"]
+        self.boxes_idx = signature["boxes_idx"]
+        self.classes_idx = signature["classes_idx"]
+        self.scores_idx = signature["scores_idx"]
+        self.is_quantized = signature["is_quantized"]
+        self.input_height = int(self.input_details[0]['shape'][1])
+        self.input_width = int(self.input_details[0]['shape'][2])
+        self.model_id = f"{model_digest(self.model_path)[:16]}@{self.input_height}x{self.input_width}"
+        max_detections = int(self.output_details[self.boxes_idx]['shape'][-2]) if self.boxes_idx != -1 else 100
+
+        self._ring = SharedRing(len(self._workers) * depth, (self.input_height, self.input_width, 3),
+                                max_detections)
+        for worker in self._workers:
+            self._attach(worker)
+
+        self._threads = [
+            threading.Thread(target=self._collect_loop, name="workers-collect", daemon=True),
+            threading.Thread(target=self._supervise_loop, name="workers-supervise", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pool_size(self):
+        return len(self._workers)
+
+    # --- Processus ---
+    def _spawn(self, worker):
+        worker.requests = self._ctx.Queue()
+        worker.process = self._ctx.Process(
+            target=_worker_main, name=f"edge-worker-{worker.worker_id}", daemon=True,
+            args=(worker.worker_id, self.model_path, self.num_threads, worker.requests, self._responses))
+        worker.process.start()
+
+    def _attach(self, worker):
+        worker.requests.put(("attach", self._ring.name, self._ring.layout()))
+        with self._cond:
+            worker.ready = True
+            self._cond.notify_all()
+
+    def _wait_ready(self, timeout):
+        deadline = time.perf_counter() + timeout
+        signature, pending = None, {worker.worker_id for worker in self._workers}
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"Processus d'inférence non prêts après {timeout}s")
+            try:
+                message = self._responses.get(timeout=min(remaining, 0.5))
+            except queue.Empty:
+                if any(not self._workers[i].process.is_alive() for i in pending):
+                    raise RuntimeError("Un processus d'inférence s'est arrêté au démarrage")
+                continue
+            if message[0] == "failed":
+                raise RuntimeError(f"Processus {message[1]} : {message[2]}")
+            if message[0] == "ready":
+                pending.discard(message[1])
+                signature = message[2]
+        return signature
+
+    def _supervise_loop(self):
+        while not self._closing:
+            time.sleep(0.5)
+            for worker in self._workers:
+                if self._closing:
+                    continue
+                if worker.process.is_alive():
+                    if not self._hung(worker):
+                        continue
+                    # Vivant mais bloqué (invoke qui ne rend pas la main) : il garderait
+                    # ses emplacements pour toujours, on le remplace comme un processus mort
+                    print(f"⏱️ Processus d'inférence {worker.worker_id} sans réponse depuis "
+                          f"{self.request_timeout}s, arrêt forcé")
+                    worker.hung += 1
+                    worker.process.terminate()
+                    worker.process.join(2.0)
+                    if worker.process.is_alive():
+                        worker.process.kill()
+                        worker.process.join(2.0)
+                with self._cond:
+                    worker.ready = False
+                    failed = [self._futures.pop(request_id, (None, 0))[0] for request_id in worker.in_flight]
+                    worker.in_flight.clear()
+                    worker.free = deque(worker.slots)
+                    worker.restarts += 1
+                print(f"♻️ Processus d'inférence {worker.worker_id} arrêté "
+                      f"(code {worker.process.exitcode}), redémarrage...")
+                for future in failed:
+                    if future is not None:
+                        future.set_exception(RuntimeError(f"Processus {worker.worker_id} arrêté"))
+                self._spawn(worker)
+
+    def _hung(self, worker):
+        """Plus ancienne requête en cours du processus envoyée depuis plus de request_timeout."""
+        with self._cond:
+            sent = [self._futures[request_id][1] for request_id in worker.in_flight
+                    if request_id in self._futures]
+        return bool(sent) and time.perf_counter() - min(sent) > self.request_timeout
+
+    def _collect_loop(self):
+        while not self._closing:
+            try:
+                message = self._responses.get(timeout=0.5)
+            except (queue.Empty, OSError, EOFError):
+                continue
+            kind, worker = message[0], self._workers[message[1]]
+            if kind == "ready":
+                self._attach(worker)
+            elif kind == "failed":
+                print(f"❌ Processus {worker.worker_id} : {message[2]}")
+            else:
+                self._complete(worker, message)
+
+    def _complete(self, worker, message):
+        kind, _, request_id, slot = message[:4]
+        with self._cond:
+            if request_id not in worker.in_flight:
+                return  # réponse d'un processus déjà remplacé
+            result = self._ring.read_outputs(slot, message[4]) if kind == "result" else None
+            del worker.in_flight[request_id]
+            worker.free.append(slot)
+            future, sent_at = self._futures.pop(request_id)
+            self._cond.notify_all()
+        if result is None:
+            self.errors += 1
+            future.set_exception(RuntimeError(message[4]))
+            return
+        # Latence vue par l'appelant : transport aller-retour compris
+        processing_time = (time.perf_counter() - sent_at) * 1000
+        if self.first_frame_ms is None:
+            self.first_frame_ms = processing_time
+        self.completed += 1
+        future.set_result((*result, processing_time))
+
+    # --- Requêtes ---
+    def _pick_worker(self):
+        candidates = [worker for worker in self._workers if worker.ready and worker.free]
+        return max(candidates, key=lambda worker: len(worker.free)) if candidates else None
+
+    def predict_async(self, image, score_threshold=None):
+        """Envoie une image au processus le moins chargé, retourne un Future."""
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("ProcessDetector fermé")
+            if not self._cond.wait_for(self._pick_worker, self.request_timeout):
+                raise TimeoutError("Aucun processus d'inférence disponible")
+            worker = self._pick_worker()
+            slot = worker.free.popleft()
+            request_id = next(self._ids)
+            future = Future()
+            worker.in_flight[request_id] = slot
+            self._futures[request_id] = (future, time.perf_counter())
+        try:
+            # Redimensionnement directement dans la mémoire partagée (une seule écriture)
+            cv2.resize(image, (self.input_width, self.input_height), dst=self._ring.frame(slot))
+            worker.requests.put(("predict", request_id, slot, score_threshold))
+        except Exception:
+            # Image invalide (vide, mauvais type) : l'emplacement revient au processus
+            with self._cond:
+                if worker.in_flight.pop(request_id, None) is not None:
+                    worker.free.append(slot)
+                self._futures.pop(request_id, None)
+                self._cond.notify_all()
+            raise
+        return future
+
+    def predict(self, image, score_threshold=None):
+        return self.predict_async(image, score_threshold).result(self.request_timeout)
+
+    def predict_many(self, images, score_threshold=None):
+        futures = [self.predict_async(image, score_threshold) for image in images]
+        return [future.result(self.request_timeout) for future in futures]
+
+    def detect(self, image, score_threshold=None):
+        boxes, classes, scores, processing_time = self.predict(image, score_threshold)
+        return Detections(boxes, classes, scores, processing_time)
+
+    def detect_many(self, images, score_threshold=None):
+        return [Detections(boxes, classes, scores, processing_time)
+                for boxes, classes, scores, processing_time in self.predict_many(images, score_threshold)]
+
+    def _shutdown_processes(self):
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.requests.put(None)
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(2.0)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+    def close(self):
+        self._closing = True
+        self._shutdown_processes()
+        for thread in self._threads:
+            thread.join(1.0)
+        with self._cond:
+            pending = [future for future, _ in self._futures.values()]
+            self._futures.clear()
+        for future in pending:
+            future.set_exception(RuntimeError("ProcessDetector fermé"))
+        self._ring.close()
+        self._ring.unlink()
+
+    def snapshot(self):
+        return {
+            "transport": "shared_memory",
+            "processes": len(self._workers),
+            "alive": sum(worker.process.is_alive() for worker in self._workers),
+            "restarts": sum(worker.restarts for worker in self._workers),
+            "hung": sum(worker.hung for worker in self._workers),
+            "in_flight": sum(len(worker.in_flight) for worker in self._workers),
+            "completed": self.completed,
+            "errors": self.errors,
+            "slot_bytes": self._ring.slot_bytes,
+        }
@@ -0,0 +1,372 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.capture import IMAGE_EXTENSIONS, REDUCED_FLAGS, _fit_width
+
+# Offline batch detection over recorded data (datasets/, data/): videos and
+# image folders are split into fixed-size frame chunks, scored by a process
+# pool (one EdgeDetector per worker, decode prefetched in a thread) and written
+# as one columnar file per chunk. Output lives under <output>/<model>-<sha>/,
+# so re-scoring an archive after an OTA model change never mixes results, and
+# a rerun of the same command only processes the chunks that are missing.
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+MANIFEST = "manifest.json"
+
+_detector = None  # one per worker process (see init_worker)
+
+
+# --- Inputs and chunking ---
+
+def source_key(path):
+    """Stable id of an input: path, size and mtime (a re-recorded file gets new chunks)."""
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return f"{Path(path).stem}-{digest.hexdigest()[:10]}"
+
+
+def discover(inputs):
+    """Expand CLI inputs into sources: every video file, and every folder holding images."""
+    sources = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_file():
+            if path.suffix.lower() in VIDEO_EXTENSIONS:
+                sources.append({"kind": "video", "path": str(path)})
+            elif path.suffix.lower() in IMAGE_EXTENSIONS:
+                sources.append({"kind": "images", "path": str(path), "files": [str(path)]})
+            continue
+        if not path.is_dir():
+            raise FileNotFoundError(f"No such input: {item}")
+        for folder, dirs, files in os.walk(path):
+            dirs.sort()
+            files = sorted(files)
+            images = [os.path.join(folder, f) for f in files if Path(f).suffix.lower() in IMAGE_EXTENSIONS]
+            if images:
+                sources.append({"kind": "images", "path": folder, "files": images})
+            sources.extend({"kind": "video", "path": os.path.join(folder, f)}
+                           for f in files if Path(f).suffix.lower() in VIDEO_EXTENSIONS)
+    return sources
+
+
+def plan_chunks(sources, chunk_size):
+    """Split each source into [start, stop) frame ranges; the last video chunk reads to EOF."""
+    chunks, seen = [], set()
+    for source in sources:
+        if source["kind"] == "video":
+            cap = cv2.VideoCapture(source["path"])
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+            cap.release()
+            if total <= 0:
+                print(f"⚠️ {source['path']}: unreadable or empty video, skipped")
+                continue
+            key = source_key(source["path"])
+        else:
+            total = len(source["files"])
+            # A folder's id covers its file list: adding images re-plans its chunks
+            digest = hashlib.sha1("|".join(source["files"]).encode())
+            for f in source["files"]:
+                stat = os.stat(f)
+                digest.update(f"{stat.st_size}|{stat.st_mtime_ns}".encode())
+            key = f"{Path(source['path']).name}-{digest.hexdigest()[:10]}"
+        if key in seen:
+            continue  # same input given twice (e.g. a file and its folder)
+        seen.add(key)
+        for start in range(0, total, chunk_size):
+            stop = min(start + chunk_size, total)
+            chunk = {"id": f"{key}-{start:08d}", "kind": source["kind"], "source": source["path"],
+                     "start": start, "stop": stop}
+            if source["kind"] == "video":
+                chunk["stop"] = None if stop == total else stop
+            else:
+                chunk["files"] = source["files"][start:stop]
+            chunks.append(chunk)
+    return chunks
+
+
+# --- Worker side ---
+
+def init_worker(model_path, num_threads):
+    global _detector
+    from app.inference import EdgeDetector
+
+    _detector = EdgeDetector(model_path, num_threads=num_threads)
+
+
+def read_frames(chunk, max_width):
+    """Yield (frame_index, timestamp_ms, image_name, frame) for one chunk."""
+    if chunk["kind"] == "images":
+        flag = cv2.IMREAD_COLOR
+        for offset, path in enumerate(chunk["files"]):
+            frame = cv2.imread(path, flag)
+            if frame is None:
+                continue
+            if offset == 0 and max_width:
+                # JPEG DCT scaling, picked once per chunk from the first image
+                for factor, reduced in REDUCED_FLAGS:
+                    if frame.shape[1] // factor >= max_width:
+                        flag = reduced
+                        break
+            yield chunk["start"] + offset, None, os.path.basename(path), _fit_width(frame, max_width)
+        return
+
+    cap = cv2.VideoCapture(chunk["source"])
+    if chunk["start"]:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, chunk["start"])
+    index = chunk["start"]
+    try:
+        while chunk["stop"] is None or index < chunk["stop"]:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield index, cap.get(cv2.CAP_PROP_POS_MSEC), None, _fit_width(frame, max_width)
+            index += 1
+    finally:
+        cap.release()
+
+
+def prefetch(iterator, depth):
+    """Decode in a background thread so cv2 decoding overlaps TFLite invoke (both drop the GIL)."""
+    frames = queue.Queue(maxsize=max(1, depth))
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterator:
+                frames.put(item)
+        except Exception as e:
+            errors.append(e)
+        frames.put(done)
+
+    threading.Thread(target=produce, name="batch-decode", daemon=True).start()
+    while True:
+        item = frames.get()
+        if item is done:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+
+def process_chunk(chunk, output_path, fmt, min_score, max_width, depth):
+    """Score one chunk and write it atomically (a half-written chunk never counts as done)."""
+    columns = {name: [] for name in ("source", "frame", "timestamp_ms", "image", "width", "height",
+                                     "latency_ms", "boxes", "classes", "scores")}
+    start = time.perf_counter()
+    infer_ms = 0.0
+    detections_total = 0
+    for index, timestamp_ms, image, frame in prefetch(read_frames(chunk, max_width), depth):
+        detections = _detector.detect(frame, min_score)
+        infer_ms += detections.latency_ms
+        detections_total += len(detections)
+        columns["source"].append(chunk["source"])
+        columns["frame"].append(index)
+        columns["timestamp_ms"].append(timestamp_ms)
+        columns["image"].append(image)
+        columns["height"].append(frame.shape[0])
+        columns["width"].append(frame.shape[1])
+        columns["latency_ms"].append(detections.latency_ms)
+        columns["boxes"].append(detections.boxes.reshape(-1))
+        columns["classes"].append(detections.classes.astype(np.int32))
+        columns["scores"].append(detections.scores)
+
+    tmp_path = f"{output_path}.tmp"
+    if fmt == "parquet":
+        write_parquet(columns, tmp_path, _detector)
+    else:
+        write_jsonl(columns, tmp_path)
+    os.replace(tmp_path, output_path)
+    frames = len(columns["frame"])
+    return {
+        "frames": frames,
+        "detections": detections_total,
+        "seconds": round(time.perf_counter() - start, 3),
+        "infer_ms_mean": round(infer_ms / frames, 3) if frames else None,
+        "pid": os.getpid(),
+    }
+
+
+def write_parquet(columns, path, detector):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("source", pa.string()), ("frame", pa.int64()), ("timestamp_ms", pa.float64()),
+        ("image", pa.string()), ("width", pa.int32()), ("height", pa.int32()),
+        ("latency_ms", pa.float32()),
+        # Flattened [ymin, xmin, ymax, xmax] per detection, normalised to [0, 1]
+        ("boxes", pa.list_(pa.float32())), ("classes", pa.list_(pa.int32())),
+        ("scores", pa.list_(pa.float32())),
+    ], metadata={"model": os.path.basename(detector.model_path), "model_id": str(detector.model_id)})
+    pq.write_table(pa.Table.from_pydict(columns, schema=schema), path, compression="zstd")
+
+
+def write_jsonl(columns, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in zip(*columns.values()):
+            record = dict(zip(columns, row))
+            record["boxes"] = np.round(record["boxes"].reshape(-1, 4).astype(np.float64), 4).tolist()
+            record["scores"] = np.round(record["scores"].astype(np.float64), 3).tolist()
+            record["classes"] = record["classes"].tolist()
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+# --- Driver ---
+
+def load_manifest(run_dir, settings):
+    path = run_dir / MANIFEST
+    if not path.exists():
+        return {"settings": settings, "chunks": {}}
+    manifest = json.loads(path.read_text())
+    if manifest["settings"] != settings:
+        raise SystemExit(f"{run_dir} was scored with other settings {manifest['settings']}; "
+                         f"use --restart or another --output")
+    return manifest
+
+
+def save_manifest(run_dir, manifest):
+    tmp_path = run_dir / f"{MANIFEST}.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, run_dir / MANIFEST)
+
+
+def run_batch(inputs, model_path, output="results/batch", workers=None, chunk_size=500,
+              num_threads=None, min_score=0.1, max_width=0, fmt=None, prefetch_depth=8,
+              restart=False):
+    from app.inference import model_digest
+
+    if fmt is None:
+        try:
+            import pyarrow  # noqa: F401
+            fmt = "parquet"
+        except ImportError:
+            fmt = "jsonl"
+            print("⚠️ pyarrow not installed, writing JSONL chunks")
+    if not workers:
+        workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    if num_threads is None:
+        num_threads = 1 if workers > 1 else None  # one core per worker process
+
+    sha256 = model_digest(model_path)
+    run_dir = Path(output) / f"{Path(model_path).stem}-{sha256[:12]}"
+    settings = {"model": str(model_path), "sha256": sha256, "chunk_size": chunk_size,
+                "min_score": min_score, "max_width": max_width, "format": fmt}
+    run_dir.mkdir(parents=True, exist_ok=True)
+    if restart and (run_dir / MANIFEST).exists():
+        (run_dir / MANIFEST).unlink()
+    manifest = load_manifest(run_dir, settings)
+
+    chunks = plan_chunks(discover(inputs), chunk_size)
+    done = manifest["chunks"]
+    pending = [c for c in chunks
+               if c["id"] not in done or not (run_dir / done[c["id"]]["file"]).exists()]
+    print(f"📦 {len(chunks)} chunks ({len(chunks) - len(pending)} already done), "
+          f"{workers} worker(s), model {Path(model_path).name} [{sha256[:12]}] -> {run_dir}")
+
+    start = time.perf_counter()
+    frames = 0
+    interrupted = False
+
+    def record(chunk, stats):
+        nonlocal frames
+        frames += stats["frames"]
+        done[chunk["id"]] = {"file": f"{chunk['id']}.{fmt}", "source": chunk["source"],
+                             "start": chunk["start"], "stop": chunk["stop"], **stats}
+        save_manifest(run_dir, manifest)
+        elapsed = time.perf_counter() - start
+        print(f"   ✅ {chunk['id']}: {stats['frames']} frames, {stats['detections']} detections "
+              f"({len(done)}/{len(chunks)}, {frames / elapsed:.1f} frames/s)")
+
+    try:
+        if workers == 1:
+            init_worker(str(model_path), num_threads)
+            for chunk in pending:
+                record(chunk, process_chunk(chunk, run_dir / f"{chunk['id']}.{fmt}", fmt,
+                                            min_score, max_width, prefetch_depth))
+        else:
+            # spawn: no TFLite state inherited from the parent; at most 2 chunks queued per worker
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=init_worker,
+                                     initargs=(str(model_path), num_threads)) as pool:
+                todo = iter(pending)
+                running = {}
+                try:
+                    while True:
+                        while len(running) < 2 * workers:
+                            chunk = next(todo, None)
+                            if chunk is None:
+                                break
+                            future = pool.submit(process_chunk, chunk, run_dir / f"{chunk['id']}.{fmt}",
+                                                 fmt, min_score, max_width, prefetch_depth)
+                            running[future] = chunk
+                        if not running:
+                            break
+                        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            record(running.pop(future), future.result())
+                except BaseException:
+                    for future in running:
+                        future.cancel()
+                    raise
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n🛑 Interrupted: completed chunks are kept, rerun the same command to resume")
+
+    elapsed = time.perf_counter() - start
+    report = {
+        "model": str(model_path),
+        "sha256": sha256,
+        "output": str(run_dir),
+        "format": fmt,
+        "workers": workers,
+        "num_threads": num_threads,
+        "chunks_total": len(chunks),
+        "chunks_done": sum(1 for c in chunks if c["id"] in done),
+        "chunks_skipped": len(chunks) - len(pending),
+        "frames_processed": frames,
+        "frames_total": sum(done[c["id"]]["frames"] for c in chunks if c["id"] in done),
+        "detections_total": sum(done[c["id"]]["detections"] for c in chunks if c["id"] in done),
+        "elapsed_s": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else None,
+        "complete": not interrupted and all(c["id"] in done for c in chunks),
+    }
+    (run_dir / "report.json").write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline batch detection over videos and image folders")
+    parser.add_argument("inputs", nargs="+", help="video files, image files or folders (walked recursively)")
+    parser.add_argument("--model", type=str, default="models/model_int8.tflite")
+    parser.add_argument("--output", type=str, default="results/batch")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: available cores)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="frames per chunk")
+    parser.add_argument("--num-threads", type=int, default=None,
+                        help="TFLite threads per worker (default: 1 with several workers)")
+    parser.add_argument("--min-score", type=float, default=0.1)
+    parser.add_argument("--max-width", type=int, default=0, help="downscale frames before inference")
+    parser.add_argument("--format", type=str, default=None, choices=["parquet", "jsonl"],
+                        help="default: parquet when pyarrow is installed")
+    parser.add_argument("--prefetch", type=int, default=8, help="decoded frames buffered per worker")
+    parser.add_argument("--restart", action="store_true", help="ignore chunks scored by a previous run")
+    args = parser.parse_args()
+
+    report = run_batch(args.inputs, args.model, args.output, args.workers, args.chunk_size,
+                       args.num_threads, args.min_score, args.max_width, args.format,
+                       args.prefetch, args.restart)
+    print(f"🏁 {report['frames_processed']} frames in {report['elapsed_s']} s "
+          f"-> {report['fps']} frames/s ({report['chunks_done']}/{report['chunks_total']} chunks, "
+          f"{report['detections_total']} detections)")
+    sys.exit(0 if report["complete"] else 1)
@@ -1,4 +1,6 @@
 import argparse
+import subprocess
+import sys
 import time
 import json
 import os
@@ -7,39 +9,152 @@ import platform
 from pathlib import Path
 import numpy as np
 
-# --- CORRECTION ICI (Gestion hybride) ---
-try:
-    # Essayer la version légère (Raspberry Pi / ARM)
-    from tflite_runtime.interpreter import Interpreter
-except ImportError:
-    # Sinon utiliser TensorFlow complet (PC / Cloud x86)
+_INTERPRETER = None
+
+def interpreter_class():
+    """TFLite Interpreter, imported on first use (--decode, --startup and --input never need it).
+
+    tflite_runtime (Raspberry Pi / ARM), else ai_edge_litert, else full TensorFlow (x86 CI).
+    """
+    global _INTERPRETER
+    if _INTERPRETER is None:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from ai_edge_litert.interpreter import Interpreter
+            except ImportError:
+                try:
+                    import tensorflow.lite as tflite
+                    Interpreter = tflite.Interpreter
+                except ImportError:
+                    raise ImportError("Ni tflite_runtime ni tensorflow ne sont installés !")
+        _INTERPRETER = Interpreter
+    return _INTERPRETER
+
+MODEL_MAP = {
+    "fp32": "models/model_float32.tflite",
+    "int8": "models/model_int8.tflite"
+}
+
+DEFAULT_VIDEO = "data/video_test.mp4"
+DEFAULT_IMAGES = "data/calibration"
+SCENARIOS = ("invoke", "predict", "pipeline")
+PERCENTILES = (50, 90, 95, 99)
+
+# --- Measurement helpers ---
+
+def pin_cpus(cpus):
+    """Pin this process (and the TFLite threads it spawns) to the given cores."""
+    if cpus:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        else:
+            psutil.Process().cpu_affinity(list(cpus))
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    try:
+        return sorted(psutil.Process().cpu_affinity())
+    except (AttributeError, psutil.Error):
+        return None
+
+def peak_rss_mb():
+    """Process high-water mark, read once outside the timed loop."""
     try:
-        import tensorflow.lite as tflite
-        Interpreter = tflite.Interpreter
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux, in bytes on macOS
+        return peak / 1024 / 1024 if platform.system() == "Darwin" else peak / 1024
     except ImportError:
-        raise ImportError("Ni tflite_runtime ni tensorflow ne sont installés !")
+        return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
 
-# ... (le reste du code ne change pas) ...
+def time_calls(fn, warmup, iterations):
+    """Per-call durations in ns (perf_counter_ns), after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples[i] = time.perf_counter_ns() - start
+    return samples
 
-def run_benchmark(device: str = "CPU", precision: str = "fp32"):
-    model_map = {
-        "fp32": "models/model_float32.tflite",
-        "int8": "models/model_int8.tflite"
+def summarize(samples_ns, confidence=0.95, resamples=1000, seed=0):
+    """Mean / percentiles in ms with bootstrap confidence intervals."""
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    if samples.size == 0:
+        return {"n": 0}
+    values = np.percentile(samples, PERCENTILES)
+    summary = {
+        "n": int(samples.size),
+        "mean": round(float(samples.mean()), 4),
+        "std": round(float(samples.std(ddof=1)) if samples.size > 1 else 0.0, 4),
+        "min": round(float(samples.min()), 4),
+        "max": round(float(samples.max()), 4),
+        **{f"p{p}": round(float(v), 4) for p, v in zip(PERCENTILES, values)},
     }
+    # Percentile bootstrap: resample the run with replacement, recompute the statistic
+    rng = np.random.default_rng(seed)
+    boot = samples[rng.integers(0, samples.size, size=(resamples, samples.size))]
+    alpha = (1.0 - confidence) / 2 * 100
+    estimates = {"mean": boot.mean(axis=1), "p50": np.percentile(boot, 50, axis=1),
+                 "p99": np.percentile(boot, 99, axis=1)}
+    summary["confidence"] = confidence
+    summary["ci"] = {name: [round(float(np.percentile(est, alpha)), 4),
+                            round(float(np.percentile(est, 100 - alpha)), 4)]
+                     for name, est in estimates.items()}
+    return summary
 
-    model_path = model_map.get(precision)
+def random_input(input_shape, input_dtype):
+    if input_dtype == np.uint8:
+        # For INT8 quantized models - generate random UINT8 data
+        return np.random.randint(0, 256, size=input_shape, dtype=np.uint8)
+    if input_dtype == np.int8:
+        # For some INT8 models that use signed integers
+        return np.random.randint(-128, 128, size=input_shape, dtype=np.int8)
+    # For FP32 and other float models
+    return np.random.random(input_shape).astype(input_dtype)
+
+def load_frames(video_path, count):
+    """Decode up to `count` real frames up front so decoding stays out of the timings."""
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise FileNotFoundError(f"No frames decoded from {video_path}")
+    return frames
+
+def model_path_for(precision):
+    model_path = MODEL_MAP.get(precision)
     if not Path(model_path).exists():
         raise FileNotFoundError(f"Model not found: {model_path}. Check DVC pull.")
+    return model_path
+
+# --- Scenarios ---
+
+def run_benchmark(device: str = "CPU", precision: str = "fp32", num_threads=None,
+                  warmup: int = 10, iterations: int = 100):
+    """Raw interpreter invoke (set_tensor + invoke) on a random tensor.
+
+    Keeps the flat report read by the CI dashboard (avg_latency_ms, fps,
+    model_size_mb, peak_memory_mb) and adds the full latency distribution.
+    """
+    model_path = model_path_for(precision)
 
     print(f"Loading real {precision.upper()} model: {model_path} on {device}")
     arch = platform.machine()
     print(f"Detected architecture: {arch}")
 
-    interpreter = Interpreter(model_path=model_path)
+    interpreter = interpreter_class()(model_path=model_path, num_threads=num_threads)
     interpreter.allocate_tensors()
 
     input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
 
     # Get input shape and dtype from the model
     input_shape = input_details[0]['shape']
@@ -47,70 +162,978 @@ def run_benchmark(device: str = "CPU", precision: str = "fp32"):
     
     print(f"Model expects input shape: {input_shape}, dtype: {input_dtype}")
 
-    # Create dummy input with the correct dtype
-    if input_dtype == np.uint8:
-        # For INT8 quantized models - generate random UINT8 data
-        dummy_input = np.random.randint(0, 256, size=input_shape, dtype=np.uint8)
-    elif input_dtype == np.int8:
-        # For some INT8 models that use signed integers
-        dummy_input = np.random.randint(-128, 128, size=input_shape, dtype=np.int8)
-    else:
-        # For FP32 and other float models
-        dummy_input = np.random.random(input_shape).astype(input_dtype)
-
-    # Warmup
-    for _ in range(10):
-        interpreter.set_tensor(input_details[0]['index'], dummy_input)
-        interpreter.invoke()
+    dummy_input = random_input(input_shape, input_dtype)
+    input_index = input_details[0]['index']
 
-    num_frames = 100
-    total_time = 0.0
-    process = psutil.Process(os.getpid())
-    peak_memory_mb = process.memory_info().rss / 1024 / 1024
-
-    for _ in range(num_frames):
-        start = time.time()
-        interpreter.set_tensor(input_details[0]['index'], dummy_input)
+    def invoke():
+        interpreter.set_tensor(input_index, dummy_input)
         interpreter.invoke()
-        end = time.time()
-        total_time += (end - start)
 
-        mem = process.memory_info().rss / 1024 / 1024
-        if mem > peak_memory_mb:
-            peak_memory_mb = mem
+    samples = time_calls(invoke, warmup, iterations)
+    latency = summarize(samples)
+    total_time = samples.sum() / 1e9
 
-    avg_latency_ms = (total_time / num_frames) * 1000
-    fps = num_frames / total_time
+    avg_latency_ms = latency["mean"]
+    fps = iterations / total_time
     model_size_mb = os.path.getsize(model_path) / (1024 * 1024)
 
     metrics = {
+        "scenario": "invoke",
         "device": device,
         "precision": precision,
         "architecture": arch,
         "input_dtype": str(input_dtype),
         "avg_latency_ms": round(avg_latency_ms, 2),
         "fps": round(fps, 2),
+        "throughput_fps": round(fps, 2),
         "model_size_mb": round(model_size_mb, 1),
-        "peak_memory_mb": round(peak_memory_mb, 1),
-        "total_frames": num_frames,
+        "peak_memory_mb": round(peak_rss_mb(), 1),
+        "total_frames": iterations,
+        "warmup": warmup,
+        "num_threads": num_threads,
+        "latency_ms": latency,
         "notes": "Real TFLite inference"
     }
 
-    print(f"Benchmark complete: {fps:.1f} FPS, {avg_latency_ms:.2f} ms latency")
+    print(f"Benchmark complete: {fps:.1f} FPS, {avg_latency_ms:.2f} ms mean, "
+          f"p50 {latency['p50']:.2f} ms, p99 {latency['p99']:.2f} ms")
     return metrics
 
+def run_predict(precision: str = "fp32", num_threads=None, warmup: int = 10,
+                iterations: int = 100, video_path: str = DEFAULT_VIDEO):
+    """End-to-end EdgeDetector.predict (resize, quantization, invoke, outputs) on real frames."""
+    from app.inference import EdgeDetector
+
+    model_path = model_path_for(precision)
+    frames = load_frames(video_path, min(iterations + warmup, 64))
+    detector = EdgeDetector(model_path, num_threads=num_threads)
+    position = [0]
+
+    def predict():
+        detector.predict(frames[position[0] % len(frames)])
+        position[0] += 1
+
+    samples = time_calls(predict, warmup, iterations)
+    detector.close()
+    latency = summarize(samples)
+    return {
+        "scenario": "predict",
+        "precision": precision,
+        "num_threads": num_threads,
+        "frame_shape": list(frames[0].shape),
+        "distinct_frames": len(frames),
+        "throughput_fps": round(iterations / (samples.sum() / 1e9), 2),
+        "latency_ms": latency,
+        "peak_memory_mb": round(peak_rss_mb(), 1),
+    }
+
+def run_pipeline(precision: str = "fp32", num_threads=None, warmup: int = 10,
+                 iterations: int = 100, video_path: str = DEFAULT_VIDEO, timeout: float = 120.0):
+    """VisionPipeline throughput over a video file, decoded as fast as possible."""
+    import threading
+    from app.inference import EdgeDetector
+    from app.pipeline import VisionPipeline
+
+    model_path = model_path_for(precision)
+    if not Path(video_path).exists():
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    detector = EdgeDetector(model_path, num_threads=num_threads)
+
+    published = []
+    done = threading.Event()
+
+    def publish(frame, count, latency_ms):
+        published.append((time.perf_counter_ns(), latency_ms))
+        if len(published) >= warmup + iterations + 1:
+            done.set()
+
+    pipeline = VisionPipeline(video_path, lambda: detector, publish, realtime=False)
+    pipeline.start()
+    finished = done.wait(timeout)
+    pipeline.stop()
+    stages = pipeline.snapshot()
+    detector.close()
+    if not finished:
+        raise TimeoutError(f"Pipeline published {len(published)} frames in {timeout}s")
+
+    # Time between consecutive published frames, warmup frames excluded
+    timestamps = np.array([t for t, _ in published[warmup:warmup + iterations + 1]], dtype=np.int64)
+    intervals = np.diff(timestamps)
+    elapsed = (timestamps[-1] - timestamps[0]) / 1e9
+    return {
+        "scenario": "pipeline",
+        "precision": precision,
+        "num_threads": num_threads,
+        "video": video_path,
+        "throughput_fps": round(iterations / elapsed, 2),
+        "frame_interval_ms": summarize(intervals),
+        "latency_ms": summarize([latency * 1e6 for _, latency in published[warmup:warmup + iterations]]),
+        "dropped_frames": stages["dropped_frames"],
+        "stages": stages["stages"],
+        "bottleneck": stages["bottleneck"],
+        "peak_memory_mb": round(peak_rss_mb(), 1),
+    }
+
+SCENARIO_RUNNERS = {
+    "predict": run_predict,
+    "pipeline": run_pipeline,
+}
+
+def run_suite(scenarios, precision="fp32", thread_counts=(None,), warmup=10, iterations=100,
+              video_path=DEFAULT_VIDEO, cpus=None, device="CPU"):
+    """Every scenario x thread count, one JSON report with the run environment."""
+    affinity = pin_cpus(cpus)
+    results = []
+    for scenario in scenarios:
+        for num_threads in thread_counts:
+            print(f"[{scenario}] precision={precision} threads={num_threads}")
+            if scenario == "invoke":
+                result = run_benchmark(device, precision, num_threads, warmup, iterations)
+            else:
+                result = SCENARIO_RUNNERS[scenario](precision, num_threads, warmup, iterations, video_path)
+            print(f"  {result['throughput_fps']:.1f} FPS, p50 {result['latency_ms']['p50']:.2f} ms "
+                  f"(95% CI {result['latency_ms']['ci']['p50']}), p99 {result['latency_ms']['p99']:.2f} ms")
+            results.append(result)
+    return {
+        "meta": {
+            "device": device,
+            "precision": precision,
+            "model": MODEL_MAP.get(precision),
+            "architecture": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "cpu_affinity": affinity,
+            "warmup": warmup,
+            "iterations": iterations,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+# --- Compare mode ---
+
+# (metric, statistic, direction): +1 when higher is worse, -1 when lower is worse
+COMPARED_METRICS = (
+    ("latency_ms", "p50", +1),
+    ("latency_ms", "p99", +1),
+    ("throughput_fps", None, -1),
+)
+
+def _entries(report):
+    results = report["results"] if "results" in report else [report]
+    return {(r.get("scenario", "invoke"), r.get("precision"), r.get("num_threads")): r for r in results}
+
+def compare_reports(baseline, current, threshold=0.05):
+    """Flag a regression when the change exceeds `threshold` and, where the report
+    has bootstrap intervals, the two confidence intervals do not overlap."""
+    base_entries = _entries(baseline)
+    rows = []
+    for key, entry in _entries(current).items():
+        base = base_entries.get(key)
+        if base is None:
+            continue
+        for metric, stat, direction in COMPARED_METRICS:
+            if metric not in entry or metric not in base:
+                continue
+            old = base[metric][stat] if stat else base[metric]
+            new = entry[metric][stat] if stat else entry[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = change * direction > threshold
+            # Overlapping intervals = the difference may just be noise
+            old_ci = base[metric].get("ci", {}).get(stat) if stat else None
+            new_ci = entry[metric].get("ci", {}).get(stat) if stat else None
+            if worse and old_ci and new_ci:
+                worse = new_ci[0] > old_ci[1] if direction > 0 else new_ci[1] < old_ci[0]
+            rows.append({
+                "scenario": key[0], "precision": key[1], "num_threads": key[2],
+                "metric": f"{metric}.{stat}" if stat else metric,
+                "baseline": old, "current": new,
+                "change_pct": round(change * 100, 2),
+                "regression": bool(worse),
+            })
+    return {"threshold_pct": threshold * 100, "regressions": sum(r["regression"] for r in rows),
+            "comparisons": rows}
+
+def run_pool_sweep(precision: str = "fp32", thread_counts=(1, 2, 4), pool_sizes=(1, 2),
+                   num_frames: int = 200, warmup: int = 10):
+    """Throughput / latency of EdgeDetector for each (num_threads, pool_size) combination."""
+    # Imported here so the plain benchmark keeps working without OpenCV installed
+    from app.inference import EdgeDetector
+
+    model_path = MODEL_MAP.get(precision)
+    if not Path(model_path).exists():
+        raise FileNotFoundError(f"Model not found: {model_path}. Check DVC pull.")
+
+    # Camera-sized frames so preprocessing is part of the measurement
+    frames = [np.random.randint(0, 256, size=(480, 640, 3), dtype=np.uint8) for _ in range(8)]
+    results = []
+
+    for num_threads in thread_counts:
+        for pool_size in pool_sizes:
+            detector = EdgeDetector(model_path, num_threads=num_threads, pool_size=pool_size)
+            for i in range(warmup):
+                detector.predict(frames[i % len(frames)])
+
+            latencies = []
+            start = time.perf_counter()
+            done = 0
+            while done < num_frames:
+                # At most pool_size requests in flight: latency is service time, not queueing
+                chunk = [frames[(done + k) % len(frames)] for k in range(min(pool_size, num_frames - done))]
+                latencies.extend(result[3] for result in detector.predict_many(chunk))
+                done += len(chunk)
+            elapsed = time.perf_counter() - start
+            detector.close()
+
+            entry = {
+                "num_threads": num_threads,
+                "pool_size": pool_size,
+                "throughput_fps": round(num_frames / elapsed, 2),
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "latency_p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            }
+            print(f"threads={num_threads} pool={pool_size}: {entry['throughput_fps']:.1f} FPS, "
+                  f"p50 {entry['latency_p50_ms']:.2f} ms, p99 {entry['latency_p99_ms']:.2f} ms")
+            results.append(entry)
+
+    return {
+        "precision": precision,
+        "architecture": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "total_frames": num_frames,
+        "sweep": results,
+    }
+
+def run_process_sweep(precision: str = "fp32", core_counts=(1, 2, 4), iterations: int = 200,
+                      warmup: int = 10, video_path: str = DEFAULT_VIDEO):
+    """In-process EdgeDetector vs ProcessDetector (shared memory) pinned to 1, 2, 4 cores."""
+    from app.inference import EdgeDetector
+    from app.workers import ProcessDetector
+
+    model_path = model_path_for(precision)
+    frames = load_frames(video_path, 64)
+    available = pin_cpus(None) or list(range(os.cpu_count() or 1))
+    results = []
+
+    def measure(detector, in_flight):
+        detector.predict_many(frames[:warmup])
+        latencies = []
+        start = time.perf_counter_ns()
+        done = 0
+        while done < iterations:
+            chunk = [frames[(done + k) % len(frames)] for k in range(min(in_flight, iterations - done))]
+            latencies.extend(result[3] for result in detector.predict_many(chunk))
+            done += len(chunk)
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        return round(iterations / elapsed, 2), summarize([ms * 1e6 for ms in latencies])
+
+    try:
+        for cores in core_counts:
+            if cores > len(available):
+                print(f"cores={cores}: skipped, only {len(available)} available")
+                results.append({"cores": cores, "skipped": f"only {len(available)} cores available"})
+                continue
+            # Spawned worker processes inherit the affinity of the parent
+            pin_cpus(available[:cores])
+
+            detector = EdgeDetector(model_path, num_threads=cores)
+            thread_fps, thread_latency = measure(detector, 1)
+            detector.close()
+
+            detector = ProcessDetector(model_path, workers=cores, num_threads=1)
+            process_fps, process_latency = measure(detector, 2 * cores)
+            detector.close()
+
+            entry = {
+                "cores": cores,
+                "in_process_fps": thread_fps,
+                "in_process_latency_ms": thread_latency,
+                "processes_fps": process_fps,
+                "processes_latency_ms": process_latency,
+                "speedup": round(process_fps / thread_fps, 2) if thread_fps else None,
+            }
+            print(f"cores={cores}: in-process {thread_fps:.1f} FPS, {cores} processes "
+                  f"{process_fps:.1f} FPS (x{entry['speedup']})")
+            results.append(entry)
+    finally:
+        pin_cpus(available)
+
+    return {
+        "precision": precision,
+        "architecture": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "total_frames": iterations,
+        "processes": results,
+    }
+
+# --- Decode sweep ---
+
+def run_decode_sweep(video_path: str = DEFAULT_VIDEO, image_dir: str = DEFAULT_IMAGES,
+                     max_width: int = 320, iterations: int = 300, warmup: int = 10,
+                     cache_dir: str = "/tmp/edge-frames"):
+    """Per-frame read cost of each app.capture source, looping past the end of the clip."""
+    from app.capture import open_source
+
+    configs = [
+        ("video", video_path, {}),
+        ("video-resized", video_path, {"max_width": max_width}),
+        ("video-memmap", video_path, {"predecode": True, "cache_dir": cache_dir}),
+        ("video-memmap-resized", video_path, {"predecode": True, "cache_dir": cache_dir,
+                                              "max_width": max_width}),
+    ]
+    if Path(image_dir).is_dir():
+        configs += [
+            ("images", image_dir, {}),
+            ("images-reduced", image_dir, {"max_width": max_width}),
+        ]
+
+    results = []
+    for label, source, options in configs:
+        start = time.perf_counter()
+        reader = open_source(source, **options)
+        open_ms = (time.perf_counter() - start) * 1000
+        frame = reader.read()
+        samples = time_calls(reader.read, warmup, iterations)
+        reader.release()
+        latency = summarize(samples)
+        result = {
+            "scenario": f"decode-{label}",
+            "precision": None,
+            "num_threads": None,
+            "source": source,
+            "kind": reader.kind,
+            "downscale": reader.downscale,
+            "frame_shape": list(frame.shape),
+            # First open includes pre-decoding when the memmap cache is cold
+            "open_ms": round(open_ms, 2),
+            "throughput_fps": round(iterations / (samples.sum() / 1e9), 2),
+            "latency_ms": latency,
+        }
+        print(f"{label:22s} {reader.downscale:9s} {str(frame.shape):16s} "
+              f"p50 {latency['p50']:.3f} ms, p99 {latency['p99']:.3f} ms, open {open_ms:.1f} ms")
+        results.append(result)
+    return {
+        "meta": {
+            "architecture": platform.machine(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "max_width": max_width,
+            "warmup": warmup,
+            "iterations": iterations,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+# --- ROI / tiles / input resolution sweep ---
+
+REGION_MODES = (
+    # label, input size (None = native), tile grid, full view, ROIs (x1, y1, x2, y2 fractions)
+    ("full", None, None, True, None),
+    ("input-64x64", (64, 64), None, True, None),
+    ("input-160x160", (160, 160), None, True, None),
+    ("tiles-2x2", None, (2, 2), True, None),
+    ("tiles-2x2-no-full", None, (2, 2), False, None),
+    ("tiles-3x3", None, (3, 3), True, None),
+    ("roi-center", None, None, True, [(0.25, 0.25, 0.75, 0.75)]),
+    ("roi-center-tiles-2x2", None, (2, 2), True, [(0.25, 0.25, 0.75, 0.75)]),
+)
+# Pseudo ground truth: dense tiles at a higher input resolution (no labels in data/)
+REFERENCE_MODE = ("reference", (192, 192), (3, 3), True, None)
+
+def box_iou(a, b):
+    """IoU matrix between two (N, 4) / (M, 4) arrays of [ymin, xmin, ymax, xmax]."""
+    y1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    x1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    y2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    x2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(y2 - y1, 0, None) * np.clip(x2 - x1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def match_recall(reference, detections, rois, iou_threshold, small_area):
+    """(matched, total, small matched, small total) of reference boxes found by `detections`.
+
+    With ROIs, only reference boxes centred inside a ROI are expected to be found.
+    """
+    boxes = reference.boxes
+    if rois:
+        cy, cx = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+        inside = np.zeros(len(boxes), dtype=bool)
+        for x1, y1, x2, y2 in rois:
+            inside |= (cx >= x1) & (cx <= x2) & (cy >= y1) & (cy <= y2)
+        boxes, classes = boxes[inside], reference.classes[inside]
+    else:
+        classes = reference.classes
+    small = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) < small_area
+    if not len(boxes):
+        return 0, 0, 0, 0
+    if len(detections):
+        iou = box_iou(boxes, detections.boxes)
+        iou[classes[:, None] != detections.classes[None, :]] = 0.0
+        found = iou.max(axis=1) >= iou_threshold
+    else:
+        found = np.zeros(len(boxes), dtype=bool)
+    return int(found.sum()), len(boxes), int(found[small].sum()), int(small.sum())
+
+def run_region_sweep(precision: str = "int8", video_path: str = DEFAULT_VIDEO, frames: int = 50,
+                     warmup: int = 5, score: float = 0.3, iou_threshold: float = 0.5,
+                     small_area: float = 0.01, num_threads: int = None):
+    """Latency and recall (vs. a dense reference) of each app.regions mode on real frames."""
+    from app.inference import EdgeDetector
+    from app.regions import RegionPlan
+
+    model_path = MODEL_MAP[precision]
+    clip = load_frames(video_path, frames)
+
+    def build(mode):
+        label, input_size, grid, full_view, rois = mode
+        plan = RegionPlan(rois, grid, full_view=full_view) if (grid or rois) else None
+        try:
+            detector = EdgeDetector(model_path, batch_size=plan.count() if plan else 1,
+                                    num_threads=num_threads, input_size=input_size)
+        except ValueError as e:
+            print(f"{label:22s} skipped: {e}")
+            return None, None
+        if plan is None:
+            return detector, detector.detect
+        return detector, lambda frame: plan.detect(detector, frame)
+
+    detector, detect = build(REFERENCE_MODE)
+    reference = [detect(frame).filter(score) for frame in clip]
+    detector.close()
+
+    results = []
+    for mode in REGION_MODES:
+        label, input_size, grid, full_view, rois = mode
+        detector, detect = build(mode)
+        if detector is None:
+            continue
+        for frame in clip[:warmup]:
+            detect(frame)
+        samples = np.empty(len(clip), dtype=np.int64)
+        found = total = small_found = small_total = detections = 0
+        for i, frame in enumerate(clip):
+            start = time.perf_counter_ns()
+            result = detect(frame)
+            samples[i] = time.perf_counter_ns() - start
+            result = result.filter(score)
+            detections += len(result)
+            counts = match_recall(reference[i], result, rois, iou_threshold, small_area)
+            found, total = found + counts[0], total + counts[1]
+            small_found, small_total = small_found + counts[2], small_total + counts[3]
+        detector.close()
+        latency = summarize(samples)
+        result = {
+            "scenario": f"regions-{label}",
+            "precision": precision,
+            "num_threads": num_threads,
+            "input_size": list(input_size) if input_size else None,
+            "grid": list(grid) if grid else None,
+            "full_view": full_view,
+            "rois": [list(roi) for roi in rois] if rois else None,
+            # All regions of a frame go through a single batched invoke
+            "regions_per_frame": detector.batch_size,
+            "throughput_fps": round(len(clip) / (samples.sum() / 1e9), 2),
+            "latency_ms": latency,
+            "detections_per_frame": round(detections / len(clip), 2),
+            "recall": round(found / total, 3) if total else None,
+            "recall_small": round(small_found / small_total, 3) if small_total else None,
+        }
+        print(f"{label:22s} p50 {latency['p50']:.3f} ms, p95 {latency['p95']:.3f} ms, "
+              f"recall {result['recall']}, small {result['recall_small']}, "
+              f"{result['detections_per_frame']} det/frame")
+        results.append(result)
+    return {
+        "meta": {
+            "architecture": platform.machine(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": model_path,
+            "frames": len(clip),
+            "reference": {"input_size": list(REFERENCE_MODE[1]), "grid": list(REFERENCE_MODE[2]),
+                          "full_view": REFERENCE_MODE[3]},
+            "score_threshold": score,
+            "iou_threshold": iou_threshold,
+            "small_area": small_area,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+# --- Cold start and baseline memory ---
+
+# Budgets for the 512 MB / 0.5 CPU device profile (docker-compose.yml); any
+# measurement above its budget is reported as a regression (exit code 1).
+STARTUP_BUDGETS = {
+    "import_ms": 2000.0,          # import app.main (FastAPI, OpenCV, NumPy; no TFLite yet)
+    "model_load_ms": 500.0,       # TFLite runtime import + interpreter + allocate_tensors
+    "first_inference_ms": 300.0,
+    "import_rss_mb": 120.0,
+    "model_rss_mb": 150.0,
+    "server_ready_ms": 8000.0,    # uvicorn spawn -> /metrics answers
+    "first_frame_ms": 10000.0,    # uvicorn spawn -> first annotated JPEG on /video_feed
+    "server_rss_mb": 250.0,       # server (and worker processes) once frames are served
+}
+
+STARTUP_PROBE = """
+import json, sys, time
+import numpy as np
+import psutil
+rss = lambda: psutil.Process().memory_info().rss / 1e6
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+import_rss = rss()
+from app.inference import EdgeDetector
+detector = EdgeDetector(sys.argv[1])
+loaded = time.perf_counter()
+model_rss = rss()
+detector.predict(np.zeros((480, 640, 3), dtype=np.uint8))
+inferred = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000, "model_load_ms": (loaded - imported) * 1000,
+    "first_inference_ms": (inferred - loaded) * 1000, "import_rss_mb": import_rss,
+    "model_rss_mb": model_rss, "heavy_modules": sorted(m for m in ("tensorflow", "mlflow", "matplotlib",
+                                                                 "pandas", "pyarrow") if m in sys.modules),
+}))
+"""
+
+def process_rss_mb(pid):
+    """RSS of a process and its children (INFERENCE_WORKERS processes), in MB."""
+    process = psutil.Process(pid)
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 1e6
+
+def wait_first_frame(host, port, deadline):
+    """(ready_s, first_frame_s) measured with perf_counter: /metrics 200, then one full JPEG."""
+    import http.client
+    import socket
+
+    ready = None
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            if ready is None:
+                conn.request("GET", "/metrics")
+                if conn.getresponse().status == 200:
+                    ready = time.perf_counter()
+                conn.close()
+                continue
+            conn.request("GET", "/video_feed")
+            response = conn.getresponse()
+            data = b""
+            while time.perf_counter() < deadline:
+                data += response.read1(65536)
+                start = data.find(b"\xff\xd8")
+                if start >= 0 and data.find(b"\xff\xd9", start) >= 0:
+                    conn.close()
+                    return ready, time.perf_counter()
+        except (OSError, socket.timeout, http.client.HTTPException):
+            time.sleep(0.05)
+    return ready, None
+
+def check_budgets(measurements, budgets):
+    checks = []
+    for name, limit in budgets.items():
+        value = measurements.get(name)
+        checks.append({"metric": name, "value": round(value, 2) if value is not None else None,
+                       "budget": limit, "regression": value is None or value > limit})
+    return {"checks": checks, "regressions": [c["metric"] for c in checks if c["regression"]]}
+
+def run_startup(precision: str = "int8", port: int = 8078, budgets: dict = None,
+                settle_s: float = 3.0, timeout_s: float = 60.0):
+    """Cold start of the runtime: import, model load, first inference, first served frame, RSS."""
+    budgets = {**STARTUP_BUDGETS, **(budgets or {})}
+    model_path = MODEL_MAP[precision]
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+
+    probe = subprocess.run([sys.executable, "-c", STARTUP_PROBE, model_path], env=env,
+                           capture_output=True, text=True, timeout=timeout_s)
+    if probe.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{probe.stderr[-2000:]}")
+    measurements = json.loads(probe.stdout.strip().splitlines()[-1])
+
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+           "--port", str(port), "--log-level", "warning"]
+    start = time.perf_counter()
+    server = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready, first_frame = wait_first_frame("127.0.0.1", port, start + timeout_s)
+        measurements["server_ready_ms"] = (ready - start) * 1000 if ready else None
+        measurements["first_frame_ms"] = (first_frame - start) * 1000 if first_frame else None
+        if first_frame:
+            time.sleep(settle_s)  # steady state: pipeline threads and buffers allocated
+            measurements["server_rss_mb"] = process_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    report = check_budgets(measurements, budgets)
+    for check in report["checks"]:
+        flag = "REGRESSION" if check["regression"] else "ok"
+        print(f"{check['metric']:20s} {check['value']} (budget {check['budget']}) {flag}")
+    if measurements["heavy_modules"]:
+        print(f"Heavy modules loaded by the runtime: {', '.join(measurements['heavy_modules'])}")
+    return {
+        "meta": {
+            "architecture": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "model": model_path,
+            "timestamp": time.time(),
+        },
+        "startup": {k: round(v, 2) if isinstance(v, float) else v for k, v in measurements.items()},
+        "budgets": report,
+    }
+
+# Hooks hit per frame outside EdgeDetector.predict: frame() in the decode, inference and
+# annotate threads; decode, model, filter, draw and publish spans (motion, merge and
+# emit_results only when those features are on)
+PIPELINE_HOOKS = {"frame": 3, "span": 5}
+PROFILING_BUDGET_PCT = 1.0
+PROFILING_MODES = (("off", 0), ("sampled", 100), ("full", 1))
+
+def hook_cost_ns(fn, calls):
+    """Mean cost of fn(i) in ns, minus the bare loop."""
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        pass
+    loop_ns = time.perf_counter_ns() - start
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        fn(i)
+    return max(0.0, (time.perf_counter_ns() - start - loop_ns) / calls)
+
+def run_profiling(precision: str = "int8", num_threads=None, warmup: int = 20, iterations: int = 300,
+                  video_path: str = DEFAULT_VIDEO, rounds: int = 5, budget_pct: float = PROFILING_BUDGET_PCT,
+                  hook_calls: int = 200000):
+    """Cost of the tracing hooks: disabled (every untraced frame), sampled and full tracing.
+
+    The disabled overhead is the cost of the hooks one frame goes through, relative to the
+    work of one pipeline frame (decode + inference + annotate, tracing off).
+    """
+    from app.inference import EdgeDetector
+    from app.profiling import TRACER
+
+    model_path = model_path_for(precision)
+    TRACER.configure(sample_every=0)
+    pipeline = run_pipeline(precision, num_threads, warmup, iterations, video_path)
+    frame_ms = sum(stats["p50_ms"] for stats in pipeline["stages"].values())
+    frames = load_frames(video_path, 64)
+    detector = EdgeDetector(model_path, num_threads=num_threads)
+
+    # Spans opened by one predict (normalize only exists on float models)
+    TRACER.configure(sample_every=1)
+    recorded = TRACER.recorded
+    TRACER.frame(1)
+    detector.predict(frames[0])
+    hooks = {"frame": PIPELINE_HOOKS["frame"], "span": PIPELINE_HOOKS["span"] + TRACER.recorded - recorded}
+
+    def span(i):
+        with TRACER.span("bench"):
+            pass
+
+    TRACER.configure(sample_every=0)
+    disabled_ns = {"frame": hook_cost_ns(TRACER.frame, hook_calls), "span": hook_cost_ns(span, hook_calls)}
+    TRACER.configure(sample_every=1)
+    TRACER.frame(1)
+    traced_ns = {"frame": hook_cost_ns(lambda i: TRACER.frame(1), hook_calls // 10),
+                 "span": hook_cost_ns(span, hook_calls // 10)}
+
+    # End-to-end predict with each mode, interleaved so drift hits all modes alike
+    samples = {name: [] for name, _ in PROFILING_MODES}
+    position = [0]
+
+    def predict():
+        position[0] += 1
+        TRACER.frame(position[0])
+        detector.predict(frames[position[0] % len(frames)])
+
+    for _ in range(rounds):
+        for name, every in PROFILING_MODES:
+            TRACER.configure(sample_every=every)
+            samples[name].append(time_calls(predict, warmup, iterations // rounds))
+    TRACER.configure(sample_every=0)
+    detector.close()
+
+    modes = {name: summarize(np.concatenate(runs)) for name, runs in samples.items()}
+    disabled_pct = sum(hooks[k] * disabled_ns[k] for k in hooks) / (frame_ms * 1e6) * 100
+    for name, summary in modes.items():
+        summary["overhead_pct"] = round((summary["p50"] / modes["off"]["p50"] - 1) * 100, 2)
+    budgets = check_budgets({"disabled_overhead_pct": disabled_pct}, {"disabled_overhead_pct": budget_pct})
+    print(f"{hooks['frame']} frame() + {hooks['span']} span() per frame, disabled: "
+          f"{disabled_ns['frame']:.0f} + {disabled_ns['span']:.0f} ns each -> {disabled_pct:.3f}% "
+          f"of a {frame_ms:.3f} ms pipeline frame (budget {budget_pct}%)")
+    for name, summary in modes.items():
+        print(f"predict {name:8s} p50 {summary['p50']:.4f} ms ({summary['overhead_pct']:+.2f}% vs off)")
+    return {
+        "meta": {
+            "architecture": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "model": model_path,
+            "num_threads": num_threads,
+            "timestamp": time.time(),
+        },
+        "profiling": {
+            "hooks_per_frame": hooks,
+            "disabled_hook_ns": {k: round(v, 1) for k, v in disabled_ns.items()},
+            "traced_hook_ns": {k: round(v, 1) for k, v in traced_ns.items()},
+            "disabled_overhead_pct": round(disabled_pct, 4),
+            "pipeline_frame_ms": round(frame_ms, 4),
+            "pipeline_stages": pipeline["stages"],
+            # predict alone with tracing off / one frame in 100 / every frame
+            "predict_modes": modes,
+        },
+        "budgets": budgets,
+    }
+
+# Float32 reference first: the quantized rows report their saving against it
+QUANTIZED_IO_MODELS = (("fp32", MODEL_MAP["fp32"]), ("int8", MODEL_MAP["int8"]),
+                       ("sint8", "models/model_sint8.tflite"))
+
+def float_io(detector):
+    """Input / output conversion written with float math, as before the lookup tables."""
+    import cv2
+    from app.detections import Detections
+
+    size = (detector.input_width, detector.input_height)
+    detail = detector.input_details[0]
+    scale, zero_point = detail["quantization"]
+
+    def fill(interpreter, frame):
+        pixels = cv2.resize(frame, size).astype(np.float32) / 255.0
+        if detector.is_quantized:
+            info = np.iinfo(detail["dtype"])
+            pixels = np.clip(np.round(pixels / scale) + zero_point, info.min, info.max)
+        interpreter.tensor(detail["index"])()[0] = pixels
+
+    def read(interpreter, threshold):
+        arrays = []
+        for idx in (detector.boxes_idx, detector.classes_idx, detector.scores_idx):
+            out = detector.output_details[idx]
+            raw = interpreter.get_tensor(out["index"])[0]
+            out_scale, out_zero_point = out["quantization"]
+            if raw.dtype != np.float32 and out_scale:
+                arrays.append(((raw.astype(np.float32) - out_zero_point) * out_scale))
+            else:
+                arrays.append(raw.astype(np.float32))
+        boxes, classes, scores = arrays
+        return Detections(np.clip(boxes, 0, 1), np.rint(classes), scores).filter(threshold)
+
+    return fill, read
+
+def run_quantized_io(num_threads=None, warmup: int = 50, iterations: int = 1000,
+                     video_path: str = DEFAULT_VIDEO, score_threshold: float = 0.5, rounds: int = 5):
+    """Per-frame CPU spent around invoke(): feeding the input tensor and decoding the outputs.
+
+    "engine" is EdgeDetector (lookup tables, integer score cut, only survivors dequantized),
+    "float" the same conversions in float math over the whole tensors.
+    """
+    from app.inference import EdgeDetector
+
+    frames = load_frames(video_path, 32)
+    position = [0]
+
+    def next_frame():
+        position[0] += 1
+        return frames[position[0] % len(frames)]
+
+    def p50_us(*fns):
+        """Median of each fn in us, interleaved in rounds so drift hits them alike."""
+        runs = [[time_calls(fn, warmup, iterations // rounds) for fn in fns] for _ in range(rounds)]
+        return [round(float(np.percentile(np.concatenate(samples), 50)) / 1e3, 2) for samples in zip(*runs)]
+
+    models = {}
+    for name, model_path in QUANTIZED_IO_MODELS:
+        if not Path(model_path).exists():
+            continue
+        detector = EdgeDetector(model_path, num_threads=num_threads)
+        interpreter = detector.interpreter
+        fill, read = float_io(detector)
+        detector.predict(frames[0])
+        timings = dict(zip(("input_engine_us", "input_float_us"), p50_us(
+            lambda: detector._fill_input(interpreter, (next_frame(),)),
+            lambda: fill(interpreter, next_frame()))))
+        interpreter.invoke()
+        timings.update(zip(("outputs_engine_us", "outputs_float_us", "invoke_us"), p50_us(
+            lambda: detector._read_outputs(interpreter, 1, score_threshold),
+            lambda: read(interpreter, score_threshold),
+            interpreter.invoke)))
+        timings["io_engine_us"] = round(timings["input_engine_us"] + timings["outputs_engine_us"], 2)
+        timings["io_float_us"] = round(timings["input_float_us"] + timings["outputs_float_us"], 2)
+        timings["saved_us"] = round(timings["io_float_us"] - timings["io_engine_us"], 2)
+        timings["input_dtype"] = np.dtype(detector.input_details[0]["dtype"]).name
+        models[name] = timings
+        detector.close()
+
+    reference = models.get("fp32")
+    for name, timings in models.items():
+        if reference is not None and name != "fp32":
+            timings["saved_vs_fp32_us"] = round(reference["io_engine_us"] - timings["io_engine_us"], 2)
+        print(f"{name:6s} ({timings['input_dtype']}) input {timings['input_engine_us']:.1f} us "
+              f"(float {timings['input_float_us']:.1f}), outputs {timings['outputs_engine_us']:.1f} us "
+              f"(float {timings['outputs_float_us']:.1f}) -> {timings['saved_us']:.1f} us saved per frame, "
+              f"invoke {timings['invoke_us']:.1f} us")
+    return {
+        "meta": {
+            "architecture": platform.machine(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "frame_shape": list(frames[0].shape),
+            "score_threshold": score_threshold,
+            "num_threads": num_threads,
+            "timestamp": time.time(),
+        },
+        "quantized_io": models,
+    }
+
+def parse_budgets(value):
+    """'first_frame_ms=5000,server_rss_mb=250' -> dict overriding STARTUP_BUDGETS."""
+    budgets = {}
+    for item in value.split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() not in STARTUP_BUDGETS:
+            raise argparse.ArgumentTypeError(f"Unknown budget: {name} (expected {sorted(STARTUP_BUDGETS)})")
+        budgets[name.strip()] = float(limit)
+    return budgets
+
+def parse_int_list(value):
+    return tuple(int(v) for v in value.split(",") if v.strip())
+
+def parse_scenarios(value):
+    scenarios = SCENARIOS if value == "all" else tuple(v.strip() for v in value.split(",") if v.strip())
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown scenario(s): {sorted(unknown)}")
+    return scenarios
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Edge AI Benchmark")
     parser.add_argument("--output", type=str, required=True)
     parser.add_argument("--device", type=str, default="CPU")
     parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "int8"])
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--scenario", type=parse_scenarios, default=None,
+                        help="Comma-separated list of invoke,predict,pipeline (or 'all'); "
+                             "without it, the single raw invoke benchmark used by CI")
+    parser.add_argument("--video", type=str, default=DEFAULT_VIDEO)
+    parser.add_argument("--cpus", type=parse_int_list, default=None,
+                        help="Pin the process to these cores, e.g. 0 or 0,1")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Sweep EdgeDetector num_threads x pool_size instead of the raw benchmark")
+    parser.add_argument("--threads", type=parse_int_list, default=None,
+                        help="Thread counts to sweep (scenarios and --sweep)")
+    parser.add_argument("--pool-sizes", type=parse_int_list, default=(1, 2))
+    parser.add_argument("--processes", action="store_true",
+                        help="Compare in-process inference with shared-memory worker processes")
+    parser.add_argument("--cores", type=parse_int_list, default=(1, 2, 4))
+    parser.add_argument("--decode", action="store_true",
+                        help="Per-frame decode cost of each capture source (file, memmap, images)")
+    parser.add_argument("--startup", action="store_true",
+                        help="Cold start (import, model load, first inference, first frame) and RSS "
+                             "against budgets; exits with 1 when one is exceeded")
+    parser.add_argument("--budget", type=parse_budgets, default=None,
+                        help="With --startup: override budgets, e.g. first_frame_ms=5000,server_rss_mb=250")
+    parser.add_argument("--port", type=int, default=8078, help="With --startup: port of the test server")
+    parser.add_argument("--profiling", action="store_true",
+                        help="Overhead of the tracing hooks (disabled must stay under 1%% of a frame)")
+    parser.add_argument("--quantized-io", action="store_true",
+                        help="Input quantization / output decoding cost per frame, lookup tables vs float math")
+    parser.add_argument("--score-threshold", type=float, default=0.5,
+                        help="With --quantized-io: threshold applied while decoding the outputs")
+    parser.add_argument("--regions", action="store_true",
+                        help="Latency / recall of ROI, tiled and resized-input inference")
+    parser.add_argument("--images", type=str, default=DEFAULT_IMAGES)
+    parser.add_argument("--max-width", type=int, default=320,
+                        help="With --decode: width used for the downscaled variants")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Baseline JSON to diff against; exits with 1 on regression")
+    parser.add_argument("--input", type=str, default=None,
+                        help="With --compare: existing results to compare instead of running")
+    parser.add_argument("--threshold", type=float, default=5.0,
+                        help="Relative change (%%) tolerated before flagging a regression")
 
     args = parser.parse_args()
 
-    results = run_benchmark(device=args.device, precision=args.precision)
+    if args.input:
+        with open(args.input) as f:
+            results = json.load(f)
+    elif args.processes:
+        results = run_process_sweep(precision=args.precision, core_counts=args.cores,
+                                    iterations=args.iterations, warmup=args.warmup,
+                                    video_path=args.video)
+    elif args.decode:
+        pin_cpus(args.cpus)
+        results = run_decode_sweep(video_path=args.video, image_dir=args.images,
+                                   max_width=args.max_width, iterations=args.iterations,
+                                   warmup=args.warmup)
+    elif args.startup:
+        results = run_startup(precision=args.precision, port=args.port, budgets=args.budget)
+    elif args.profiling:
+        pin_cpus(args.cpus)
+        results = run_profiling(precision=args.precision, num_threads=args.num_threads,
+                                warmup=args.warmup, iterations=args.iterations,
+                                video_path=args.video)
+    elif args.quantized_io:
+        pin_cpus(args.cpus)
+        results = run_quantized_io(num_threads=args.num_threads, warmup=args.warmup,
+                                   iterations=args.iterations, video_path=args.video,
+                                   score_threshold=args.score_threshold)
+    elif args.regions:
+        pin_cpus(args.cpus)
+        results = run_region_sweep(precision=args.precision, video_path=args.video,
+                                   frames=args.iterations, warmup=args.warmup,
+                                   num_threads=args.num_threads)
+    elif args.sweep:
+        pin_cpus(args.cpus)
+        results = run_pool_sweep(precision=args.precision, thread_counts=args.threads or (1, 2, 4),
+                                 pool_sizes=args.pool_sizes)
+    elif args.scenario:
+        results = run_suite(args.scenario, precision=args.precision,
+                            thread_counts=args.threads or (args.num_threads,),
+                            warmup=args.warmup, iterations=args.iterations,
+                            video_path=args.video, cpus=args.cpus, device=args.device)
+    else:
+        pin_cpus(args.cpus)
+        results = run_benchmark(device=args.device, precision=args.precision,
+                                num_threads=args.num_threads, warmup=args.warmup,
+                                iterations=args.iterations)
 
+    budget_regressions = results.get("budgets", {}).get("regressions") if args.startup or args.profiling else None
     Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_reports(baseline, results, args.threshold / 100)
+        for row in comparison["comparisons"]:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            print(f"{row['scenario']:8s} threads={row['num_threads']} {row['metric']:16s} "
+                  f"{row['baseline']} -> {row['current']} ({row['change_pct']:+.1f}%) {flag}")
+        results = {"baseline": args.compare, "current": results, "comparison": comparison}
+
     with open(args.output, "w") as f:
         json.dump(results, f, indent=2)
 
-    print(f"Results saved to {args.output}")
\ No newline at end of file
+    print(f"Results saved to {args.output}")
+    if args.compare and results["comparison"]["regressions"]:
+        sys.exit(1)
+    if budget_regressions:
+        sys.exit(1)
\ No newline at end of file
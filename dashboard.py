@@ -1,7 +1,8 @@
+import json
+import threading
+from collections import deque
+
 import requests
-import time
-import matplotlib.pyplot as plt
-from IPython.display import clear_output
 
 # Configuration
 API_URL = "http://localhost:8000"
@@ -9,15 +10,102 @@ MODELS = {
     "RAPIDE": "models/model_int8.tflite",
     "LENT": "models/model_float32.tflite"
 }
+# Un point par seconde (agrégé côté device), 5 minutes gardées en mémoire
+STREAM_INTERVAL = 1.0
+HISTORY = 300
+
+
+class MetricsStream:
+    """Abonnement SSE à /metrics/stream : une seule connexion, le device pousse.
+
+    Un thread lit le flux et range les points dans un buffer circulaire de
+    taille fixe (`points`) ; `version` augmente à chaque point reçu. En cas
+    de coupure, la reconnexion envoie Last-Event-ID : le device ne renvoie
+    que les points manqués.
+    """
+
+    def __init__(self, api_url=API_URL, interval=STREAM_INTERVAL, history=HISTORY):
+        self.url = f"{api_url}/metrics/stream"
+        self.interval = interval
+        self.points = deque(maxlen=history)
+        self.state = {}
+        self.connected = False
+        self.version = 0
+        self._last_id = None
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-stream", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            headers = {"Last-Event-ID": str(self._last_id)} if self._last_id is not None else {}
+            try:
+                with requests.get(self.url, params={"interval": self.interval}, headers=headers,
+                                  stream=True, timeout=(3, 30)) as response:
+                    response.raise_for_status()
+                    self.connected, backoff = True, 0.5
+                    self._read_events(response)
+            except (requests.RequestException, ValueError):
+                pass
+            self.connected = False
+            self._notify()
+            self._stop.wait(backoff)
+            backoff = min(10.0, backoff * 2)
+
+    def _read_events(self, response):
+        event, data = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if self._stop.is_set():
+                return
+            if line is None or line.startswith(":"):
+                continue
+            if line:
+                field, _, value = line.partition(": ")
+                if field == "event":
+                    event = value
+                elif field == "data":
+                    data.append(value)
+                elif field == "id":
+                    self._last_id = int(value)
+                continue
+            if data:
+                self._handle(event, json.loads("\n".join(data)))
+            event, data = "message", []
+
+    def _handle(self, event, payload):
+        if event == "state":
+            self.state = payload
+        elif event == "history":
+            if self.points and payload and payload[0]["seq"] <= self.points[-1]["seq"]:
+                self.points.clear()  # device redémarré : numérotation repartie de zéro
+            self.points.extend(payload)
+        elif event == "point":
+            self.points.append(payload)
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait(self, version, timeout=None):
+        """Bloque jusqu'à un changement postérieur à `version`, retourne la nouvelle version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def since(self, seq):
+        """Points du buffer reçus après le point `seq` (mise à jour incrémentale des graphes)."""
+        return [p for p in list(self.points) if p["seq"] > seq]
 
-def get_metrics():
-    try:
-        response = requests.get(f"{API_URL}/metrics")
-        if response.status_code == 200:
-            return response.json()
-    except:
-        pass
-    return None
 
 def send_update(model_path):
     print(f"\n🚀 ENVOI DE LA MISE À JOUR OTA VERS : {model_path} ...")
@@ -35,26 +123,27 @@ def main():
     print("2. Changement de modèle à chaud")
     print("------------------------------------------")
 
-    # Historique pour le graphique (optionnel, ici on fait du texte)
+    # Le device pousse un point par seconde : plus aucune requête /metrics
+    stream = MetricsStream().start()
     try:
+        version = 0
         while True:
-            metrics = get_metrics()
-            
-            if metrics:
-                fps = metrics.get('fps', 0)
-                lat = metrics.get('latency_ms', 0)
-                ver = metrics.get('model_version', 'Inconnu')
-                obj = metrics.get('objects_detected', 0)
-                
-                # Affichage style "Tableau de bord"
-                print(f"\r[DEVICE STATUS] Modèle: {ver} | FPS: {fps:.2f} | Latence: {lat:.0f}ms | Objets: {obj}   ", end="")
-            
-            # Simulation d'interaction
-            # Si on veut changer de modèle manuellement, on pourrait ajouter un input ici
-            # Mais pour l'instant on monitore juste.
-            time.sleep(0.5)
-            
+            version = stream.wait(version, timeout=5.0)
+            if not stream.connected:
+                print("\r[DEVICE STATUS] ⚠️ Perte de signal, reconnexion...                              ", end="")
+                continue
+            points = list(stream.points)  # copie : le thread de lecture continue d'ajouter
+            if points:
+                point = points[-1]
+                ver = stream.state.get('model_version', 'Inconnu')
+                # Moyenne glissante sur le buffer circulaire (HISTORY points)
+                avg_fps = sum(p['fps'] for p in points) / len(points)
+                print(f"\r[DEVICE STATUS] Modèle: {ver} | FPS: {point['fps']:.2f} (moy. {avg_fps:.2f}) | "
+                      f"Latence: {point['latency_ms']:.0f}ms | p95: {point['p95_ms']:.0f}ms | "
+                      f"Objets: {point['objects']:.0f}   ", end="")
+
     except KeyboardInterrupt:
+        stream.stop()
         print("\n\n🛑 Interruption...")
         # Menu interactif à la fermeture
         choix = input("Voulez-vous changer le modèle avant de quitter ? (1: Rapide, 2: Lent, Enter: Non) : ")
@@ -2,8 +2,8 @@ import streamlit as st
 import requests
 import pandas as pd
 import time
-import plotly.express as px
-import mlflow
+
+from dashboard import MetricsStream
 
 # --- CONFIGURATION DE LA PAGE ---
 st.set_page_config(
@@ -55,11 +55,13 @@ MODELS = {
     "MODE PRÉCIS (Float32)": "models/model_float32.tflite"
 }
 
-def get_metrics():
-    try:
-        return requests.get(f"{API_URL}/metrics", timeout=1).json()
-    except:
-        return None
+# Points gardés (buffer circulaire) et affichés : 1 point/s agrégé par le device
+HISTORY = 120
+
+def to_frame(points):
+    return pd.DataFrame({"FPS": [p["fps"] for p in points],
+                         "Latence": [p["latency_ms"] for p in points]},
+                        index=pd.to_datetime([p["t"] for p in points], unit="s"))
 
 def send_ota(model_path):
     try:
@@ -68,6 +70,7 @@ def send_ota(model_path):
             if res.status_code == 200:
                 st.success("Mise à jour réussie !")
                 try:
+                    import mlflow  # lourd : chargé seulement lors d'une OTA
                     mlflow.set_tracking_uri("file:./mlruns") 
                     mlflow.set_experiment("Projet_10_Deployments")
                     with mlflow.start_run(run_name="OTA_Update"):
@@ -81,10 +84,10 @@ def send_ota(model_path):
     except Exception as e:
         st.error(f"Erreur de connexion : {e}")
 
-# Initialisation historiques
-if "history_fps" not in st.session_state: st.session_state.history_fps = []
-if "history_latency" not in st.session_state: st.session_state.history_latency = []
-if "history_time" not in st.session_state: st.session_state.history_time = []
+# Une seule connexion SSE par session, conservée entre les reruns Streamlit
+if "metrics_stream" not in st.session_state:
+    st.session_state.metrics_stream = MetricsStream(API_URL, interval=1.0, history=HISTORY).start()
+stream = st.session_state.metrics_stream
 
 st.title("Edge Vision : Centre de Contrôle")
 st.markdown("---")
@@ -112,52 +115,41 @@ with col_monitor:
     st.markdown(f"**Flux Vidéo Direct :** [Ouvrir le Stream]({API_URL}/video_feed)")
     st.image(f"{API_URL}/video_feed", caption="Live Edge View", width=400)
 
+# Mise à jour à l'arrivée de chaque point poussé par le device : les graphes
+# reçoivent seulement les nouvelles lignes (add_rows) et sont reconstruits
+# depuis le buffer tous les HISTORY points, pour borner ce que garde le navigateur.
+fps_chart = lat_chart = None
+drawn, last_seq, version = 0, -1, 0
 while True:
-    metrics = get_metrics()
-    if metrics:
-        fps = metrics.get('fps', 0)
-        lat = metrics.get('latency_ms', 0)
-        version = metrics.get('model_version', 'Inconnu')
-        obj = metrics.get('objects_detected', 0)
-
-        with metric_container.container():
-            st.metric("Modèle Actif", version)
-            c1, c2 = st.columns(2)
-            c1.metric("FPS", f"{fps:.2f}")
-            c2.metric("Objets", obj)
-            st.metric("Latence", f"{lat:.0f} ms")
-
-        current_time = time.strftime("%H:%M:%S")
-        st.session_state.history_time.append(current_time)
-        st.session_state.history_fps.append(fps)
-        st.session_state.history_latency.append(lat)
-
-        if len(st.session_state.history_time) > 30:
-            st.session_state.history_time.pop(0)
-            st.session_state.history_fps.pop(0)
-            st.session_state.history_latency.pop(0)
-
-        # --- MODIFICATION ICI : DATAFRAME COMPLET ---
-        df = pd.DataFrame({
-            "Temps": st.session_state.history_time,
-            "FPS": st.session_state.history_fps,
-            "Latence": st.session_state.history_latency
-        })
-
+    version = stream.wait(version, timeout=5.0)
+    if not stream.connected:
+        metric_container.error("⚠️ Perte de signal...")
+        continue
+    points = list(stream.points)
+    if points and points[-1]["seq"] < last_seq:
+        last_seq, fps_chart = -1, None  # device redémarré
+    new = [p for p in points if p["seq"] > last_seq]
+    if not new:
+        continue
+    last_seq = new[-1]["seq"]
+    point = new[-1]
+
+    with metric_container.container():
+        st.metric("Modèle Actif", stream.state.get('model_version', 'Inconnu'))
+        c1, c2 = st.columns(2)
+        c1.metric("FPS", f"{point['fps']:.2f}")
+        c2.metric("Objets", f"{point['objects']:.0f}")
+        st.metric("Latence", f"{point['latency_ms']:.0f} ms", help=f"p95 : {point['p95_ms']:.0f} ms")
+
+    if fps_chart is None or drawn + len(new) > HISTORY:
+        df = to_frame(points)
         # --- GRAPHIQUE 1 : FPS (Bleu) ---
-        with chart_fps:
-            fig_fps = px.line(df, x="Temps", y="FPS", title="Fluidité (FPS)", markers=True)
-            fig_fps.update_layout(yaxis_range=[0, 20], height=250)
-            st.plotly_chart(fig_fps, use_container_width=True)
-
+        fps_chart = chart_fps.line_chart(df[["FPS"]], height=250)
         # --- GRAPHIQUE 2 : LATENCE (Rouge) ---
-        with chart_lat:
-            fig_lat = px.line(df, x="Temps", y="Latence", title="Latence Système (ms)", markers=True)
-            fig_lat.update_traces(line_color='#FF4B4B') # Couleur rouge pour l'alerte
-            fig_lat.update_layout(height=250)
-            st.plotly_chart(fig_lat, use_container_width=True)
-
+        lat_chart = chart_lat.line_chart(df[["Latence"]], height=250, color="#FF4B4B")
+        drawn = len(df)
     else:
-        metric_container.error("⚠️ Perte de signal...")
-    
-    time.sleep(1)
\ No newline at end of file
+        df = to_frame(new)
+        fps_chart.add_rows(df[["FPS"]])
+        lat_chart.add_rows(df[["Latence"]])
+        drawn += len(new)
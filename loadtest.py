@@ -0,0 +1,677 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import psutil
+
+# Load test for the FastAPI service: starts app.main:app under a local uvicorn,
+# opens N /video_feed viewers with a raw asyncio stand-in client and measures
+# /metrics latency at each level. With the async endpoints, /metrics p99 must
+# stay flat as the number of viewers grows. With --stream-path /metrics/stream
+# the viewers are pushed-metrics dashboards instead, and the server CPU per
+# level shows what N dashboards cost the device.
+#
+# With --mix, each run is a traffic mix held for --duration seconds instead:
+# stream viewers, /metrics pollers (dashboard.py / dashboard_gui.py) and OTA
+# clients swapping models through /update-model. The server runs under the
+# CPU / memory limits of docker-compose.yml (cgroup, or taskset when cgroups
+# are not writable) and the report records server FPS, request latency
+# percentiles, RSS and dropped frames; --compare diffs it against a baseline.
+
+COMPOSE_FILE = "docker-compose.yml"
+LIMIT_MODES = ("auto", "cgroup", "taskset", "none")
+MIX_CLIENTS = ("viewers", "pollers", "ota")
+DEFAULT_MIXES = "viewers=1,pollers=1;viewers=5,pollers=2;viewers=5,pollers=2,ota=1"
+# Server settings copied into the report: two runs are only comparable with the same ones
+ENV_RECORDED = ("VIDEO_SOURCE", "VIDEO_SOURCES", "INFERENCE_WORKERS", "DETECTOR_NUM_THREADS",
+                "DETECTOR_POOL_SIZE", "DETECTION_CACHE_SIZE", "REGIONS_TILES", "REGIONS_ROIS",
+                "PROFILE_SAMPLE_EVERY")
+
+
+async def http_request(host, port, path, method="GET"):
+    """Minimal HTTP/1.1 request (Connection: close), returns (latency_ms, status_line, body)."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: 0\r\n"
+                 f"Connection: close\r\n\r\n".encode())
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    latency_ms = (time.perf_counter() - start) * 1000
+    head, _, body = data.partition(b"\r\n\r\n")
+    return latency_ms, head.split(b"\r\n", 1)[0].decode(errors="replace"), body
+
+
+async def http_get(host, port, path):
+    """GET, returns (latency_ms, status_line)."""
+    latency_ms, status, _ = await http_request(host, port, path)
+    return latency_ms, status
+
+
+async def stream_viewer(host, port, path, stop, counters, marker=b"--frame"):
+    """Stand-in viewer: reads the stream (MJPEG parts or SSE events) until told to stop."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        while not stop.is_set():
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            counters["bytes"] += len(chunk)
+            counters["frames"] += chunk.count(marker)
+        writer.close()
+    except (ConnectionError, OSError):
+        counters["errors"] += 1
+
+
+async def wait_until_ready(host, port, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, status = await http_get(host, port, "/metrics")
+            if " 200 " in status:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server not ready on {host}:{port} after {timeout}s")
+
+
+def server_processes(server_pid):
+    """The server and its children (inference worker processes)."""
+    process = psutil.Process(server_pid)
+    return [process] + process.children(recursive=True)
+
+
+def server_cpu_seconds(server_pid):
+    """User + system CPU time of the server processes, None when they are not ours to watch."""
+    if server_pid is None:
+        return None
+    total = 0.0
+    try:
+        for process in server_processes(server_pid):
+            times = process.cpu_times()
+            total += times.user + times.system
+    except psutil.Error:
+        return None
+    return total
+
+
+def server_rss_mb(server_pid):
+    if server_pid is None:
+        return None
+    try:
+        return sum(process.memory_info().rss for process in server_processes(server_pid)) / 1e6
+    except psutil.Error:
+        return None
+
+
+async def measure_level(host, port, viewers, samples, interval, stream_path, server_pid=None):
+    stop = asyncio.Event()
+    counters = {"bytes": 0, "frames": 0, "errors": 0}
+    marker = b"event: point" if stream_path.startswith("/metrics/stream") else b"--frame"
+    tasks = [asyncio.create_task(stream_viewer(host, port, stream_path, stop, counters, marker))
+             for _ in range(viewers)]
+    await asyncio.sleep(1.0)  # let viewers connect and reach steady state
+    counters["frames"] = 0
+    cpu_start = server_cpu_seconds(server_pid)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(samples):
+        latency_ms, status = await http_get(host, port, "/metrics")
+        if " 200 " in status:
+            latencies.append(latency_ms)
+        await asyncio.sleep(interval)
+    elapsed = time.perf_counter() - start
+    frames = counters["frames"]
+    cpu_end = server_cpu_seconds(server_pid)
+
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "viewers": viewers,
+        "metrics_requests": len(latencies),
+        "metrics_p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+        "metrics_p99_ms": round(float(np.percentile(latencies, 99)), 2) if latencies else None,
+        "metrics_max_ms": round(max(latencies), 2) if latencies else None,
+        "stream_fps_per_viewer": round(frames / elapsed / viewers, 2) if viewers else 0.0,
+        "stream_errors": counters["errors"],
+        # Share of one core used by the server during the level (decode + inference + clients)
+        "server_cpu_ratio": round((cpu_end - cpu_start) / elapsed, 3)
+        if cpu_start is not None and cpu_end is not None else None,
+    }
+
+
+async def run_loadtest(host, port, levels, samples, interval, stream_path, server_pid=None):
+    await wait_until_ready(host, port)
+    results = []
+    for viewers in levels:
+        result = await measure_level(host, port, viewers, samples, interval, stream_path, server_pid)
+        print(f"viewers={viewers:3d}: /metrics p50 {result['metrics_p50_ms']} ms, "
+              f"p99 {result['metrics_p99_ms']} ms, {result['stream_fps_per_viewer']} FPS/viewer, "
+              f"server CPU {result['server_cpu_ratio']}")
+        results.append(result)
+    return results
+
+
+# --- Resource limits ---
+
+def parse_memory(value):
+    """Docker-style size ('512M', '1g', '268435456') -> bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*", str(value).lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Invalid memory size: {value} (expected e.g. 512M)")
+    return int(float(match.group(1)) * 1024 ** " kmg".index(match.group(2) or " "))
+
+
+def compose_limits(path=COMPOSE_FILE):
+    """deploy.resources.limits (cpus, memory in bytes) of docker-compose.yml, None when absent."""
+    try:
+        text = Path(path).read_text()
+    except OSError:
+        return None, None
+    cpus = re.search(r"^\s*cpus:\s*['\"]?([\d.]+)", text, re.MULTILINE)
+    memory = re.search(r"^\s*memory:\s*['\"]?(\w+)", text, re.MULTILINE)
+    return (float(cpus.group(1)) if cpus else None,
+            parse_memory(memory.group(1)) if memory else None)
+
+
+class ServerLimits:
+    """Confines the server (and its worker processes) like the edge-device container.
+
+    - cgroup: a child cgroup with a CPU quota (cpus x period) and a hard memory
+      limit, v2 (unified) or v1 (cpu + memory controllers); the server joins it
+      before exec, so everything it spawns is accounted there;
+    - taskset: pinned to ceil(cpus) cores; the memory limit is not enforced,
+      only compared to the measured RSS.
+    """
+
+    CPU_PERIOD_US = 100000
+
+    def __init__(self, cpus=None, memory_bytes=None, mode="auto"):
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self.mode = "none" if mode == "none" or (cpus is None and memory_bytes is None) else mode
+        self.cores = None
+        self._cgroups = {}  # controller -> cgroup directory
+        self._version = None
+
+    def prepare(self):
+        if self.mode in ("auto", "cgroup"):
+            try:
+                self._create_cgroups()
+                self.mode = "cgroup"
+            except OSError as e:
+                self.cleanup()
+                if self.mode == "cgroup":
+                    raise SystemExit(f"Cannot create a cgroup ({e}); run as root or use --limit-mode taskset")
+                print(f"cgroups not writable ({e}), falling back to taskset")
+                self.mode = "taskset"
+        if self.mode == "taskset" and self.cpus is not None:
+            available = sorted(os.sched_getaffinity(0))
+            self.cores = available[:max(1, min(len(available), math.ceil(self.cpus)))]
+        return self
+
+    def _create_cgroups(self):
+        name = f"edge-loadtest-{os.getpid()}"
+        if Path("/sys/fs/cgroup/cgroup.controllers").exists():
+            self._version = 2
+            root = Path("/sys/fs/cgroup")
+            try:
+                (root / "cgroup.subtree_control").write_text("+cpu +memory")
+            except OSError:
+                pass  # already delegated, or only some controllers available
+            group = root / name
+            group.mkdir()
+            self._cgroups = {"cpu": group, "memory": group}
+            if self.cpus is not None:
+                (group / "cpu.max").write_text(f"{int(self.cpus * self.CPU_PERIOD_US)} {self.CPU_PERIOD_US}")
+            if self.memory_bytes is not None:
+                (group / "memory.max").write_text(str(self.memory_bytes))
+                _write_optional(group / "memory.swap.max", "0")
+        else:
+            self._version = 1
+            for controller in ("cpu", "memory"):
+                group = Path("/sys/fs/cgroup") / controller / name
+                group.mkdir()
+                self._cgroups[controller] = group
+            if self.cpus is not None:
+                (self._cgroups["cpu"] / "cpu.cfs_period_us").write_text(str(self.CPU_PERIOD_US))
+                (self._cgroups["cpu"] / "cpu.cfs_quota_us").write_text(str(int(self.cpus * self.CPU_PERIOD_US)))
+            if self.memory_bytes is not None:
+                (self._cgroups["memory"] / "memory.limit_in_bytes").write_text(str(self.memory_bytes))
+                _write_optional(self._cgroups["memory"] / "memory.memsw.limit_in_bytes", str(self.memory_bytes))
+
+    def preexec(self):
+        """Runs in the server process between fork and exec."""
+        if self.mode == "cgroup":
+            for group in set(self._cgroups.values()):
+                (group / "cgroup.procs").write_text(str(os.getpid()))
+        elif self.cores:
+            os.sched_setaffinity(0, self.cores)
+
+    def memory(self):
+        """cgroup memory: current and peak usage (MB), OOM kills; empty without a cgroup."""
+        group = self._cgroups.get("memory")
+        if group is None:
+            return {}
+        if self._version == 2:
+            current, peak, events = "memory.current", "memory.peak", "memory.events"
+        else:
+            current, peak, events = "memory.usage_in_bytes", "memory.max_usage_in_bytes", "memory.oom_control"
+        stats = {"current_mb": _read_int(group / current), "peak_mb": _read_int(group / peak)}
+        stats = {k: round(v / 1e6, 1) for k, v in stats.items() if v is not None}
+        try:
+            for line in (group / events).read_text().splitlines():
+                key, _, value = line.partition(" ")
+                if key == "oom_kill":
+                    stats["oom_kills"] = int(value)
+        except OSError:
+            pass
+        return stats
+
+    def cleanup(self):
+        for group in set(self._cgroups.values()):
+            for _ in range(20):  # the server may still be exiting
+                try:
+                    group.rmdir()
+                    break
+                except FileNotFoundError:
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        self._cgroups = {}
+
+    def describe(self):
+        return {
+            "mode": self.mode,
+            "cgroup_version": self._version,
+            "cpus": self.cpus,
+            "memory_mb": round(self.memory_bytes / 2 ** 20) if self.memory_bytes else None,
+            "cores": self.cores,
+            "cpu_enforced": self.mode == "cgroup" and self.cpus is not None,
+            "memory_enforced": self.mode == "cgroup" and self.memory_bytes is not None,
+        }
+
+
+def _read_int(path):
+    try:
+        return int(path.read_text().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _write_optional(path, value):
+    try:
+        path.write_text(value)
+    except OSError:
+        pass  # swap accounting disabled on this kernel
+
+
+# --- Traffic mixes ---
+
+def parse_mixes(value):
+    """'viewers=5,pollers=2,ota=1;viewers=10' -> [{'viewers': 5, 'pollers': 2, 'ota': 1}, ...]."""
+    mixes = []
+    for item in value.split(";"):
+        if not item.strip():
+            continue
+        mix = dict.fromkeys(MIX_CLIENTS, 0)
+        for part in item.split(","):
+            name, _, count = part.partition("=")
+            if name.strip() not in MIX_CLIENTS:
+                raise argparse.ArgumentTypeError(f"Unknown client: {name} (expected {list(MIX_CLIENTS)})")
+            mix[name.strip()] = int(count)
+        mixes.append(mix)
+    return mixes
+
+
+def mix_name(mix):
+    return ",".join(f"{name}={mix[name]}" for name in MIX_CLIENTS)
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"n": 0}
+    values = np.percentile(latencies, (50, 95, 99))
+    return {"n": len(latencies), "p50": round(float(values[0]), 2), "p95": round(float(values[1]), 2),
+            "p99": round(float(values[2]), 2), "max": round(max(latencies), 2)}
+
+
+async def metrics_poller(host, port, interval, stop, latencies, errors):
+    """Stand-in for dashboard.py / dashboard_gui.py polling /metrics."""
+    while not stop.is_set():
+        try:
+            latency_ms, status = await http_get(host, port, "/metrics")
+            if " 200 " in status:
+                latencies.append(latency_ms)
+            else:
+                errors["metrics"] += 1
+        except OSError:
+            errors["metrics"] += 1
+        await _sleep_unless(stop, interval)
+
+
+async def ota_client(host, port, models, interval, stop, latencies, errors, swaps):
+    """Operator pushing models: /update-model every `interval` s, cycling through `models`."""
+    while not stop.is_set():
+        await _sleep_unless(stop, interval)
+        if stop.is_set():
+            break
+        target = models[(swaps["count"] + 1) % len(models)]
+        try:
+            latency_ms, status, body = await http_request(
+                host, port, f"/update-model?model_path={target}", method="POST")
+            if " 200 " in status and json.loads(body).get("status") == "success":
+                latencies.append(latency_ms)
+                swaps["count"] += 1
+            else:
+                errors["update_model"] += 1
+        except (OSError, ValueError):
+            errors["update_model"] += 1
+
+
+async def server_monitor(host, port, server_pid, limits, interval, stop, samples):
+    """Device-side view once per `interval`: pipeline counters from /metrics, RSS, cgroup memory."""
+    while not stop.is_set():
+        sample = {"at": time.perf_counter(), "rss_mb": server_rss_mb(server_pid), **limits.memory()}
+        try:
+            _, status, body = await http_request(host, port, "/metrics")
+            if " 200 " in status:
+                snapshot = json.loads(body)
+                pipeline = snapshot.get("pipeline", {})
+                sample.update(fps=snapshot.get("fps"), dropped=pipeline.get("dropped_frames"),
+                              published=sum(s.get("frames_published", 0) for s in snapshot.get("stream", [])))
+        except (OSError, ValueError):
+            pass
+        samples.append(sample)
+        await _sleep_unless(stop, interval)
+
+
+async def _sleep_unless(stop, delay):
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def measure_mix(host, port, mix, duration, options, server_pid=None, limits=None):
+    limits = limits or ServerLimits(mode="none")
+    stop = asyncio.Event()
+    counters = {"bytes": 0, "frames": 0, "errors": 0}
+    latencies = {"metrics": [], "update_model": []}
+    errors = {"metrics": 0, "update_model": 0}
+    swaps = {"count": 0}
+    samples = []
+    marker = b"event: point" if options.stream_path.startswith("/metrics/stream") else b"--frame"
+    viewers = [asyncio.create_task(stream_viewer(host, port, options.stream_path, stop, counters, marker))
+               for _ in range(mix["viewers"])]
+    await asyncio.sleep(1.0)  # let viewers connect and reach steady state
+    counters["frames"] = counters["bytes"] = 0
+    cpu_start = server_cpu_seconds(server_pid)
+    start = time.perf_counter()
+    tasks = viewers + [asyncio.create_task(server_monitor(host, port, server_pid, limits,
+                                                          options.sample_interval, stop, samples))]
+    tasks += [asyncio.create_task(metrics_poller(host, port, options.poll_interval, stop,
+                                                 latencies["metrics"], errors))
+              for _ in range(mix["pollers"])]
+    tasks += [asyncio.create_task(ota_client(host, port, options.ota_models, options.ota_interval, stop,
+                                             latencies["update_model"], errors, swaps))
+              for _ in range(mix["ota"])]
+    await asyncio.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    frames, stream_bytes = counters["frames"], counters["bytes"]
+    cpu_end = server_cpu_seconds(server_pid)
+    await asyncio.wait(tasks[len(viewers):], timeout=60)  # an OTA swap may still be loading
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if swaps["count"] % len(options.ota_models):
+        # Back to the first model so that the next mix starts from the same state
+        await http_request(host, port, f"/update-model?model_path={options.ota_models[0]}", method="POST")
+
+    measured = [s for s in samples if s.get("fps") is not None]
+    fps = [s["fps"] for s in measured]
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    server = {
+        "fps": {"mean": round(float(np.mean(fps)), 2), "min": round(min(fps), 2)} if fps else None,
+        "frames_published": measured[-1]["published"] - measured[0]["published"] if measured else None,
+        "dropped_frames": measured[-1]["dropped"] - measured[0]["dropped"]
+        if measured and measured[0]["dropped"] is not None else None,
+        "cpu_ratio": round((cpu_end - cpu_start) / elapsed, 3)
+        if cpu_start is not None and cpu_end is not None else None,
+        "rss_mb": {"start": round(rss[0], 1), "peak": round(max(rss), 1), "end": round(rss[-1], 1)}
+        if rss else None,
+    }
+    cgroup = limits.memory()
+    if cgroup:
+        server["cgroup_memory"] = cgroup
+    if limits.memory_bytes and rss:
+        server["memory_limit_exceeded"] = max(rss) * 1e6 > limits.memory_bytes
+    return {
+        "mix": mix_name(mix),
+        "clients": dict(mix),
+        "duration_s": round(elapsed, 2),
+        "server": server,
+        "latency_ms": {name: latency_summary(values) for name, values in latencies.items()},
+        "stream": {
+            "fps_per_viewer": round(frames / elapsed / mix["viewers"], 2) if mix["viewers"] else None,
+            "mbps": round(stream_bytes * 8 / elapsed / 1e6, 2),
+        },
+        "ota_swaps": swaps["count"],
+        "errors": {**errors, "stream": counters["errors"]},
+    }
+
+
+async def run_mixes(host, port, mixes, duration, options, server_pid=None, limits=None):
+    await wait_until_ready(host, port)
+    await asyncio.sleep(options.settle)  # first frames, model warm-up
+    results = []
+    for mix in mixes:
+        result = await measure_mix(host, port, mix, duration, options, server_pid, limits)
+        server = result["server"]
+        print(f"{result['mix']}: server {server['fps']} FPS, dropped {server['dropped_frames']}, "
+              f"RSS {server['rss_mb']} MB, CPU {server['cpu_ratio']}, /metrics p99 "
+              f"{result['latency_ms']['metrics'].get('p99')} ms, /update-model p99 "
+              f"{result['latency_ms']['update_model'].get('p99')} ms ({result['ota_swaps']} swaps)")
+        results.append(result)
+    return results
+
+
+# --- Compare mode ---
+
+# (metric path, direction): +1 when higher is worse, -1 when lower is worse
+COMPARED_METRICS = (
+    ("server.fps.mean", -1),
+    ("server.dropped_frames", +1),
+    ("server.cpu_ratio", +1),
+    ("server.rss_mb.peak", +1),
+    ("latency_ms.metrics.p50", +1),
+    ("latency_ms.metrics.p99", +1),
+    ("latency_ms.update_model.p99", +1),
+    ("stream.fps_per_viewer", -1),
+    # Viewer-level reports (--levels)
+    ("metrics_p99_ms", +1),
+    ("stream_fps_per_viewer", -1),
+    ("server_cpu_ratio", +1),
+)
+
+
+def _metric(entry, path):
+    for key in path.split("."):
+        if not isinstance(entry, dict) or entry.get(key) is None:
+            return None
+        entry = entry[key]
+    return entry
+
+
+def _runs(report):
+    if "mixes" in report:
+        return {run["mix"]: run for run in report["mixes"]}
+    return {f"viewers={run['viewers']}": run for run in report.get("levels", [])}
+
+
+def compare_reports(baseline, current, threshold=0.10):
+    """Flag a regression when a metric moves the wrong way by more than `threshold`.
+
+    Counts (dropped frames) starting from 0 have no relative change: any
+    increase is flagged.
+    """
+    base_runs = _runs(baseline)
+    rows = []
+    for name, run in _runs(current).items():
+        base = base_runs.get(name)
+        if base is None:
+            continue
+        for path, direction in COMPARED_METRICS:
+            old, new = _metric(base, path), _metric(run, path)
+            if old is None or new is None:
+                continue
+            if old:
+                change = (new - old) / old
+                worse = change * direction > threshold
+            else:
+                change = None
+                worse = direction > 0 and new > 0 and path.endswith("dropped_frames")
+            rows.append({
+                "mix": name, "metric": path, "baseline": old, "current": new,
+                "change_pct": round(change * 100, 2) if change is not None else None,
+                "regression": bool(worse),
+            })
+    return {"threshold_pct": threshold * 100, "regressions": sum(r["regression"] for r in rows),
+            "comparisons": rows}
+
+
+def start_server(port, limits=None):
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+           "--port", str(port), "--log-level", "warning"]
+    preexec = limits.preexec if limits is not None and limits.mode != "none" else None
+    return subprocess.Popen(cmd, env=os.environ.copy(), preexec_fn=preexec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Edge API load test")
+    parser.add_argument("--output", type=str, default="results/loadtest.json")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8077)
+    parser.add_argument("--levels", type=str, default="0,1,5,10,25,50",
+                        help="Comma-separated numbers of concurrent /video_feed viewers")
+    parser.add_argument("--samples", type=int, default=100, help="/metrics requests per level")
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--stream-path", type=str, default="/video_feed",
+                        help="/video_feed (MJPEG viewers) or /metrics/stream?interval=1 (dashboards)")
+    parser.add_argument("--mix", type=parse_mixes, nargs="?", const=parse_mixes(DEFAULT_MIXES), default=None,
+                        help="Run traffic mixes instead of viewer levels, e.g. "
+                             f"'{DEFAULT_MIXES}' (the default when no value is given)")
+    parser.add_argument("--duration", type=float, default=30.0, help="With --mix: seconds per mix")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="With --mix: seconds between server ready and the first mix")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="With --mix: seconds between /metrics requests of one poller (dashboards: 1)")
+    parser.add_argument("--ota-interval", type=float, default=10.0,
+                        help="With --mix: seconds between /update-model requests of one OTA client")
+    parser.add_argument("--ota-models", type=str, default="model_float32,model_int8",
+                        help="With --mix: models the OTA clients cycle through (registry names)")
+    parser.add_argument("--sample-interval", type=float, default=1.0,
+                        help="With --mix: seconds between server FPS / RSS / dropped-frames samples")
+    parser.add_argument("--compose", type=str, default=COMPOSE_FILE,
+                        help="docker-compose file providing the default CPU / memory limits")
+    parser.add_argument("--cpus", type=float, default=None, help="CPU limit (overrides the compose file)")
+    parser.add_argument("--memory", type=parse_memory, default=None,
+                        help="Memory limit, e.g. 512M (overrides the compose file)")
+    parser.add_argument("--limit-mode", type=str, default="auto", choices=LIMIT_MODES,
+                        help="cgroup (quota + hard memory limit), taskset (core pinning only), "
+                             "auto (cgroup when writable) or none")
+    parser.add_argument("--no-server", action="store_true",
+                        help="Target an already running server instead of starting uvicorn")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Baseline JSON report to diff against; exits with 1 on regression")
+    parser.add_argument("--input", type=str, default=None,
+                        help="With --compare: existing report to compare instead of running")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Relative change (%%) tolerated before flagging a regression")
+    args = parser.parse_args()
+    args.ota_models = [m.strip() for m in args.ota_models.split(",") if m.strip()]
+
+    if args.input:
+        with open(args.input) as f:
+            report = json.load(f)
+    else:
+        compose_cpus, compose_memory = compose_limits(args.compose)
+        limits = ServerLimits(args.cpus if args.cpus is not None else compose_cpus,
+                              args.memory if args.memory is not None else compose_memory,
+                              "none" if args.no_server else args.limit_mode)
+        server = None
+        try:
+            if not args.no_server:
+                server = start_server(args.port, limits.prepare())
+            server_pid = server.pid if server is not None else None
+            if args.mix:
+                results = asyncio.run(run_mixes(args.host, args.port, args.mix, args.duration, args,
+                                                server_pid, limits))
+            else:
+                levels = [int(v) for v in args.levels.split(",") if v.strip()]
+                results = asyncio.run(run_loadtest(args.host, args.port, levels, args.samples,
+                                                   args.interval, args.stream_path, server_pid))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+            limits.cleanup()
+
+        meta = {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "limits": limits.describe(),
+            "env": {k: os.environ[k] for k in ENV_RECORDED if k in os.environ},
+            "timestamp": time.time(),
+        }
+        if args.mix:
+            report = {"meta": meta, "mixes": results}
+        else:
+            baseline = results[0]["metrics_p99_ms"] if results else None
+            worst = max((r["metrics_p99_ms"] or 0) for r in results) if results else None
+            report = {
+                "meta": meta,
+                "levels": results,
+                # Ratio of the worst /metrics p99 to the no-viewer p99: ~1 means flat
+                "p99_growth": round(worst / baseline, 2) if baseline else None,
+            }
+            cpu = [r["server_cpu_ratio"] for r in results if r["server_cpu_ratio"] is not None]
+            if cpu:
+                # Extra server CPU at the heaviest level compared to no viewer: ~0 means flat
+                report["server_cpu_growth"] = round(max(cpu) - cpu[0], 3)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline_report = json.load(f)
+        baseline_report = baseline_report.get("current", baseline_report)  # a previous --compare output
+        comparison = compare_reports(baseline_report, report, args.threshold / 100)
+        for row in comparison["comparisons"]:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            change = f"{row['change_pct']:+.1f}%" if row["change_pct"] is not None else "n/a"
+            print(f"{row['mix']:34s} {row['metric']:28s} {row['baseline']} -> {row['current']} ({change}) {flag}")
+        report = {"baseline": args.compare, "current": report, "comparison": comparison}
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+    if args.compare and report["comparison"]["regressions"]:
+        sys.exit(1)
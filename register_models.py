@@ -1,6 +1,8 @@
 import mlflow
 import os
 
+from app.registry import ModelRegistry
+
 # Configuration
 # On s'assure d'écrire dans le dossier mlruns à la racine
 mlflow.set_tracking_uri("file:./mlruns")
@@ -16,14 +18,37 @@ if not os.path.exists(model_int8) or not os.path.exists(model_float):
     print("❌ ERREUR : Les fichiers modèles sont introuvables dans le dossier 'models/'")
     exit()
 
+# Mesures réelles : le registre indexe models/ (empreinte, signature) puis
+# chronomètre chaque modèle ; l'index est aussi celui servi par GET /models
+registry = ModelRegistry("models", index_path="models/registry.json")
+registry.scan()
+print("⏱️ Mesure des modèles...")
+stats = {}
+for name, key in ((model_int8, "int8"), (model_float, "float32")):
+    registry.benchmark(name, iterations=100)
+    entry = stats[key] = registry.resolve(name)
+    print(f"   {entry['name']} : {entry['size_bytes'] / 1e6:.2f} Mo, "
+          f"p50 {entry['benchmark']['latency_ms']['p50']:.2f} ms")
+
 # On crée une NOUVELLE entrée propre
 with mlflow.start_run(run_name="Livrable_Final_Models"):
     
-    # 1. On logue les métriques (On remet les valeurs qu'on avait trouvées)
+    # 1. On logue les métriques mesurées (taille, latence, débit, mémoire)
     print("📝 Log des métriques...")
-    mlflow.log_metric("size_float32_mb", 11.68)
-    mlflow.log_metric("size_int8_mb", 4.07)
-    mlflow.log_metric("compression_ratio", 2.86)
+    for key, entry in stats.items():
+        benchmark = entry["benchmark"]
+        mlflow.log_param(f"sha256_{key}", entry["sha256"])
+        mlflow.log_metric(f"size_{key}_mb", round(entry["size_bytes"] / 1e6, 2))
+        mlflow.log_metric(f"latency_p50_{key}_ms", benchmark["latency_ms"]["p50"])
+        mlflow.log_metric(f"latency_p99_{key}_ms", benchmark["latency_ms"]["p99"])
+        mlflow.log_metric(f"fps_{key}", benchmark["fps"])
+        mlflow.log_metric(f"load_{key}_ms", benchmark["load_ms"])
+        mlflow.log_metric(f"memory_{key}_mb", benchmark["memory_mb"])
+    mlflow.log_metric("compression_ratio",
+                      round(stats["float32"]["size_bytes"] / stats["int8"]["size_bytes"], 2))
+    mlflow.log_metric("speedup_int8",
+                      round(stats["float32"]["benchmark"]["latency_ms"]["p50"]
+                            / stats["int8"]["benchmark"]["latency_ms"]["p50"], 2))
     
     # 2. On logue les fichiers (Artifacts)
     print("📦 Upload du modèle Int8...")
@@ -32,5 +57,8 @@ with mlflow.start_run(run_name="Livrable_Final_Models"):
     print("📦 Upload du modèle Float32...")
     mlflow.log_artifact(model_float, artifact_path="models_files")
 
+    print("📦 Upload de l'index du registre...")
+    mlflow.log_artifact("models/registry.json", artifact_path="models_files")
+
 print("✅ SUCCÈS ! Les modèles sont enregistrés.")
 print("Rafraîchissez votre page MLflow maintenant.")
\ No newline at end of file
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from app.broadcaster import MJPEGBroadcaster
+from app.inference import EdgeDetector
+from app.memory import MemoryPlan, rss_mb
+from app.multistream import MultiStreamEngine
+from app.pipeline import VisionPipeline
+from app.results import ResultRecord
+
+# Memory soak test: runs the real capture -> inference -> annotate -> MJPEG
+# pipeline in-process for a long time, with stand-in viewers pulling JPEG
+# chunks and every result encoded as for a WebSocket subscriber, and samples
+# RSS and tracemalloc. After the warm-up, memory must stay flat: the growth
+# between the first and the last quarter of the samples is checked against
+# limits (exit code 1 when exceeded). --budget-mb 0 runs the same load
+# without the memory-bounded mode, for comparison.
+
+
+def viewer(broadcaster, stop, fps, quality, counters):
+    """Stand-in /video_feed client: one JPEG chunk per new frame, at most `fps`."""
+    last_seq = 0
+    while not stop.is_set():
+        seq, chunk = broadcaster.next_chunk(last_seq, quality, timeout=0.5)
+        if chunk is None:
+            continue
+        last_seq = seq
+        counters["chunks"] += 1
+        stop.wait(1.0 / fps)
+
+
+def growth(samples, key):
+    """(median of the last quarter - median of the first quarter, slope per hour) of samples[key]."""
+    values = np.array([s[key] for s in samples], dtype=np.float64)
+    times = np.array([s["elapsed_s"] for s in samples], dtype=np.float64)
+    quarter = max(1, len(values) // 4)
+    delta = float(np.median(values[-quarter:]) - np.median(values[:quarter]))
+    slope = float(np.polyfit(times, values, 1)[0] * 3600) if len(values) > 1 else 0.0
+    return round(delta, 3), round(slope, 3)
+
+
+def run_soak(source, model_path, duration, warmup, interval, budget_mb, streams=1, viewers=3,
+             viewer_fps=15.0, trace=True, frame_size=(720, 1280)):
+    if trace:
+        tracemalloc.start()
+    sources = [source] * streams
+    plan = None
+    pools = [None] * streams
+    if budget_mb > 0:
+        plan = MemoryPlan(budget_mb, streams, (*frame_size, 3), multistream=streams > 1)
+        pools = plan.pools()
+    broadcasters = [MJPEGBroadcaster(pool) for pool in pools]
+    detector = EdgeDetector(model_path)
+    counters = {"chunks": 0, "records": 0, "record_bytes": 0}
+
+    def publish(frame, count, latency_ms, stream_id=0):
+        broadcasters[stream_id].publish(frame)
+
+    def emit_results(stream_id, frame_id, captured_at, frame_shape, detections):
+        record = ResultRecord(stream_id, frame_id, captured_at, frame_shape, detections)
+        counters["records"] += 1
+        counters["record_bytes"] += len(record.encode("json"))
+
+    if streams > 1:
+        pipeline = MultiStreamEngine(sources, lambda: detector, publish, emit_results=emit_results, pools=pools)
+    else:
+        pipeline = VisionPipeline(source, lambda: detector, publish, emit_results=emit_results,
+                                  queue_size=plan.queue_size if plan is not None else 1, pool=pools[0])
+    stop = threading.Event()
+    threads = [threading.Thread(target=viewer, args=(broadcasters[i % streams], stop, viewer_fps, 80, counters),
+                                name=f"viewer-{i}", daemon=True) for i in range(viewers)]
+    pipeline.start()
+    for thread in threads:
+        thread.start()
+
+    samples = []
+    start = time.perf_counter()
+    try:
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= warmup + duration:
+                break
+            stop.wait(interval)
+            elapsed = time.perf_counter() - start
+            sample = {"elapsed_s": round(elapsed, 1), "rss_mb": round(rss_mb(), 2),
+                      "frames": sum(b.snapshot()["frames_published"] for b in broadcasters),
+                      "chunks": counters["chunks"]}
+            if trace:
+                sample["traced_kb"] = round(tracemalloc.get_traced_memory()[0] / 1024, 1)
+            if plan is not None:
+                sample["pool_in_use"] = sum(pool.in_use for pool in pools)
+                sample["pool_allocations"] = sum(pool.allocations for pool in pools)
+            if elapsed >= warmup:
+                samples.append(sample)
+                print(f"t={elapsed:7.1f}s RSS {sample['rss_mb']:.1f} MB"
+                      + (f", traced {sample['traced_kb']:.0f} KB" if trace else "")
+                      + f", {sample['frames']} frames, {sample['chunks']} JPEG chunks")
+    finally:
+        stop.set()
+        pipeline.stop()
+        for broadcaster in broadcasters:
+            broadcaster.close()
+        for thread in threads:
+            thread.join(2.0)
+        detector.close()
+        if trace:
+            tracemalloc.stop()
+
+    report = {
+        "samples": samples,
+        "frames": samples[-1]["frames"] - samples[0]["frames"] if samples else 0,
+        "results_encoded": counters["records"],
+        "plan": plan.snapshot() if plan is not None else None,
+        "pools": [pool.snapshot() for pool in pools] if plan is not None else None,
+    }
+    if len(samples) >= 2:
+        report["rss_growth_mb"], report["rss_slope_mb_per_h"] = growth(samples, "rss_mb")
+        if trace:
+            report["traced_growth_kb"], report["traced_slope_kb_per_h"] = growth(samples, "traced_kb")
+    return report
+
+
+def check_flat(report, max_rss_growth_mb, max_traced_growth_kb):
+    """Failed checks (empty list = memory stayed flat)."""
+    failures = []
+    if report.get("rss_growth_mb") is None:
+        return ["not enough samples after the warm-up"]
+    if report["rss_growth_mb"] > max_rss_growth_mb:
+        failures.append(f"RSS grew by {report['rss_growth_mb']} MB (limit {max_rss_growth_mb} MB)")
+    traced = report.get("traced_growth_kb")
+    if traced is not None and traced > max_traced_growth_kb:
+        failures.append(f"traced Python memory grew by {traced} KB (limit {max_traced_growth_kb} KB)")
+    for pool in report.get("pools") or []:
+        if pool["allocations"] > pool["slots"]:
+            failures.append(f"{pool['name']}: {pool['allocations']} frame allocations for {pool['slots']} slots")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Edge pipeline memory soak test")
+    parser.add_argument("--output", type=str, default="results/soak.json")
+    parser.add_argument("--source", type=str, default="data/video_test.mp4")
+    parser.add_argument("--model", type=str, default="models/model_int8.tflite")
+    parser.add_argument("--duration", type=float, default=1800.0, help="Measured seconds, after the warm-up")
+    parser.add_argument("--warmup", type=float, default=60.0,
+                        help="Seconds excluded from the checks (allocator, caches and pools filling up)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between memory samples")
+    parser.add_argument("--budget-mb", type=float, default=128.0,
+                        help="MEMORY_BUDGET_MB of the memory-bounded mode (0 = default mode)")
+    parser.add_argument("--frame-size", type=str, default="720x1280",
+                        help="Largest expected frame (HxW), as MEMORY_FRAME_SIZE")
+    parser.add_argument("--streams", type=int, default=1, help="Copies of the source (multistream engine if > 1)")
+    parser.add_argument("--viewers", type=int, default=3, help="Stand-in MJPEG clients")
+    parser.add_argument("--viewer-fps", type=float, default=15.0)
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="RSS only (tracemalloc slows every allocation down)")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=4.0)
+    parser.add_argument("--max-traced-growth-kb", type=float, default=256.0)
+    args = parser.parse_args()
+
+    height, width = (int(v) for v in args.frame_size.lower().split("x"))
+    report = run_soak(args.source, args.model, args.duration, args.warmup, args.interval, args.budget_mb,
+                      streams=args.streams, viewers=args.viewers, viewer_fps=args.viewer_fps,
+                      trace=not args.no_tracemalloc, frame_size=(height, width))
+    failures = check_flat(report, args.max_rss_growth_mb, args.max_traced_growth_kb)
+    report["meta"] = {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "source": args.source,
+        "model": args.model,
+        "budget_mb": args.budget_mb,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "limits": {"rss_growth_mb": args.max_rss_growth_mb, "traced_growth_kb": args.max_traced_growth_kb},
+        "timestamp": time.time(),
+    }
+    report["failures"] = failures
+    print(f"RSS growth {report.get('rss_growth_mb')} MB ({report.get('rss_slope_mb_per_h')} MB/h), "
+          f"traced growth {report.get('traced_growth_kb')} KB, {report['frames']} frames")
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("PASS: memory stayed flat")
@@ -14,4 +14,176 @@ img = cv2.imread(img_path)
 boxes, classes, scores, t_infer = detector.predict(img)
 
 print(f"✅ Inférence réussie en {t_infer:.2f} ms")
-print(f"Objets détectés (Score > 50%): {len([s for s in scores if s > 0.5])}")
\ No newline at end of file
+print(f"Objets détectés (Score > 50%): {len(detector.detect(img).filter(0.5))}")
+
+# 4. Parité du chemin zéro-copie avec l'ancien chemin
+#    (resize -> expand_dims -> astype -> set_tensor -> get_tensor)
+import tracemalloc
+import numpy as np
+
+def reference_predict(det, image):
+    """Ancien chemin, avec la quantification écrite en calcul flottant :
+    q = round(x / scale) + zero_point en entrée, (q - zero_point) * scale en sortie."""
+    img_resized = cv2.resize(image, (det.input_width, det.input_height))
+    detail = det.input_details[0]
+    input_data = np.expand_dims(img_resized, axis=0).astype(np.float32) / 255.0
+    if det.is_quantized:
+        scale, zero_point = detail['quantization']
+        info = np.iinfo(detail['dtype'])
+        input_data = np.clip(np.round(input_data / scale) + zero_point, info.min, info.max)
+    det.interpreter.set_tensor(detail['index'], input_data.astype(detail['dtype']))
+    det.interpreter.invoke()
+
+    def output(idx, default_scale=1 / 255.0):
+        out = det.output_details[idx]
+        raw = det.interpreter.get_tensor(out['index'])
+        if raw.dtype == np.float32:
+            return raw.astype(np.float32)
+        scale, zero_point = out['quantization']
+        if not scale:
+            scale, zero_point = default_scale, 0
+        return ((raw.astype(np.float64) - zero_point) * scale).astype(np.float32)
+
+    boxes, scores = output(det.boxes_idx), output(det.scores_idx)
+    classes = np.rint(output(det.classes_idx, 1.0)) if det.is_quantized else output(det.classes_idx)
+    return np.clip(np.squeeze(boxes), 0, 1), classes.flatten(), scores.flatten()
+
+def transient_bytes(fn, frames=50):
+    """Pic d'allocation par appel en régime permanent (tracemalloc)"""
+    for _ in range(5):
+        fn()
+    tracemalloc.start()
+    peaks = []
+    for _ in range(frames):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        del result
+    tracemalloc.stop()
+    return max(peaks)
+
+MODELS = ["models/model_int8.tflite", "models/model_sint8.tflite", "models/model_float32.tflite"]
+for model_path in MODELS:
+    if not os.path.exists(model_path):
+        continue
+    det = EdgeDetector(model_path)
+    for name in image_files[:5]:
+        frame = cv2.imread(os.path.join("data/calibration", name))
+        ref = reference_predict(det, frame)
+        new = det.predict(frame)[:3]
+        for expected, got in zip(ref, new):
+            assert np.array_equal(expected, got), f"Résultats différents pour {model_path} / {name}"
+
+    # 5. Compteur d'allocations : seul le petit résultat (boxes/classes/scores)
+    #    doit être alloué, rien qui dépende de la taille de l'image ou du tenseur
+    input_bytes = det.input_height * det.input_width * 3 * det.input_details[0]['dtype']().itemsize
+    zero_copy = transient_bytes(lambda: det.predict(img))
+    legacy = transient_bytes(lambda: reference_predict(det, img))
+    print(f"{os.path.basename(model_path)} : parité OK | octets alloués/image : "
+          f"{zero_copy} (zéro-copie) vs {legacy} (ancien chemin), tenseur d'entrée {input_bytes}")
+    assert zero_copy < input_bytes // 10, "Le chemin zéro-copie alloue encore des buffers image"
+
+    # 6. Seuil appliqué à la lecture des sorties (domaine entier si quantifié) :
+    #    même résultat que le filtre après coup, au bit près
+    for threshold in (0.0, 0.1, 0.25, 0.5, 0.9):
+        early = det.detect(img, threshold)
+        late = det.detect(img).filter(threshold)
+        for expected, got in zip((late.boxes, late.classes, late.scores), (early.boxes, early.classes, early.scores)):
+            assert np.array_equal(expected, got), f"Seuil {threshold} : résultats différents pour {model_path}"
+    det.close()
+
+# 7. Précision des modèles quantifiés face au modèle float32 (mêmes images)
+FLOAT_MODEL = "models/model_float32.tflite"
+if os.path.exists(FLOAT_MODEL):
+    reference = EdgeDetector(FLOAT_MODEL)
+    float_results = [reference.predict(cv2.imread(os.path.join("data/calibration", name)))[:3]
+                     for name in image_files[:20]]
+    reference.close()
+    for model_path in MODELS[:2]:
+        if not os.path.exists(model_path):
+            continue
+        det = EdgeDetector(model_path)
+        box_error = score_error = 0.0
+        class_mismatch = kept = 0
+        for name, (f_boxes, f_classes, f_scores) in zip(image_files[:20], float_results):
+            boxes, classes, scores = det.predict(cv2.imread(os.path.join("data/calibration", name)))[:3]
+            box_error = max(box_error, float(np.abs(boxes - f_boxes).max()))
+            score_error = max(score_error, float(np.abs(scores - f_scores).max()))
+            # Classes comparées sur les détections gardées par le seuil par défaut (0.10) :
+            # sous ce seuil, un n° de classe flottant proche de x.5 peut basculer d'une unité
+            confident = f_scores >= 0.1
+            class_mismatch += int((classes[confident] != np.rint(f_classes[confident])).sum())
+            kept += int(confident.sum())
+        det.close()
+        print(f"{os.path.basename(model_path)} vs float32 : écart max boîtes {box_error:.4f}, "
+              f"scores {score_error:.4f}, classes différentes {class_mismatch}/{kept}")
+        assert box_error < 0.05 and score_error < 0.05, f"{model_path} trop loin du modèle float32"
+        assert class_mismatch == 0, f"{model_path} : classes différentes du modèle float32"
+
+# 8. Cache de détections et variantes @HxW : basculer de model_int8 vers
+#    model_int8@64x64 (politique automatique) doit vider le cache
+from app.cache import DetectionCache
+from app.ota import ModelManager
+from app.registry import ModelRegistry
+
+registry = ModelRegistry("models")
+models = ModelManager(registry.detector, release_detector=registry.release)
+models.load("model_int8")
+cache = DetectionCache(capacity=8)
+cache.detect(models.active, img, score_threshold=0.1)
+cache.detect(models.active, img, score_threshold=0.1)
+assert cache.hits == 1, "Même image, même modèle : le cache doit servir la deuxième détection"
+models.swap("model_int8", input_size=(64, 64))
+assert models.active.model_id != models.previous.model_id, "model_int8 et model_int8@64x64 confondus"
+cache.detect(models.active, img, score_threshold=0.1)
+assert cache.hits == 1 and cache.invalidations == 1, "Cache non vidé après la bascule vers model_int8@64x64"
+print(f"✅ Cache vidé à la bascule {models.previous.model_id} -> {models.active.model_id}")
+models.close()
+registry.close()
+
+# 9. INFERENCE_WORKERS : une image invalide ne doit pas bloquer d'emplacement
+#    de mémoire partagée (sinon plus aucune inférence possible ensuite).
+#    Garde __main__ : les processus (spawn) réimportent ce script
+if __name__ == "__main__":
+    from app.workers import ProcessDetector
+
+    workers = ProcessDetector("models/model_int8.tflite", workers=1, request_timeout=3)
+    try:
+        for _ in range(3):  # plus que `depth` emplacements
+            try:
+                workers.predict(np.zeros((0, 0, 3), dtype=np.uint8))
+                raise AssertionError("Image vide acceptée par ProcessDetector")
+            except cv2.error:
+                pass
+        assert sum(len(w.in_flight) for w in workers._workers) == 0, "Emplacements perdus après une image invalide"
+        reference = EdgeDetector("models/model_int8.tflite")
+        expected, got = reference.predict(img)[:3], workers.predict(img)[:3]
+        reference.close()
+        assert all(np.array_equal(a, b) for a, b in zip(expected, got)), "ProcessDetector != EdgeDetector"
+        print("✅ ProcessDetector : image invalide rejetée, image suivante traitée")
+
+        # Processus vivant mais bloqué (SIGSTOP) : remplacé après request_timeout
+        import signal
+        import time
+        from concurrent.futures import TimeoutError as FutureTimeout
+        stuck = workers._workers[0]
+        os.kill(stuck.process.pid, signal.SIGSTOP)
+        try:
+            workers.predict(img)
+            raise AssertionError("Réponse d'un processus bloqué")
+        except (TimeoutError, FutureTimeout):
+            pass
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                got = workers.predict(img)[:3]
+                break
+            except (TimeoutError, FutureTimeout, RuntimeError):
+                time.sleep(0.5)
+        else:
+            raise AssertionError("Processus bloqué jamais remplacé")
+        assert stuck.hung == 1 and all(np.array_equal(a, b) for a, b in zip(expected, got))
+        print(f"✅ ProcessDetector : processus bloqué remplacé ({workers.snapshot()['restarts']} redémarrage)")
+    finally:
+        workers.close()